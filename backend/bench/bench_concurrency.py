@@ -0,0 +1,159 @@
+"""
+Load test: how many slow completions one server process holds at once.
+Starts the app in a subprocess per serving mode, with model calls replaced by
+fakes that take --llm-latency-ms, fires --concurrency simultaneous
+/api/v1/completion requests, and reports how many finished, latency
+percentiles and the effective number of requests served in parallel.
+
+Modes:
+    sync       one request at a time (like a gunicorn sync worker)
+    threading  one OS thread per request
+    eventlet   green threads with monkey-patched I/O (gunicorn -k eventlet)
+
+Usage (from backend/):
+    python -m bench.bench_concurrency [--modes sync threading eventlet]
+        [--concurrency 200] [--llm-latency-ms 5000] [--timeout 120]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+# gunicorn's default listen backlog
+GUNICORN_BACKLOG = 2048
+
+
+def serve(mode, port, llm_latency_ms):
+    """Run the app with fake upstreams; called in the server subprocess."""
+    os.environ["SOCKETIO_ASYNC_MODE"] = "threading" if mode == "sync" else mode
+    # Patch before the bench helpers import flask, as src.app would
+    from src import concurrency
+    concurrency.monkey_patch()
+
+    from bench.bench_endpoints import create_app
+    from bench.fakes import ModelTiming, install_fakes
+
+    app = create_app()
+    # All latency up front, like a non-streamed generation
+    install_fakes(app, ModelTiming(latency_ms=llm_latency_ms, token_rate=0, response_tokens=50))
+
+    if mode == "sync":
+        from werkzeug.serving import run_simple
+        run_simple("127.0.0.1", port, app, threaded=False, use_reloader=False)
+    elif mode == "threading":
+        from src.app import socketio
+        socketio.run(app, host="127.0.0.1", port=port, log_output=False, allow_unsafe_werkzeug=True)
+    else:
+        # socketio.run listens with a backlog of 50, which resets connections in a burst;
+        # serve with gunicorn's default backlog, as in production
+        import eventlet
+        import eventlet.wsgi
+        eventlet.wsgi.server(eventlet.listen(("127.0.0.1", port), backlog=GUNICORN_BACKLOG), app, log_output=False)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_listening(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def load(port, concurrency, timeout):
+    """Send `concurrency` completions at once; returns (latencies_ms, failures, wall_seconds)."""
+    body = json.dumps({
+        "model": "qwen3_8b",
+        "prompt": "",
+        "nodeId": "load",
+        "parentNodes": [],
+    })
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency)
+
+    def request(index):
+        # Distinct prompts, so identical requests aren't coalesced
+        payload = body.replace('"prompt": ""', f'"prompt": "load {index}"')
+        start_barrier.wait()
+        start = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            connection.request("POST", "/api/v1/completion", payload, {"Content-Type": "application/json"})
+            status = connection.getresponse().status
+            connection.close()
+        except Exception as e:
+            status = type(e).__name__
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            if status == 200:
+                latencies.append(elapsed_ms)
+            else:
+                failures.append(status)
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=request, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "threading", "eventlet"], default=["sync", "threading", "eventlet"])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=5000)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request client timeout, seconds")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.llm_latency_ms)
+        return
+
+    from bench.bench_endpoints import percentile
+
+    print(f"{args.concurrency} concurrent completions, {args.llm_latency_ms:.0f} ms model latency")
+    print(f"{'mode':<10} {'ok':>5} {'failed':>6} {'p50 ms':>9} {'p99 ms':>9} {'wall s':>7} {'parallel':>9}")
+    for mode in args.modes:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "bench.bench_concurrency", "--serve", mode, "--port", str(port),
+             "--llm-latency-ms", str(args.llm_latency_ms)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_listening(port)
+            latencies, failures, wall_seconds = load(port, args.concurrency, args.timeout)
+        finally:
+            server.terminate()
+            server.wait()
+
+        # Requests in flight on average: total model time served / wall time
+        parallel = len(latencies) * args.llm_latency_ms / 1000 / wall_seconds if wall_seconds else 0
+        p50 = percentile(latencies, 0.50) if latencies else float("nan")
+        p99 = percentile(latencies, 0.99) if latencies else float("nan")
+        print(f"{mode:<10} {len(latencies):>5} {len(failures):>6} {p50:>9.0f} {p99:>9.0f} {wall_seconds:>7.1f} {parallel:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
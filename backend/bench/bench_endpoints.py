@@ -0,0 +1,284 @@
+"""
+Offline end-to-end benchmark of the API and datastore routes.
+Drives the Flask app through its test client with Together, Gemini, Firestore
+and GCS replaced by local fakes (see bench/fakes.py), across canvas sizes and
+parent fan-outs, and reports p50/p95/p99 latency, throughput and peak RSS.
+
+With --baseline, fails if any scenario's p95 or throughput regresses by more
+than --tolerance against a stored run (written with --save-baseline).
+
+Usage (from backend/):
+    python -m bench.bench_endpoints [--requests 50] [--concurrency 4]
+        [--sizes 10 100 1000] [--fanouts 1 4 16] [--scenarios completion prompt ...]
+        [--llm-latency-ms 50] [--token-rate 500] [--image-latency-ms 500]
+        [--firestore fake|emulator] [--save-baseline bench/baseline.json]
+        [--baseline bench/baseline.json] [--tolerance 0.2]
+"""
+# Patch before anything else imports threading or sockets, as src.app would
+from src import concurrency
+concurrency.monkey_patch()
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+
+from bench.bench_json import make_canvas
+from bench.fakes import ModelTiming, install_fakes, make_video_data_url
+
+
+def create_app():
+    # src.app reads these at import time; no client is created until first use
+    os.environ.setdefault("CORS_ORIGIN", "http://localhost:3000")
+    os.environ.setdefault("GCP_PROJECT", "endpoint-bench")
+    os.environ.setdefault("FLASK_ENV", "bench")
+    from src.app import app
+    return app
+
+
+def canvas_nodes(size, seed=0):
+    nodes = make_canvas(size, seed=seed)["nodes"]
+    for node in nodes:
+        # Keep media out of canvas scenarios; they measure document handling
+        node["type"] = "llmText"
+    return nodes
+
+
+def parent_nodes(fanout, video=False):
+    nodes = [
+        {
+            "id": f"parent-{index}",
+            "type": "llmText",
+            "data": {"prompt_response": f"Parent {index} says: " + "Lorem ipsum dolor sit amet. " * 30},
+        }
+        for index in range(fanout)
+    ]
+    if video:
+        nodes.append({"id": "parent-video", "type": "videoNode", "data": {"videoDataUrl": make_video_data_url()}})
+    return nodes
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(app, make_request, requests, concurrency):
+    """
+    Call make_request(client, index) `requests` times from `concurrency` threads.
+    Returns latency percentiles (ms), throughput (req/s), error count and peak RSS.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            response = make_request(client, index)
+            # Consume streamed bodies so they are part of the measurement
+            response.get_data()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started_at
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def completion_scenario(model, fanout, video=False, stream=False):
+    parents = parent_nodes(fanout, video=video)
+    path = "/api/v1/completion/stream" if stream else "/api/v1/completion"
+
+    def make_request(client, index):
+        # A unique prompt per request, so completions are not coalesced
+        return client.post(path, json={
+            "model": model,
+            "prompt": f"Question {index}: what connects these ideas?",
+            "nodeId": f"bench-node-{index}",
+            "parentNodes": parents,
+        })
+    return make_request
+
+
+def prompt_scenario(fanout):
+    parents = parent_nodes(fanout)
+
+    def make_request(client, index):
+        # Distinct context per request, so suggestions are not served from cache
+        context = [dict(node, data={"prompt_response": f"{index} {node['data']['prompt_response']}"}) for node in parents]
+        return client.post("/api/v1/prompt", json={"parentNodes": context, "model": "qwen3_8b"})
+    return make_request
+
+
+def canvas_save_scenario(size):
+    nodes = canvas_nodes(size)
+
+    def make_request(client, index):
+        return client.post("/ds/v1/canvases", json={"canvasId": f"bench-save-{size}-{index}", "title": "Bench", "nodes": nodes})
+    return make_request
+
+
+def canvas_get_scenario(app, size):
+    canvas_id = f"bench-get-{size}"
+    app.test_client().post("/ds/v1/canvases", json={"canvasId": canvas_id, "title": "Bench", "nodes": canvas_nodes(size)})
+
+    def make_request(client, index):
+        return client.get(f"/ds/v1/canvases/{canvas_id}")
+    return make_request
+
+
+def canvas_patch_scenario(app, size):
+    canvas_id = f"bench-patch-{size}"
+    nodes = canvas_nodes(size)
+    app.test_client().post("/ds/v1/canvases", json={"canvasId": canvas_id, "title": "Bench", "nodes": nodes})
+    version = {"value": 1}
+    lock = threading.Lock()
+
+    def make_request(client, index):
+        node = dict(nodes[index % len(nodes)], position={"x": index, "y": index})
+        with lock:
+            response = client.patch(f"/ds/v1/canvases/{canvas_id}", json={"baseVersion": version["value"], "changed": [node]})
+            if response.status_code == 200:
+                version["value"] = response.get_json()["version"]
+        return response
+    return make_request
+
+
+def build_scenarios(app, args):
+    """Return {scenario_name: make_request} for the selected scenarios."""
+    scenarios = {}
+    selected = set(args.scenarios)
+    for fanout in args.fanouts:
+        if "completion" in selected:
+            scenarios[f"completion/fanout={fanout}"] = completion_scenario("qwen3_8b", fanout)
+        if "completion_stream" in selected:
+            scenarios[f"completion_stream/fanout={fanout}"] = completion_scenario("qwen3_8b", fanout, stream=True)
+        if "completion_video" in selected:
+            scenarios[f"completion_video/fanout={fanout}"] = completion_scenario("qwen3_8b", fanout, video=True)
+        if "completion_image" in selected:
+            scenarios[f"completion_image/fanout={fanout}"] = completion_scenario("google/flash-image-2.5", fanout)
+        if "prompt" in selected:
+            scenarios[f"prompt/fanout={fanout}"] = prompt_scenario(fanout)
+    for size in args.sizes:
+        if "canvas_save" in selected:
+            scenarios[f"canvas_save/nodes={size}"] = canvas_save_scenario(size)
+        if "canvas_get" in selected:
+            scenarios[f"canvas_get/nodes={size}"] = canvas_get_scenario(app, size)
+        if "canvas_patch" in selected:
+            scenarios[f"canvas_patch/nodes={size}"] = canvas_patch_scenario(app, size)
+    return scenarios
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages for scenarios present in both runs."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+SCENARIOS = ["completion", "completion_stream", "completion_video", "completion_image", "prompt", "canvas_save", "canvas_get", "canvas_patch"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--fanouts", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--token-rate", type=float, default=500, help="fake model tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--image-latency-ms", type=float, default=500)
+    parser.add_argument("--firestore", choices=["fake", "emulator"], default="fake",
+                        help="emulator uses the real client; set FIRESTORE_EMULATOR_HOST")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="write this run's results as JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional regression")
+    args = parser.parse_args()
+
+    if args.firestore == "emulator" and not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        parser.error("--firestore emulator requires FIRESTORE_EMULATOR_HOST")
+
+    app = create_app()
+    timing = ModelTiming(args.llm_latency_ms, args.token_rate, args.response_tokens)
+    install_fakes(app, timing, image_latency_ms=args.image_latency_ms, fake_firestore=args.firestore == "fake")
+
+    results = {}
+    print(f"{'scenario':<32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>6} {'rss MB':>8}")
+    for name, make_request in build_scenarios(app, args).items():
+        result = run_scenario(app, make_request, args.requests, args.concurrency)
+        results[name] = result
+        print(
+            f"{name:<32} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+            f"{result['throughput_rps']:>8.1f} {result['errors']:>6} {result['peak_rss_mb']:>8.1f}"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved results to {args.save_baseline}")
+
+    failed = any(result["errors"] for result in results.values())
+    if failed:
+        print("FAIL: some requests returned errors")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            print(f"FAIL: {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure how long `import src.app` takes using `python -X importtime` and fail
+if it exceeds a budget, so cold-start regressions are caught before deploy.
+
+Usage (from backend/):
+    python -m bench.bench_import_time [--budget-ms 1500] [--runs 3] [--top 15]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module):
+    """Return {module_name: cumulative_us} for a fresh interpreter importing module."""
+    env = dict(os.environ)
+    # src.app reads these at import time; no client is created until first use
+    env.setdefault("CORS_ORIGIN", "http://localhost:3000")
+    env.setdefault("GCP_PROJECT", "import-time-bench")
+    env.setdefault("FLASK_ENV", "bench")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="src.app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    # Use the fastest run; the others mostly measure disk cache noise
+    best = min(runs, key=lambda timings: timings[args.module])
+    total_ms = best[args.module] / 1000
+
+    print(f"Heaviest imports (cumulative) for {args.module}:")
+    heaviest = sorted(best.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for name, cumulative_us in heaviest:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  {name}")
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if total_ms > args.budget_ms:
+        print("FAIL: import time is over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare JSON parse/serialize cost of the stdlib Flask provider and the
+orjson-backed FastJSONProvider on synthetic canvases.
+
+Usage (from backend/):
+    python -m bench.bench_json [--sizes 100 1000 10000] [--repeat 20]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from src.json_provider import FastJSONProvider, iter_json_document
+
+
+def make_canvas(node_count, seed=0):
+    rng = random.Random(seed)
+    nodes = []
+    for index in range(node_count):
+        nodes.append({
+            "id": f"node-{index}",
+            "type": rng.choice(["llmText", "imageNode", "videoNode"]),
+            "position": {"x": rng.uniform(-5000, 5000), "y": rng.uniform(-5000, 5000)},
+            "data": {
+                "model": "qwen3_8b",
+                "prompt": "What happens next? " * rng.randint(1, 4),
+                "prompt_response": "Lorem ipsum dolor sit amet. " * rng.randint(5, 40),
+                "parent_ids": [f"node-{rng.randrange(max(index, 1))}"],
+            },
+            "selected": False,
+            "measured": {"width": 650, "height": 700},
+            "origin": [0, 0],
+        })
+    return {
+        "canvas_id": "bench",
+        "title": "Benchmark canvas",
+        "description": None,
+        "nodes": nodes,
+        "created_by": None,
+        "created_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc),
+        "version": 1,
+    }
+
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {"stdlib": DefaultJSONProvider(app), "fast": FastJSONProvider(app)}
+
+    print(f"{'nodes':>7} {'op':<10} {'stdlib ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        document = make_canvas(size)
+        body = {"document": document}
+        encoded = providers["fast"].dumps(body)
+
+        results = {
+            "serialize": {name: time_ms(lambda p=p: p.dumps(body), args.repeat) for name, p in providers.items()},
+            "parse": {name: time_ms(lambda p=p: p.loads(encoded), args.repeat) for name, p in providers.items()},
+        }
+        results["stream"] = {
+            "stdlib": results["serialize"]["stdlib"],
+            "fast": time_ms(lambda: b"".join(iter_json_document("document", document, "nodes")), args.repeat),
+        }
+        for op, timings in results.items():
+            speedup = timings["stdlib"] / timings["fast"] if timings["fast"] else float("inf")
+            print(f"{size:>7} {op:<10} {timings['stdlib']:>10.2f} {timings['fast']:>10.2f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
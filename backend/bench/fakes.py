@@ -0,0 +1,375 @@
+"""
+In-process stand-ins for the external services the backend calls, for
+benchmarks: Together chat and image models, the Gemini client, Firestore and
+GCS. Model fakes sleep for a configurable latency plus a per-token time so
+request timings have a realistic shape without network calls.
+
+install_fakes(app, ...) swaps them into a backend app; Firestore can instead
+be the emulator (leave the app's client alone and set FIRESTORE_EMULATOR_HOST).
+"""
+import base64
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+# A 1x1 PNG, returned by the fake image model
+PIXEL_PNG_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+
+
+class ModelTiming:
+    """Latency model shared by the fakes: a fixed first-token latency, then tokens at token_rate per second."""
+
+    def __init__(self, latency_ms=50, token_rate=500, response_tokens=150):
+        self.latency = latency_ms / 1000
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+
+    def tokens(self):
+        return ["lorem" if index % 2 else " ipsum" for index in range(self.response_tokens)]
+
+    def token_delay(self):
+        return 1 / self.token_rate if self.token_rate else 0
+
+
+class FakeChatModel:
+    """ChatTogether stand-in supporting invoke() and stream()."""
+
+    def __init__(self, timing):
+        self.timing = timing
+
+    def invoke(self, messages):
+        time.sleep(self.timing.latency + self.timing.response_tokens * self.timing.token_delay())
+        return SimpleNamespace(content="".join(self.timing.tokens()))
+
+    def stream(self, messages):
+        time.sleep(self.timing.latency)
+        for token in self.timing.tokens():
+            time.sleep(self.timing.token_delay())
+            yield SimpleNamespace(content=token)
+
+
+class FakeTogether:
+    """Together client stand-in; only images.generate is used."""
+
+    def __init__(self, timing, image_latency_ms=500):
+        self.timing = timing
+        self.images = SimpleNamespace(generate=self._generate_image)
+        self.image_latency = image_latency_ms / 1000
+
+    def _generate_image(self, model, prompt, response_format="base64", **kwargs):
+        time.sleep(self.image_latency)
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=PIXEL_PNG_B64)])
+
+
+class FakeGemini:
+    """google.genai Client stand-in: models.generate_content(_stream) and caches.create."""
+
+    def __init__(self, timing):
+        self.timing = timing
+        self.models = SimpleNamespace(
+            generate_content=self._generate_content,
+            generate_content_stream=self._generate_content_stream,
+        )
+        self.caches = SimpleNamespace(create=self._create_cache)
+        self._cache_count = 0
+        self._lock = threading.Lock()
+
+    def _generate_content(self, model, contents, config=None):
+        time.sleep(self.timing.latency + self.timing.response_tokens * self.timing.token_delay())
+        return SimpleNamespace(text="".join(self.timing.tokens()))
+
+    def _generate_content_stream(self, model, contents, config=None):
+        time.sleep(self.timing.latency)
+        for token in self.timing.tokens():
+            time.sleep(self.timing.token_delay())
+            yield SimpleNamespace(text=token)
+
+    def _create_cache(self, model, config=None):
+        time.sleep(self.timing.latency)
+        with self._lock:
+            self._cache_count += 1
+            return SimpleNamespace(name=f"cachedContents/fake-{self._cache_count}")
+
+
+class _Snapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+        self.id = reference.id
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class _WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+def _split_field_path(path):
+    from google.cloud.firestore_v1.field_path import split_field_path
+    return split_field_path(path)
+
+
+def _apply_update(document, updates):
+    """Apply a Firestore update() mapping (field paths, DELETE_FIELD, Increment) to a dict."""
+    from google.cloud.firestore_v1.transforms import Increment, Sentinel
+
+    for path, value in updates.items():
+        parts = _split_field_path(path)
+        parent = document
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        if isinstance(value, Sentinel):
+            parent.pop(parts[-1], None)
+        elif isinstance(value, Increment):
+            parent[parts[-1]] = parent.get(parts[-1], 0) + value.value
+        else:
+            parent[parts[-1]] = copy.deepcopy(value)
+
+
+def _project(document, field_paths):
+    projected = {}
+    for path in field_paths:
+        parts = _split_field_path(path)
+        source, target = document, projected
+        for part in parts[:-1]:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = copy.deepcopy(source[parts[-1]])
+    return projected
+
+
+class FakeDocumentReference:
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self.collection_name = collection
+        self.id = doc_id
+        self.key = (collection, doc_id)
+
+    def get(self, field_paths=None, transaction=None):
+        with self._db.lock:
+            data, update_time = self._db.documents.get(self.key, (None, None))
+            if data is not None and field_paths is not None:
+                data = _project(data, field_paths)
+            return _Snapshot(self, copy.deepcopy(data), update_time)
+
+    def set(self, document):
+        with self._db.lock:
+            self._db.write(self.key, copy.deepcopy(document))
+
+    def update(self, updates, option=None):
+        with self._db.lock:
+            self._db.check_update(self.key, option)
+            document = copy.deepcopy(self._db.documents[self.key][0])
+            _apply_update(document, updates)
+            self._db.write(self.key, document)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self._db = db
+        self.name = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._db, self.name, doc_id or self._db.new_id())
+
+    def add(self, document):
+        reference = self.document()
+        reference.set(document)
+        return reference, reference
+
+
+class FakeTransaction:
+    """Stages writes and applies them atomically at commit, like a Firestore transaction."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, document):
+        self._writes.append(("set", reference, copy.deepcopy(document), None))
+
+    def update(self, reference, updates, option=None):
+        self._writes.append(("update", reference, updates, option))
+
+    def commit(self):
+        with self._db.lock:
+            staged = {}
+            for kind, reference, value, option in self._writes:
+                if kind == "set":
+                    staged[reference.key] = value
+                    continue
+                if reference.key not in staged:
+                    self._db.check_update(reference.key, option)
+                    staged[reference.key] = copy.deepcopy(self._db.documents[reference.key][0])
+                _apply_update(staged[reference.key], value)
+            for key, document in staged.items():
+                self._db.write(key, document)
+
+
+def fake_transactional(fn):
+    """firestore.transactional stand-in: run fn once with the transaction, then commit it."""
+    def run(transaction, *args, **kwargs):
+        # Hold the lock across read and commit, so the transaction sees no concurrent writes
+        with transaction._db.lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    """In-memory firestore.Client stand-in covering what src/db/firestore.py uses."""
+
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.RLock()
+        self._next_id = 0
+
+    def new_id(self):
+        with self.lock:
+            self._next_id += 1
+            return f"doc-{self._next_id}"
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def write_option(self, last_update_time=None):
+        return _WriteOption(last_update_time)
+
+    def write(self, key, document):
+        self.documents[key] = (document, datetime.now(timezone.utc))
+
+    def check_update(self, key, option):
+        from google.api_core.exceptions import FailedPrecondition, NotFound
+
+        if key not in self.documents:
+            raise NotFound(f"No document to update: {key[1]}")
+        if option is not None and self.documents[key][1] != option.last_update_time:
+            raise FailedPrecondition(f"Document {key[1]} was modified")
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.size = None
+        self.generation = None
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def _store(self, data, content_type):
+        with self.bucket.lock:
+            generation = self.bucket.objects.get(self.name, (None, None, 0))[2] + 1
+            self.bucket.objects[self.name] = (len(data), content_type, generation)
+        self.size, self.content_type, self.generation = len(data), content_type, generation
+
+    def upload_from_string(self, data, content_type=None):
+        self._store(data, content_type)
+
+    def upload_from_file(self, file_obj, content_type=None, **kwargs):
+        self._store(file_obj.read(), content_type)
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def delete(self):
+        with self.bucket.lock:
+            self.bucket.objects.pop(self.name, None)
+
+    def generate_signed_url(self, **kwargs):
+        return f"{self.public_url}?X-Goog-Signature=fake"
+
+
+class FakeBucket:
+    def __init__(self, name):
+        self.name = name
+        # blob name -> (size, content_type, generation); contents are not kept
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        with self.lock:
+            if name not in self.objects:
+                return None
+            size, content_type, generation = self.objects[name]
+        blob = FakeBlob(self, name)
+        blob.size, blob.content_type, blob.generation = size, content_type, generation
+        return blob
+
+
+class _FakeBatch:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeStorageClient:
+    """google.cloud.storage.Client stand-in; blob contents are discarded, only metadata is kept."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name):
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = FakeBucket(name)
+            return self._buckets[name]
+
+    def batch(self, raise_exception=True):
+        return _FakeBatch()
+
+
+def install_fakes(app, timing, image_latency_ms=500, fake_firestore=True):
+    """
+    Point the backend app and model registry at the fakes.
+    Returns the fake Firestore (or None when the app's own client is kept, e.g. for the emulator).
+    """
+    from google.cloud import firestore
+    from src.model_registry import model_registry
+    from src.rate_limit import AdaptiveTokenBucket, provider_limiters
+
+    for name in model_registry.names(provider="together_chat"):
+        model_registry._models[name] = FakeChatModel(timing)
+    model_registry._clients["together"] = FakeTogether(timing, image_latency_ms=image_latency_ms)
+    model_registry._clients["gemini"] = FakeGemini(timing)
+    # The fakes have no quota; benchmarks measure the app, not the provider rate limits
+    for provider in provider_limiters:
+        provider_limiters[provider] = AdaptiveTokenBucket(provider, float("inf"), float("inf"))
+
+    app.config['GCS'] = FakeStorageClient()
+    app.config['GCS_DEFERRED_DELETES'] = False
+    if not fake_firestore:
+        return None
+
+    db = FakeFirestore()
+    app.config['FIRESTORE'] = db
+    # The real decorator drives the client's RPC transaction protocol
+    firestore.transactional = fake_transactional
+    return db
+
+
+def make_video_data_url(size_bytes=64 * 1024):
+    return "data:video/mp4;base64," + base64.b64encode(b"\0" * size_bytes).decode("ascii")
@@ -1,58 +1,206 @@
 import base64
 import json
 import os
-from together import Together
-from langchain_together import ChatTogether
-from langchain_core.messages import HumanMessage
-from google import genai
-from google.genai import types
-from src.db.firestore import get_document_by_collection_and_id
-
-TOGETHER_MODEL_IDS = {
-    "gemma3n_4b": "google/gemma-3n-E4B-it",
-    "qwen3_8b": "Qwen/Qwen3-VL-8B-Instruct",
-}
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from itertools import chain, islice
+from src.cache import TieredCache, hash_key, image_content_key
+from src.context_builder import CONTEXT_TOKEN_BUDGET, ContextEntry, collect_ancestors, estimate_tokens, fit_context
+from src.db.storage import IMAGE_VARIANT_FORMATS, IMAGE_VARIANTS, image_variant_blob_path
+from src.prompt_pool import SuggestionPool
+from src.model_registry import model_registry
+from src.rate_limit import ProviderOverloaded, RateLimitedClient, provider_limiters
+from src.telemetry import record_tokens, span, traced, traced_iter
+
+# Heavy SDKs (langchain, google.genai, together) are imported on first use
+# so that importing this module stays cheap on cold start.
+IMAGE_MODELS = model_registry.names(provider="together_image")
 
-gemma3n_4b = ChatTogether(
-    model=TOGETHER_MODEL_IDS["gemma3n_4b"],
-    together_api_key=os.getenv("TOGETHER_API_KEY"),
-    temperature=0.7,
+GEMINI_VIDEO_MODEL = "gemini-2.0-flash"
+# Video context is cached on the Gemini side so follow-up questions don't re-ingest it
+GEMINI_CONTEXT_CACHING = (os.getenv("GEMINI_CONTEXT_CACHING") or "true").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL") or "3600")
+# How long videos Gemini refused to cache are sent inline without asking again
+GEMINI_CONTEXT_REFUSAL_TTL = int(os.getenv("GEMINI_CONTEXT_REFUSAL_TTL") or "600")
+
+IMAGE_DESCRIPTION_CONCURRENCY = int(os.getenv("IMAGE_DESCRIPTION_CONCURRENCY", "4"))
+IMAGE_DESCRIPTION_TIMEOUT = float(os.getenv("IMAGE_DESCRIPTION_TIMEOUT", "20"))
+
+# Video URIs -> Gemini cached content name. Expires before the Gemini cache does.
+gemini_context_cache = TieredCache(
+    "gemini_context",
+    maxsize=512,
+    ttl=max(GEMINI_CONTEXT_CACHE_TTL - 300, 60),
 )
-qwen3_8b = ChatTogether(
-    model=TOGETHER_MODEL_IDS["qwen3_8b"],
-    together_api_key=os.getenv("TOGETHER_API_KEY"),
-    temperature=0.7,
+# Video URIs -> "" for videos Gemini refused to cache (e.g. below the minimum
+# token count); transient errors aren't recorded
+gemini_context_refusals = TieredCache(
+    "gemini_context_refusals",
+    maxsize=512,
+    ttl=GEMINI_CONTEXT_REFUSAL_TTL,
 )
 
-IMAGE_MODELS = ["google/flash-image-2.5", "openai/gpt-image-1.5"]
-
-GEMINI_VIDEO_MODEL = "gemini-2.0-flash"
+image_description_cache = TieredCache(
+    "image_description",
+    maxsize=int(os.getenv("IMAGE_DESCRIPTION_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("IMAGE_DESCRIPTION_CACHE_TTL", str(7 * 24 * 3600))),
+)
 
 
 def _get_gemini_client():
-    return genai.Client(
-        vertexai=True,
-        project=os.getenv("GCP_PROJECT"),
-        location=os.getenv("GEMINI_LOCATION", "us-central1"),
+    return RateLimitedClient(
+        model_registry.gemini_client(),
+        provider_limiters["gemini"],
+        ["models.generate_content", "caches.create"],
+        streams=["models.generate_content_stream"],
     )
 
 
+def _get_together_client():
+    return RateLimitedClient(model_registry.together_client(), provider_limiters["together"], ["images.generate"])
+
+
 def _make_gemini_video_part(video_url):
     """Create a Gemini Part from a video — GCS HTTPS URL or base64 data URL."""
+    from google.genai import types
+
     if video_url.startswith("data:"):
         header, b64_data = video_url.split(",", 1)
         mime_type = header.split(";")[0].split(":")[1]
         return types.Part.from_bytes(data=base64.b64decode(b64_data), mime_type=mime_type)
-    if video_url.startswith("https://storage.googleapis.com/"):
-        gcs_uri = "gs://" + video_url[len("https://storage.googleapis.com/"):]
+    if video_url.startswith("https://storage.googleapis.com/") or video_url.startswith("gs://"):
+        gcs_uri = _gcs_uri(video_url)
         ext = video_url.rsplit(".", 1)[-1].lower()
         mime_type = {"webm": "video/webm", "mov": "video/quicktime"}.get(ext, "video/mp4")
         return types.Part.from_uri(file_uri=gcs_uri, mime_type=mime_type)
     return types.Part.from_uri(file_uri=video_url, mime_type="video/mp4")
 
 
+def _gcs_uri(url):
+    if url.startswith("https://storage.googleapis.com/"):
+        return "gs://" + url[len("https://storage.googleapis.com/"):]
+    return url
+
+
+def _video_context_key(video_urls):
+    return hash_key(GEMINI_VIDEO_MODEL, [_gcs_uri(url) for url in video_urls])
+
+
+def _cached_video_context(gemini, video_urls):
+    """
+    Name of a Gemini cached content holding the given videos, created on first use,
+    or None when caching is disabled, the videos aren't in GCS, or creating the
+    cache failed. Videos Gemini refuses to cache are remembered for
+    GEMINI_CONTEXT_REFUSAL_TTL; after other errors the next request tries again.
+    """
+    if not GEMINI_CONTEXT_CACHING or any(url.startswith("data:") for url in video_urls):
+        return None
+
+    cache_key = _video_context_key(video_urls)
+    name = gemini_context_cache.get(cache_key)
+    if name is not None:
+        return name
+    if gemini_context_refusals.get(cache_key) is not None:
+        return None
+
+    from google.genai import types
+    try:
+        with span("provider.gemini.cache_create", model=GEMINI_VIDEO_MODEL):
+            cached_content = gemini.caches.create(
+                model=GEMINI_VIDEO_MODEL,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role="user", parts=[_make_gemini_video_part(url) for url in video_urls])],
+                    ttl=f"{GEMINI_CONTEXT_CACHE_TTL}s",
+                ),
+            )
+    except ProviderOverloaded:
+        raise
+    except Exception as e:
+        print(f"Error caching video context with Gemini, sending it inline: {e}")
+        if _is_invalid_argument_error(e):
+            gemini_context_refusals.set(cache_key, "")
+        return None
+    gemini_context_cache.set(cache_key, cached_content.name)
+    return cached_content.name
+
+
+def _is_invalid_argument_error(error):
+    """Whether a google-genai or api_core exception is a 400 INVALID_ARGUMENT, which retrying won't fix."""
+    if getattr(error, "code", None) == 400 or getattr(error, "status", None) == "INVALID_ARGUMENT":
+        return True
+    return type(error).__name__ == "InvalidArgument"
+
+
+def _generate_with_video(head_parts, video_urls, tail_parts, stream=False):
+    """
+    Call Gemini with head_parts, the videos, then tail_parts. Videos are served
+    from a Gemini context cache when possible and otherwise sent as parts.
+    Returns a response, or an iterator of response chunks when stream is set.
+    """
+    gemini = _get_gemini_client()
+
+    def generate(**kwargs):
+        if stream:
+            chunks = traced_iter(
+                gemini.models.generate_content_stream(model=GEMINI_VIDEO_MODEL, **kwargs),
+                "provider.gemini.generate_stream",
+                model=GEMINI_VIDEO_MODEL,
+            )
+            # Streams fail lazily; pull the first chunk so errors (e.g. an expired
+            # cached content) are raised here, where the inline fallback can run
+            first = list(islice(chunks, 1))
+            return chain(first, chunks)
+        with span("provider.gemini.generate", model=GEMINI_VIDEO_MODEL):
+            response = gemini.models.generate_content(model=GEMINI_VIDEO_MODEL, **kwargs)
+        _record_gemini_tokens(response)
+        return response
+
+    cached_content = _cached_video_context(gemini, video_urls)
+    if cached_content:
+        from google.genai import types
+        try:
+            return generate(
+                contents=head_parts + tail_parts,
+                config=types.GenerateContentConfig(cached_content=cached_content),
+            )
+        except ProviderOverloaded:
+            raise
+        except Exception as e:
+            print(f"Error generating with cached video context, retrying inline: {e}")
+            gemini_context_cache.delete(_video_context_key(video_urls))
+
+    video_parts = [_make_gemini_video_part(url) for url in video_urls]
+    return generate(contents=head_parts + video_parts + tail_parts)
+
+
+def _record_gemini_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        record_tokens(
+            GEMINI_VIDEO_MODEL,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+
+def _record_chat_tokens(model_name, message, response):
+    """Count a chat call's tokens: reported usage when present, otherwise estimated from text."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_tokens(model_name, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+        return
+    content = response.content if hasattr(response, 'content') else str(response)
+    record_tokens(model_name, estimate_tokens(_message_text(message)), estimate_tokens(content))
+
+
+def _message_text(message):
+    return "".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
 def _make_gemini_image_part(data_url):
     """Create a Gemini Part from an image — GCS HTTPS URL or base64 data URL."""
+    from google.genai import types
+
     if data_url.startswith("data:"):
         header, b64_data = data_url.split(",", 1)
         mime_type = header.split(";")[0].split(":")[1]
@@ -66,20 +214,26 @@ def _make_gemini_image_part(data_url):
 
 
 def get_model(model_name):
-    if model_name == "qwen3_8b":
-        llm = qwen3_8b
-    elif model_name == "gemma3n_4b":
-        llm = gemma3n_4b
-    else:
-        raise ValueError(f"Unsupported model type: {model_name}")
+    """The chat model for model_name, rate limited per provider (see src/rate_limit.py)."""
+    model = model_registry.get(model_name)
+    provider = model_registry.config(model_name)["provider"].split("_")[0]
+    return RateLimitedClient(model, provider_limiters[provider], ["invoke"], streams=["stream"])
 
-    return llm
+
+def warm_up():
+    """Create model clients and start filling suggestion pools ahead of traffic."""
+    for model_name in model_registry.names(provider="together_chat"):
+        model_registry.get(model_name)
+    model_registry.together_client()
+    model_registry.gemini_client()
+    # Pay for the per-request SDK imports now rather than on the first request
+    import langchain_core.messages
+    import google.genai.types
+    warm_suggestion_pools()
 
 
 def get_together_model_name(model_name):
-    if model_name not in TOGETHER_MODEL_IDS:
-        raise ValueError(f"Unsupported model type: {model_name}")
-    return TOGETHER_MODEL_IDS[model_name]
+    return model_registry.config(model_name)["model"]
 
 
 prompt_question_closing = """Always end with a question mark. DO NOT surround the question in quotes. RETURN ENGLISH ONLY.
@@ -112,16 +266,51 @@ If no context is provided, simply address the prompt by itself. Do not mention t
 Add newlines between each bullet point."""
 
 
-def extract_parent_data(parent_nodes=None):
-    """Returns (text_responses, image_data_urls, video_data_urls) from parent nodes."""
-    text_responses = []
+def get_context_budget(model_name):
+    """Context token budget for a model: its `context_budget` config, else CONTEXT_TOKEN_BUDGET."""
+    config = model_registry.configs.get(model_name) or {}
+    return config.get("context_budget", CONTEXT_TOKEN_BUDGET)
+
+
+def _summarize_context(text, max_words):
+    from langchain_core.messages import HumanMessage
+
+    message = HumanMessage(content=[
+        {"type": "text", "text": f"Summarize the following text in *LESS THAN {max_words} WORDS*. Keep key facts, names and numbers. Return only the summary."},
+        {"type": "text", "text": text},
+    ])
+    with span("provider.together.chat", model="gemma3n_4b"):
+        response = get_model("gemma3n_4b").invoke([message])
+    _record_chat_tokens("gemma3n_4b", message, response)
+    return response.content if hasattr(response, 'content') else str(response)
+
+
+@traced("extract_parent_data")
+def extract_parent_data(parent_nodes=None, model=None, node_lookup=None):
+    """
+    Returns (text_responses, image_data_urls, video_data_urls) from parent nodes.
+    Text responses of the parents, and of their ancestors when node_lookup
+    ({node_id: node}) is given, are fitted into the model's context budget;
+    ancestors are summarized, trimmed or dropped before direct parents are.
+    Media is only taken from direct parents; images are sent as their
+    downscaled "model" variant when one was stored (see model_image_url).
+    """
+    parent_nodes = parent_nodes or []
+    entries = []
     image_data_urls = []
     video_data_urls = []
 
-    for index, node in enumerate(parent_nodes or []):
+    ancestors = collect_ancestors(parent_nodes, node_lookup)
+    # Deepest first, so the context reads oldest to newest
+    for position, (depth, node) in enumerate(reversed(ancestors)):
+        prompt_response = node.get("data", {}).get("prompt_response", "")
+        if prompt_response:
+            entries.append(ContextEntry(f"Earlier response {position+1}", prompt_response, node.get("id"), depth))
+
+    for index, node in enumerate(parent_nodes):
         node_data = node.get("data", {})
         if node.get("type") == "imageNode":
-            data_url = node_data.get("imageDataUrl", "")
+            data_url = model_image_url(node, node_lookup)
             if data_url:
                 image_data_urls.append(data_url)
         elif node.get("type") == "videoNode":
@@ -131,125 +320,300 @@ def extract_parent_data(parent_nodes=None):
         else:
             prompt_response = node_data.get("prompt_response", "")
             if prompt_response:
-                text_responses.append(f"Response {index+1}: {prompt_response}")
+                entries.append(ContextEntry(f"Response {index+1}", prompt_response, node.get("id"), 0))
 
+    text_responses = fit_context(entries, budget=get_context_budget(model), summarize=_summarize_context) if entries else []
     return text_responses, image_data_urls, video_data_urls
 
 
-def generate_prompt_question(parent_nodes, model=None):
-    """Generate a prompt suggestion"""
-    text_responses, image_data_urls, video_data_urls = extract_parent_data(parent_nodes=parent_nodes)
+def model_image_url(node, node_lookup=None):
+    """
+    The image URL to send to a vision model for an image node: its "model" variant
+    (capped at IMAGE_MODEL_MAX_SIDE) if one was stored at upload, else the original.
+    Variants are taken from the node sent by the client, or from the saved canvas
+    node (node_lookup) when it still holds the same image, and only used if they
+    were stored for that image.
+    """
+    node_data = node.get("data", {})
+    data_url = node_data.get("imageDataUrl", "")
+    candidates = [node_data.get("imageVariants")]
+    saved_data = (node_lookup or {}).get(node.get("id"), {}).get("data", {})
+    if saved_data.get("imageDataUrl") == data_url:
+        candidates.append(saved_data.get("imageVariants"))
+    for variants in candidates:
+        if isinstance(variants, dict) and variants.get("model") == _model_variant_url(data_url):
+            return variants["model"]
+    return data_url
+
+
+def _model_variant_url(data_url):
+    """Where the "model" variant of an uploaded image is stored (see image_variant_blob_path), or None."""
+    if not data_url.startswith("https://storage.googleapis.com/"):
+        return None
+    extension, _ = IMAGE_VARIANT_FORMATS[IMAGE_VARIANTS["model"][1]]
+    return image_variant_blob_path(data_url, "model", extension)
+
+
+prompt_question_cache = TieredCache(
+    "prompt_question",
+    maxsize=int(os.getenv("PROMPT_QUESTION_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("PROMPT_QUESTION_CACHE_TTL", str(24 * 3600))),
+)
 
-    try:
-        content_parts = []
-
-        if video_data_urls:
-            try:
-                gemini = _get_gemini_client()
-                parts = [video_prompt_question_preamble]
-                for video_url in video_data_urls:
-                    parts.append(_make_gemini_video_part(video_url))
-                response = gemini.models.generate_content(
-                    model=GEMINI_VIDEO_MODEL,
-                    contents=parts,
-                )
-                return response.text
-            except Exception as e:
-                print(f"Error generating video prompt question with Gemini: {e}")
-                return ""
-
-        preamble = no_context_prompt_question_preamble
-        if text_responses or image_data_urls or video_data_urls:
-            preamble = with_context_prompt_question_preamble
 
+def _invoke_prompt_question(content_parts):
+    from langchain_core.messages import HumanMessage
+
+    message = HumanMessage(content=content_parts)
+    with span("provider.together.chat", model="gemma3n_4b"):
+        prompt_question = get_model("gemma3n_4b").invoke([message])
+    _record_chat_tokens("gemma3n_4b", message, prompt_question)
+    return prompt_question.content if hasattr(prompt_question, 'content') else str(prompt_question)
+
+
+def _generate_video_prompt_question(video_data_urls):
+    response = _generate_with_video([video_prompt_question_preamble], video_data_urls, [])
+    return response.text
+
+
+def _memoized_prompt_question(cache_key, generate):
+    """Serve a prompt question from cache, generating and caching it on a miss."""
+    prompt_question = prompt_question_cache.get(cache_key)
+    if prompt_question is not None:
+        return prompt_question
+
+    prompt_question = generate()
+    if prompt_question:
+        prompt_question_cache.set(cache_key, prompt_question)
+    return prompt_question
+
+
+# Context-free suggestions are always generated from the same preamble,
+# so keep a few ready instead of paying an LLM call per node
+no_context_suggestion_pools = {
+    preamble: SuggestionPool(
+        lambda preamble=preamble: _invoke_prompt_question([{"type": "text", "text": preamble}]),
+        size=int(os.getenv("PROMPT_SUGGESTION_POOL_SIZE", "8")),
+    )
+    for preamble in [no_context_prompt_question_preamble, no_context_image_prompt_question_preamble]
+}
+
+
+def warm_suggestion_pools():
+    """Start filling the no-context suggestion pools in the background."""
+    for pool in no_context_suggestion_pools.values():
+        pool.refill()
+
+
+def generate_prompt_question(parent_nodes, model=None, node_lookup=None):
+    """
+    Generate a prompt suggestion.
+    Context-free suggestions come from a pre-warmed pool; suggestions with context
+    are memoized by a hash of the model, preamble and parent inputs.
+    """
+    text_responses, image_data_urls, video_data_urls = extract_parent_data(
+        parent_nodes=parent_nodes, model="gemma3n_4b", node_lookup=node_lookup
+    )
+
+    if video_data_urls:
+        try:
+            cache_key = hash_key(GEMINI_VIDEO_MODEL, video_prompt_question_preamble, video_data_urls)
+            return _memoized_prompt_question(
+                cache_key, lambda: _generate_video_prompt_question(video_data_urls)
+            )
+        except ProviderOverloaded:
+            raise
+        except Exception as e:
+            print(f"Error generating video prompt question with Gemini: {e}")
+            return ""
+
+    try:
+        has_context = bool(text_responses or image_data_urls)
         if model in IMAGE_MODELS:
-            preamble = no_context_image_prompt_question_preamble
-            if text_responses or image_data_urls or video_data_urls:
-                preamble = with_context_image_prompt_question_preamble
+            preamble = with_context_image_prompt_question_preamble if has_context else no_context_image_prompt_question_preamble
+        else:
+            preamble = with_context_prompt_question_preamble if has_context else no_context_prompt_question_preamble
 
-        content_parts.append({"type": "text", "text": preamble})
+        content_parts = [{"type": "text", "text": preamble}]
+
+        if not has_context:
+            prompt_question = no_context_suggestion_pools[preamble].get()
+            if prompt_question:
+                return prompt_question
+            return _invoke_prompt_question(content_parts)
 
         if text_responses:
-            context_text = "\n\n".join(text_responses)
-            text_context = f"*Context:*\n{context_text}\n\n"
-            content_parts.append({"type": "text", "text": text_context})
-
-        if image_data_urls:
-            for data_url in image_data_urls:
-                content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
-
-        message = HumanMessage(content=content_parts)
-        prompt_question = gemma3n_4b.invoke([message])
-        
-        return prompt_question.content if hasattr(prompt_question, 'content') else str(prompt_question)
+            content_parts.append({"type": "text", "text": _format_context_text(text_responses)})
+
+        for data_url in image_data_urls:
+            content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+
+        cache_key = hash_key(get_together_model_name("gemma3n_4b"), preamble, text_responses, image_data_urls)
+        return _memoized_prompt_question(cache_key, lambda: _invoke_prompt_question(content_parts))
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
         return ""
 
 
+COMPLETION_ERROR_MESSAGE = "Sorry, I encountered an error processing your request."
+IMAGE_ERROR_MESSAGE = "Sorry, I encountered an error generating the image."
+
+
+def _format_context_text(text_responses):
+    context_text = "\n\n".join(text_responses)
+    return f"*Context:*\n{context_text}\n\n"
+
+
+def _build_completion_message(prompt, text_responses, image_data_urls):
+    """Build the LangChain message sent to Together chat models for a completion."""
+    from langchain_core.messages import HumanMessage
+
+    content_parts = [{"type": "text", "text": context_prompt_preamble}]
+
+    if text_responses:
+        content_parts.append({"type": "text", "text": _format_context_text(text_responses)})
+
+    for data_url in image_data_urls:
+        content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+
+    content_parts.append({"type": "text", "text": prompt})
+    return HumanMessage(content=content_parts)
+
+
+def _build_gemini_completion_parts(prompt, text_responses, image_data_urls):
+    """Build the Gemini contents around the videos of a completion, as (head_parts, tail_parts)."""
+    parts = [context_prompt_preamble]
+    if text_responses:
+        parts.append(_format_context_text(text_responses))
+    for data_url in image_data_urls:
+        parts.append(_make_gemini_image_part(data_url))
+    return parts, [prompt]
+
+
 def generate_response_with_context(
         model: str,
         prompt: str,
         parent_nodes: list,
+        node_lookup: dict = None,
 ):
-    text_responses, image_data_urls, video_data_urls = extract_parent_data(parent_nodes=parent_nodes)
-    content_parts = [{"type": "text", "text": context_prompt_preamble}]
-
-    if text_responses:
-        context_text = "\n\n".join(text_responses)
-        text_context = f"*Context:*\n{context_text}\n\n"
-        content_parts.append({"type": "text", "text": text_context})
-
-    if image_data_urls:
-        for data_url in image_data_urls:
-            content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+    text_responses, image_data_urls, video_data_urls = extract_parent_data(
+        parent_nodes=parent_nodes, model=model, node_lookup=node_lookup
+    )
 
     if video_data_urls:
         try:
-            gemini = _get_gemini_client()
-            parts = [context_prompt_preamble]
-            if text_responses:
-                context_text = "\n\n".join(text_responses)
-                parts.append(f"*Context:*\n{context_text}\n\n")
-            for data_url in image_data_urls:
-                parts.append(_make_gemini_image_part(data_url))
-            for video_url in video_data_urls:
-                parts.append(_make_gemini_video_part(video_url))
-            parts.append(prompt)
-            response = gemini.models.generate_content(
-                model=GEMINI_VIDEO_MODEL,
-                contents=parts,
-            )
+            head_parts, tail_parts = _build_gemini_completion_parts(prompt, text_responses, image_data_urls)
+            response = _generate_with_video(head_parts, video_data_urls, tail_parts)
             return response.text
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             print(f"Error generating response with video context: {e}")
-            return "Sorry, I encountered an error processing your request."
+            return COMPLETION_ERROR_MESSAGE
 
     llm = get_model(model)
     try:
-        content_parts.append({"type": "text", "text": prompt})
-        message = HumanMessage(content=content_parts)
-        response = llm.invoke([message])
+        message = _build_completion_message(prompt, text_responses, image_data_urls)
+        with span("provider.together.chat", model=model):
+            response = llm.invoke([message])
+        _record_chat_tokens(model, message, response)
         return response.content if hasattr(response, 'content') else str(response)
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "Sorry, I encountered an error processing your request."
+        return COMPLETION_ERROR_MESSAGE
 
 
-def describe_images(image_data_urls):
-    """Use gemma3n_4b to describe parent images as text for image gen context."""
+def stream_response_with_context(
+        model: str,
+        prompt: str,
+        parent_nodes: list,
+        node_lookup: dict = None,
+):
+    """
+    Streaming counterpart of generate_response_with_context.
+    Returns an iterator of text chunks; joined together they equal the
+    non-streaming response. Raises ValueError for unsupported models before
+    any upstream call is made. Upstream errors surface while iterating.
+    """
+    text_responses, image_data_urls, video_data_urls = extract_parent_data(
+        parent_nodes=parent_nodes, model=model, node_lookup=node_lookup
+    )
+
+    if video_data_urls:
+        head_parts, tail_parts = _build_gemini_completion_parts(prompt, text_responses, image_data_urls)
+        chunks = _generate_with_video(head_parts, video_data_urls, tail_parts, stream=True)
+        return (chunk.text for chunk in chunks if chunk.text)
+
+    llm = get_model(model)
+    message = _build_completion_message(prompt, text_responses, image_data_urls)
+    return _stream_chat(model, llm, message)
+
+
+def _stream_chat(model_name, llm, message):
+    chunks = []
+    for chunk in traced_iter(llm.stream([message]), "provider.together.chat_stream", model=model_name):
+        if chunk.content:
+            chunks.append(chunk.content)
+            yield chunk.content
+    record_tokens(model_name, estimate_tokens(_message_text(message)), estimate_tokens("".join(chunks)))
+
+
+def _describe_image(data_url, gcs_client=None):
+    cache_key = image_content_key(data_url, gcs_client)
+    description = image_description_cache.get(cache_key)
+    if description is not None:
+        return description
+
+    from langchain_core.messages import HumanMessage
+    message = HumanMessage(content=[
+        {"type": "text", "text": "Describe this image concisely in 2-3 sentences. Specify colors, subjects, style, composition, and overall mood."},
+        {"type": "image_url", "image_url": {"url": data_url}},
+    ])
+    with span("provider.together.chat", model="gemma3n_4b"):
+        response = get_model("gemma3n_4b").invoke([message])
+    _record_chat_tokens("gemma3n_4b", message, response)
+    description = response.content if hasattr(response, 'content') else str(response)
+    image_description_cache.set(cache_key, description)
+    return description
+
+
+@traced("describe_images")
+def describe_images(image_data_urls, max_workers=None, timeout=None, gcs_client=None):
+    """
+    Use gemma3n_4b to describe parent images as text for image gen context.
+    Images are described concurrently, at most `max_workers` at a time, and each
+    gets `timeout` seconds once it starts. Images that fail or time out are skipped;
+    the remaining descriptions keep the order of image_data_urls.
+    Descriptions are cached by image content (see image_content_key); pass
+    gcs_client to key GCS-hosted images by object generation.
+    """
+    if not image_data_urls:
+        return []
+
+    max_workers = min(max_workers or IMAGE_DESCRIPTION_CONCURRENCY, len(image_data_urls))
+    timeout = timeout or IMAGE_DESCRIPTION_TIMEOUT
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(_describe_image, data_url, gcs_client) for data_url in image_data_urls]
+    started_at = time.monotonic()
+
     descriptions = []
-    for data_url in image_data_urls:
+    for index, future in enumerate(futures):
+        # Images run in waves of max_workers, so later images get a later deadline
+        deadline = started_at + timeout * (index // max_workers + 1)
         try:
-            message = HumanMessage(content=[
-                {"type": "text", "text": "Describe this image concisely in 2-3 sentences. Specify colors, subjects, style, composition, and overall mood."},
-                {"type": "image_url", "image_url": {"url": data_url}},
-            ])
-            response = gemma3n_4b.invoke([message])
-            desc = response.content if hasattr(response, 'content') else str(response)
-            descriptions.append(desc)
+            descriptions.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+        except FuturesTimeoutError:
+            print(f"Timed out describing image {index + 1} after {timeout}s")
         except Exception as e:
             print(f"Error describing image: {e}")
+
+    # Don't block the request on stragglers; they finish in the background
+    executor.shutdown(wait=False, cancel_futures=True)
     return descriptions
 
 
@@ -257,8 +621,12 @@ def generate_image_with_context(
     model: str,
     prompt: str,
     parent_nodes: list,
+    gcs_client=None,
+    node_lookup: dict = None,
 ):
-    text_responses, image_data_urls, _ = extract_parent_data(parent_nodes=parent_nodes)
+    text_responses, image_data_urls, _ = extract_parent_data(
+        parent_nodes=parent_nodes, model=model, node_lookup=node_lookup
+    )
 
     # Build enriched prompt with parent text context
     full_prompt = prompt
@@ -267,7 +635,7 @@ def generate_image_with_context(
         context_parts.extend(text_responses)
 
     if image_data_urls:
-        image_descriptions = describe_images(image_data_urls)
+        image_descriptions = describe_images(image_data_urls, gcs_client=gcs_client)
         context_parts.extend([f"Image description: {d}" for d in image_descriptions])
 
     if context_parts:
@@ -275,14 +643,18 @@ def generate_image_with_context(
         full_prompt = f"Context: {context}\n\nPrompt: {prompt}"
 
     try:
-        client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
-        response = client.images.generate(
-            model=model,
-            prompt=full_prompt,
-            response_format="base64",
-        )
+        client = _get_together_client()
+        with span("provider.together.images", model=model):
+            response = client.images.generate(
+                model=get_together_model_name(model),
+                prompt=full_prompt,
+                response_format="base64",
+            )
+        record_tokens(model, estimate_tokens(full_prompt), 0)
         b64_json = response.data[0].b64_json
         return f"data:image/png;base64,{b64_json}"
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         print(f"Error generating image: {e}")
-        return "Sorry, I encountered an error generating the image."
+        return IMAGE_ERROR_MESSAGE
@@ -1,11 +1,5 @@
 import os
 from dotenv import load_dotenv
-from flask import Flask
-from flask_cors import CORS
-from flask_socketio import SocketIO
-
-from src.db.firestore import start_firestore_project_client
-from src.db.storage import start_storage_client
 
 
 env = os.environ.get("FLASK_ENV", "local")
@@ -17,25 +11,72 @@ else:
     load_dotenv(".env")
 
 
+# Patch blocking I/O for green threads before anything that uses it is imported
+from src import concurrency
+concurrency.monkey_patch()
+
+from flask import Flask
+from flask_cors import CORS
+from flask_socketio import SocketIO
+
+from src.db.firestore import start_firestore_project_client
+from src.db.storage import start_storage_client
+from src.json_provider import FastJSONProvider
+from src.lazy import LazyClient
+from src import telemetry
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+telemetry.init_app(app)
 CORS(app, supports_credentials=True, origins=[os.environ["CORS_ORIGIN"]])
-socketio = SocketIO(app, cors_allowed_origins='*', transports=['websocket'])
+# With REDIS_URL set, events are relayed between backend instances through Redis
+socketio = SocketIO(
+    app,
+    async_mode=concurrency.ASYNC_MODE,
+    cors_allowed_origins='*',
+    transports=['websocket'],
+    message_queue=os.environ.get("REDIS_URL") or None,
+)
 
 
-ds_client = start_firestore_project_client(os.environ["GCP_PROJECT"])
-app.config['FIRESTORE'] = ds_client
-
-gcs_client = start_storage_client(os.environ["GCP_PROJECT"])
-app.config['GCS'] = gcs_client
+# Clients are created on first use (or by the warmup request) to keep cold starts fast
+gcp_project = os.environ["GCP_PROJECT"]
+app.config['FIRESTORE'] = LazyClient(lambda: start_firestore_project_client(gcp_project))
+app.config['GCS'] = LazyClient(lambda: start_storage_client(gcp_project))
 app.config['GCS_BUCKET'] = os.environ.get("GCS_BUCKET", "polylogue-canvas-images")
+app.config['GCS_DEFERRED_DELETES'] = os.environ.get("GCS_DEFERRED_DELETES", "true").lower() == "true"
 
 
 from src.routes.datastore import ds_routes
 app.register_blueprint(ds_routes, url_prefix="/ds")
 
 
-from src.routes.api import api_routes
+from src.jobs import JobQueue, create_job_store
+app.config['JOBS'] = JobQueue(app, socketio, create_job_store())
+
+
+from src.routes.api import api_routes, register_completion_events, register_completion_jobs
 app.register_blueprint(api_routes, url_prefix="/api")
+register_completion_events(socketio)
+register_completion_jobs(app.config['JOBS'])
+app.config['JOBS'].start()
+
+
+from src.routes.collab import register_collab_events
+register_collab_events(socketio)
+
+
+from src.ai_models import warm_up
+
+
+@app.route("/_ah/warmup")
+def warmup():
+    """App Engine warmup request: create clients before the instance takes traffic"""
+    app.config['FIRESTORE'].resolve()
+    app.config['GCS'].resolve()
+    warm_up()
+    return "", 200
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import threading
+import redis
+from cachetools import TTLCache
+
+
+GCS_PUBLIC_URL_PREFIX = "https://storage.googleapis.com/"
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+_caches = {}
+
+# Set KEYS[1] only if the generation counter KEYS[2] still holds ARGV[1]
+_SET_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def get_redis_client():
+    """Return a shared Redis client, or None when REDIS_URL is not configured."""
+    global _redis_client
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+
+    with _redis_lock:
+        if _redis_client is None:
+            _redis_client = redis.Redis.from_url(
+                redis_url,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+    return _redis_client
+
+
+class TieredCache:
+    """
+    Two-tier cache: a size-bounded in-process LRU with TTL, backed by Redis
+    when REDIS_URL is set. Values must be JSON serializable.
+    Redis errors are logged and treated as misses so the cache never fails a request.
+
+    Every delete bumps the key's generation. A reader that takes generation(key)
+    before loading a value and passes it to set() won't cache a value loaded
+    before a concurrent write's delete.
+    """
+
+    def __init__(self, namespace, maxsize=1024, ttl=3600, local_ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=local_ttl or ttl)
+        # An evicted generation reads as 0, which only makes set() skip more often
+        self._generations = TTLCache(maxsize=maxsize * 4, ttl=ttl)
+        self._lock = threading.Lock()
+        self._counters = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+        _caches[namespace] = self
+
+    def _redis_key(self, key):
+        return f"polylogue:{self.namespace}:{key}"
+
+    def _generation_key(self, key):
+        return f"polylogue:{self.namespace}:{key}:generation"
+
+    def generation(self, key):
+        """Current invalidation generation of key, to pass to set()."""
+        with self._lock:
+            local_generation = self._generations.get(key, 0)
+
+        redis_generation = None
+        client = get_redis_client()
+        if client is not None:
+            try:
+                raw = client.get(self._generation_key(key))
+                redis_generation = raw.decode("utf-8") if raw is not None else "0"
+            except redis.RedisError as e:
+                print(f"Error reading {self.namespace} cache generation from Redis: {e}")
+        return local_generation, redis_generation
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            value = self._local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                raw = client.get(self._redis_key(key))
+            except redis.RedisError as e:
+                print(f"Error reading {self.namespace} cache from Redis: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                with self._lock:
+                    self._local[key] = value
+                self._count("redis_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value, generation=None):
+        """
+        Cache value for key. With generation (see generation()), nothing is cached
+        if key was deleted since that generation was read.
+        """
+        client = get_redis_client()
+        if client is not None:
+            try:
+                if generation is None:
+                    client.set(self._redis_key(key), json.dumps(value), ex=self.ttl)
+                elif generation[1] is None or not client.eval(
+                    _SET_IF_GENERATION, 2, self._redis_key(key), self._generation_key(key),
+                    generation[1], json.dumps(value), self.ttl,
+                ):
+                    return
+            except redis.RedisError as e:
+                print(f"Error writing {self.namespace} cache to Redis: {e}")
+                if generation is not None:
+                    return
+
+        with self._lock:
+            if generation is not None and self._generations.get(key, 0) != generation[0]:
+                return
+            self._local[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                pipeline = client.pipeline()
+                pipeline.delete(self._redis_key(key))
+                pipeline.incr(self._generation_key(key))
+                pipeline.expire(self._generation_key(key), self.ttl)
+                pipeline.execute()
+            except redis.RedisError as e:
+                print(f"Error deleting {self.namespace} cache key from Redis: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["local_size"] = len(self._local)
+        stats["hits"] = stats["local_hits"] + stats["redis_hits"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cache_stats():
+    """Hit/miss counters for every cache in this process, keyed by namespace."""
+    return {namespace: cache.stats() for namespace, cache in _caches.items()}
+
+
+def hash_key(*parts):
+    """Canonical sha256 key for a tuple of JSON serializable parts."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def image_content_key(data_url, storage_client=None):
+    """
+    Content-addressed key for an image reference.
+    - base64 data URLs hash their payload
+    - GCS public URLs use the object's generation number, which changes on every overwrite
+    - anything else falls back to hashing the URL itself
+    """
+    if data_url.startswith("data:"):
+        return "sha256:" + hashlib.sha256(data_url.encode("utf-8")).hexdigest()
+
+    if storage_client is not None and data_url.startswith(GCS_PUBLIC_URL_PREFIX):
+        bucket_name, _, blob_path = data_url[len(GCS_PUBLIC_URL_PREFIX):].split("?")[0].partition("/")
+        try:
+            blob = storage_client.bucket(bucket_name).get_blob(blob_path)
+            if blob is not None:
+                return f"gcs:{bucket_name}/{blob_path}#{blob.generation}"
+        except Exception as e:
+            print(f"Error reading GCS generation for {data_url}: {e}")
+
+    return "url:" + hashlib.sha256(data_url.encode("utf-8")).hexdigest()
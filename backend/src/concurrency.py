@@ -0,0 +1,40 @@
+import os
+from functools import wraps
+
+# Imported by src.app before anything else, so only the stdlib may be imported at module level.
+
+
+# Socket.IO / serving mode: "eventlet" (default) runs requests as green threads, so
+# one process holds many slow upstream calls; "threading" uses OS threads.
+ASYNC_MODE = (os.getenv("SOCKETIO_ASYNC_MODE") or "eventlet").lower()
+if ASYNC_MODE not in ("eventlet", "threading"):
+    raise ValueError(f"Unsupported SOCKETIO_ASYNC_MODE: {ASYNC_MODE} (expected eventlet or threading)")
+
+
+def monkey_patch():
+    """
+    Make blocking stdlib I/O (sockets, ssl, time.sleep, threading) cooperative under
+    eventlet, so HTTP clients (httpx, requests, redis) yield while waiting.
+    Must run before the rest of the app is imported.
+    """
+    if ASYNC_MODE == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+
+
+def offload(fn):
+    """
+    Run fn in eventlet's pool of real OS threads (size: EVENTLET_THREADPOOL_SIZE).
+    For calls into C extensions that block without yielding, like grpc-based
+    Firestore; under eventlet they would otherwise stall every green thread.
+    Calls fn directly in the other modes.
+    """
+    if ASYNC_MODE != "eventlet":
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        from eventlet import tpool
+        # Calls from inside the pool (e.g. nested in a transaction) run directly
+        return tpool.execute(fn, *args, **kwargs)
+    return wrapper
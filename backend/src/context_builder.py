@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import namedtuple
+
+from src.cache import TieredCache, hash_key
+
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET") or "4000")
+# How many hops beyond the direct parents to walk through data.parent_ids
+CONTEXT_ANCESTOR_DEPTH = int(os.getenv("CONTEXT_ANCESTOR_DEPTH") or "0")
+# Upper bound on new (uncached) summaries generated while building one context
+CONTEXT_MAX_SUMMARIES = int(os.getenv("CONTEXT_MAX_SUMMARIES", "2"))
+SUMMARY_MAX_WORDS = 60
+# Entries that would be trimmed below this are dropped instead
+MIN_TRIMMED_TOKENS = 32
+
+node_summary_cache = TieredCache(
+    "node_summary",
+    maxsize=int(os.getenv("NODE_SUMMARY_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("NODE_SUMMARY_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+# label: prefix shown to the model, e.g. "Response 2"
+# priority: lower is kept first (direct parents are 0, ancestors their hop distance)
+ContextEntry = namedtuple("ContextEntry", ["label", "text", "node_id", "priority"])
+
+_telemetry_lock = threading.Lock()
+_telemetry = {
+    "requests": 0,
+    "context_tokens_total": 0,
+    "context_tokens_max": 0,
+    "entries_kept": 0,
+    "entries_summarized": 0,
+    "entries_trimmed": 0,
+    "entries_dropped": 0,
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token); close enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def collect_ancestors(parent_nodes, node_lookup, max_depth=CONTEXT_ANCESTOR_DEPTH):
+    """
+    Walk data.parent_ids from the direct parents through node_lookup ({node_id: node}).
+    Returns [(depth, node)] nearest first, excluding the direct parents themselves;
+    depth 1 is a grandparent of the node being answered.
+    """
+    if not node_lookup or max_depth <= 0:
+        return []
+
+    seen = {node.get("id") for node in parent_nodes}
+    frontier = list(parent_nodes)
+    ancestors = []
+    for depth in range(1, max_depth + 1):
+        next_frontier = []
+        for node in frontier:
+            for parent_id in node.get("data", {}).get("parent_ids", []) or []:
+                if parent_id in seen or parent_id not in node_lookup:
+                    continue
+                seen.add(parent_id)
+                ancestor = node_lookup[parent_id]
+                ancestors.append((depth, ancestor))
+                next_frontier.append(ancestor)
+        frontier = next_frontier
+    return ancestors
+
+
+def fit_context(entries, budget=CONTEXT_TOKEN_BUDGET, summarize=None):
+    """
+    Fit context entries into a token budget and return them as "label: text" strings,
+    in the order given.
+
+    Entries are considered by priority. Each one is kept whole if it fits; otherwise it
+    is replaced by a (cached) summary, trimmed to the remaining budget, or dropped, so
+    the oldest ancestors are the first to lose detail.
+    summarize(text, max_words) generates a summary; at most CONTEXT_MAX_SUMMARIES
+    uncached summaries are generated per call.
+    """
+    remaining = budget
+    summaries_left = CONTEXT_MAX_SUMMARIES
+    fitted = {}
+    counts = {"kept": 0, "summarized": 0, "trimmed": 0, "dropped": 0}
+
+    for index in sorted(range(len(entries)), key=lambda i: entries[i].priority):
+        entry = entries[index]
+        text = entry.text
+        tokens = estimate_tokens(f"{entry.label}: {text}")
+
+        if tokens > remaining:
+            summary = None
+            if entry.node_id:
+                cache_key = hash_key(entry.node_id, text)
+                summary = node_summary_cache.get(cache_key)
+                if summary is None and summarize is not None and summaries_left > 0:
+                    summaries_left -= 1
+                    try:
+                        summary = summarize(text, SUMMARY_MAX_WORDS)
+                        if summary:
+                            node_summary_cache.set(cache_key, summary)
+                    except Exception as e:
+                        print(f"Error summarizing context for node {entry.node_id}: {e}")
+            if summary and estimate_tokens(f"{entry.label}: {summary}") <= remaining:
+                text, tokens = summary, estimate_tokens(f"{entry.label}: {summary}")
+                counts["summarized"] += 1
+            elif remaining >= MIN_TRIMMED_TOKENS + estimate_tokens(entry.label):
+                text = text[:(remaining - estimate_tokens(entry.label) - 1) * 4].rstrip() + "…"
+                tokens = estimate_tokens(f"{entry.label}: {text}")
+                counts["trimmed"] += 1
+            else:
+                counts["dropped"] += 1
+                continue
+        else:
+            counts["kept"] += 1
+
+        remaining -= tokens
+        fitted[index] = f"{entry.label}: {text}"
+
+    _record(budget - remaining, counts)
+    return [fitted[index] for index in sorted(fitted)]
+
+
+def _record(context_tokens, counts):
+    with _telemetry_lock:
+        _telemetry["requests"] += 1
+        _telemetry["context_tokens_total"] += context_tokens
+        _telemetry["context_tokens_max"] = max(_telemetry["context_tokens_max"], context_tokens)
+        for outcome, count in counts.items():
+            _telemetry[f"entries_{outcome}"] += count
+
+
+def context_stats():
+    """Counters for context tokens sent and how entries were fitted."""
+    with _telemetry_lock:
+        stats = dict(_telemetry)
+    stats["context_tokens_avg"] = stats["context_tokens_total"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
@@ -1,11 +1,24 @@
-from google.cloud import firestore
+from src.concurrency import offload
+from src.telemetry import traced
+
+
+# google.cloud.firestore is imported inside each function: it pulls in grpc and
+# protobuf, which is a large share of backend import time on cold start.
+# Calls that reach grpc are wrapped in offload() so they don't block green threads.
+
+
+class StaleDocumentError(Exception):
+    """Raised when a conditional write finds the document changed since it was read."""
 
 
 def start_firestore_project_client(project):
+    from google.cloud import firestore
     db = firestore.Client(project=project)
     return db
 
 
+@traced("firestore.get_document")
+@offload
 def get_document_by_collection_and_id(db, collection_name, doc_id):
     collection = db.collection(collection_name)
     doc_ref = collection.document(doc_id)
@@ -16,6 +29,8 @@ def get_document_by_collection_and_id(db, collection_name, doc_id):
         raise ValueError(f"Document {doc_id} does not exist in {collection_name}")
 
 
+@traced("firestore.save_document")
+@offload
 def save_document_in_collection(db, collection_name, document, doc_id=None):
     collection = db.collection(collection_name)
     
@@ -28,6 +43,7 @@ def save_document_in_collection(db, collection_name, document, doc_id=None):
         return doc_ref.id
 
 
+@offload
 def update_document_in_collection(db, collection_name, document, doc_id):
     collection = db.collection(collection_name)
     
@@ -37,3 +53,89 @@ def update_document_in_collection(db, collection_name, document, doc_id):
         return doc_id
     except:
         raise ValueError(f"Document {doc_id} does not exist in {collection_name}")
+
+
+def field_path(*parts):
+    """Build a Firestore field path, quoting parts such as node ids where needed."""
+    from google.cloud.firestore_v1.field_path import FieldPath
+    return FieldPath(*parts).to_api_repr()
+
+
+@traced("firestore.get_fields")
+@offload
+def get_document_fields(db, collection_name, doc_id, field_paths):
+    """
+    Read only the given field paths of a document.
+    Returns (fields, update_time); update_time can be passed back to
+    update_document_fields to make the write conditional on this read.
+    """
+    collection = db.collection(collection_name)
+    doc = collection.document(doc_id).get(field_paths=field_paths)
+    if not doc.exists:
+        raise ValueError(f"Document {doc_id} does not exist in {collection_name}")
+    return doc.to_dict() or {}, doc.update_time
+
+
+@traced("firestore.update_fields")
+@offload
+def update_document_fields(db, collection_name, doc_id, updates, deleted_fields=(), increments=None, last_update_time=None, transaction=None):
+    """
+    Write individual field paths of a document without touching the rest of it.
+    Fields in deleted_fields are removed and fields in increments are atomically
+    incremented. With last_update_time the write only succeeds if the document
+    has not been written since; otherwise StaleDocumentError is raised.
+    With transaction the write is staged and committed with the transaction.
+    """
+    from google.api_core.exceptions import FailedPrecondition, NotFound
+    from google.cloud import firestore
+
+    document = dict(updates)
+    for path in deleted_fields:
+        document[path] = firestore.DELETE_FIELD
+    for path, amount in (increments or {}).items():
+        document[path] = firestore.Increment(amount)
+
+    option = db.write_option(last_update_time=last_update_time) if last_update_time else None
+    doc_ref = db.collection(collection_name).document(doc_id)
+    if transaction is not None:
+        transaction.update(doc_ref, document, option=option)
+        return doc_id
+
+    try:
+        doc_ref.update(document, option=option)
+    except FailedPrecondition:
+        raise StaleDocumentError(f"Document {doc_id} in {collection_name} was modified concurrently")
+    except NotFound:
+        raise ValueError(f"Document {doc_id} does not exist in {collection_name}")
+    return doc_id
+
+
+@traced("firestore.transaction")
+@offload
+def transact_document(db, collection_name, doc_id, update_fn):
+    """
+    Read-modify-write a document in a single transaction.
+    update_fn(document, transaction) receives the current document (None if it
+    does not exist) and returns (new_document, result); new_document replaces the
+    stored one. update_fn may stage further writes on the transaction and may be
+    retried on contention, so it must not have other side effects.
+    Returns result.
+    """
+    from google.api_core.exceptions import FailedPrecondition, NotFound
+    from google.cloud import firestore
+
+    doc_ref = db.collection(collection_name).document(doc_id)
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        document, result = update_fn(snapshot.to_dict() if snapshot.exists else None, transaction)
+        transaction.set(doc_ref, document)
+        return result
+
+    try:
+        return run(db.transaction())
+    except FailedPrecondition:
+        raise StaleDocumentError(f"Transaction on {doc_id} in {collection_name} hit a concurrent write")
+    except NotFound as e:
+        raise ValueError(str(e))
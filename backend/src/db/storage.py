@@ -1,10 +1,81 @@
 import base64
+import hashlib
+import io
+import os
+import queue
 import re
-from google.cloud import storage
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from src.cache import TieredCache
+from src.concurrency import offload
+from src.telemetry import traced
+
+
+GCS_UPLOAD_CONCURRENCY = int(os.getenv("GCS_UPLOAD_CONCURRENCY", "8"))
+GCS_UPLOAD_RETRIES = int(os.getenv("GCS_UPLOAD_RETRIES", "2"))
+GCS_BATCH_SIZE = 100
+# Resumable upload chunk size; GCS requires a multiple of 256 KiB
+GCS_RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+DATA_URL_HEADER_MAX_LENGTH = 256
+
+# Media types accepted for direct uploads, with the extension used for their blob
+MEDIA_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "video/mp4": "mp4",
+    "video/webm": "webm",
+    "video/quicktime": "mov",
+    "video/x-msvideo": "avi",
+}
+# Derived copies stored next to each uploaded image (see upload_image_variants):
+# name -> (longest side in pixels or None for full size, Pillow format, save options).
+# Image nodes render 600px wide; gemma3n's vision encoder takes at most 768x768.
+IMAGE_THUMB_MAX_SIDE = int(os.getenv("IMAGE_THUMB_MAX_SIDE") or "640")
+IMAGE_MODEL_MAX_SIDE = int(os.getenv("IMAGE_MODEL_MAX_SIDE") or "768")
+IMAGE_VARIANTS = {
+    "thumb": (IMAGE_THUMB_MAX_SIDE, "WEBP", {"quality": 80, "method": 4}),
+    "model": (IMAGE_MODEL_MAX_SIDE, "JPEG", {"quality": 85, "optimize": True}),
+    "webp": (None, "WEBP", {"quality": 85, "method": 4}),
+    "avif": (None, "AVIF", {"quality": 60}),
+}
+IMAGE_VARIANT_FORMATS = {
+    "WEBP": ("webp", "image/webp"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "AVIF": ("avif", "image/avif"),
+}
+# Directly uploaded images larger than this keep only their original
+IMAGE_VARIANT_SOURCE_MAX_BYTES = 50 * 1024 * 1024
+# Decoding takes 4 bytes a pixel, however well the file compresses: sources above
+# this many pixels keep only their original, and above the full-size limit only
+# their downscaled variants are made
+IMAGE_VARIANT_SOURCE_MAX_PIXELS = 40_000_000
+IMAGE_VARIANT_FULL_SIZE_MAX_PIXELS = 16_000_000
+SIGNED_UPLOAD_URL_EXPIRATION = timedelta(minutes=int(os.getenv("SIGNED_UPLOAD_URL_MINUTES", "15")))
+# Service account that signs upload URLs through the IAM API when the default
+# credentials hold no private key (App Engine, Cloud Run, local user ADC)
+GCS_SIGNING_SERVICE_ACCOUNT = os.getenv("GCS_SIGNING_SERVICE_ACCOUNT")
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+# Content-addressed copies of media sent to models. Not tracked by canvas blob
+# manifests; expire them with a bucket lifecycle rule longer than MODEL_MEDIA_CACHE_TTL.
+MODEL_MEDIA_PREFIX = "gemini-media"
+HASH_CHUNK_SIZE = 1024 * 1024
+model_media_cache = TieredCache(
+    "model_media",
+    maxsize=1024,
+    ttl=int(os.getenv("MODEL_MEDIA_CACHE_TTL", str(24 * 3600))),
+)
 
 
 def start_storage_client(project: str):
     """Initialize and return a GCS client."""
+    from google.cloud import storage
     return storage.Client(project=project)
 
 
@@ -13,6 +84,7 @@ def is_base64_data_url(value: str) -> bool:
     return isinstance(value, str) and value.startswith("data:")
 
 
+@traced("gcs.upload_image")
 def upload_base64_image(storage_client, bucket_name: str, blob_path: str, data_url: str) -> str:
     """
     Upload a base64 data URL to GCS and return the public URL.
@@ -26,23 +98,203 @@ def upload_base64_image(storage_client, bucket_name: str, blob_path: str, data_u
     Returns:
         Public URL string
     """
+    content_type, image_data = decode_image_data_url(data_url)
+
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(blob_path)
+    blob.upload_from_string(image_data, content_type=content_type)
+
+    return f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
+
+
+def decode_image_data_url(data_url: str):
+    """Return (content_type, image_bytes) of a base64 image data URL."""
     match = re.match(r"data:(image/\w+);base64,(.+)", data_url, re.DOTALL)
     if not match:
         raise ValueError("Invalid data URL format")
+    return match.group(1), base64.b64decode(match.group(2))
+
 
-    content_type = match.group(1)
-    image_data = base64.b64decode(match.group(2))
+def upload_base64_image_with_variants(storage_client, bucket_name: str, blob_path: str, data_url: str):
+    """
+    upload_base64_image, plus its IMAGE_VARIANTS stored next to it.
 
+    Returns:
+        (public_url, {variant_name: public_url}); variants are best effort, so a
+        failure to create them leaves the dict empty rather than failing the upload
+    """
+    public_url = upload_base64_image(storage_client, bucket_name, blob_path, data_url)
+    try:
+        variants = upload_image_variants(storage_client, bucket_name, blob_path, decode_image_data_url(data_url)[1])
+    except Exception as e:
+        print(f"Error creating image variants for {blob_path}: {e}")
+        variants = {}
+    return public_url, variants
+
+
+@offload
+def render_image_variants(image_data: bytes) -> dict:
+    """
+    Encode the IMAGE_VARIANTS of an image: {name: (bytes, extension, content_type)}.
+    Variants that come out no smaller than the original are left out, as are
+    formats this Pillow build can't write (AVIF needs libavif support) and
+    animated images, whose still frames wouldn't stand in for them.
+    Sources are checked against the pixel limits before they are decoded.
+    Runs in eventlet's OS thread pool, since encoding doesn't yield.
+    """
+    from PIL import Image, ImageOps, features
+
+    with Image.open(io.BytesIO(image_data)) as source:
+        if getattr(source, "is_animated", False):
+            return {}
+        pixels = source.width * source.height
+        if pixels > IMAGE_VARIANT_SOURCE_MAX_PIXELS:
+            return {}
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    for name, (max_side, image_format, options) in IMAGE_VARIANTS.items():
+        if image_format == "AVIF" and not features.check("avif"):
+            continue
+        if not max_side and pixels > IMAGE_VARIANT_FULL_SIZE_MAX_PIXELS:
+            continue
+        variant = image
+        if max_side and max(image.size) > max_side:
+            variant = image.copy()
+            variant.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == "JPEG" and has_alpha:
+            # JPEG has no alpha channel; flatten onto white like the canvas background
+            flattened = Image.new("RGB", variant.size, "white")
+            flattened.paste(variant, mask=variant.getchannel("A"))
+            variant = flattened
+
+        buffer = io.BytesIO()
+        variant.save(buffer, format=image_format, **options)
+        if buffer.tell() < len(image_data):
+            extension, content_type = IMAGE_VARIANT_FORMATS[image_format]
+            variants[name] = (buffer.getvalue(), extension, content_type)
+    return variants
+
+
+def image_variant_blob_path(blob_path: str, name: str, extension: str) -> str:
+    """Where a variant of blob_path is stored: "canvases/c/n.png" -> "canvases/c/n_thumb.webp"."""
+    return f"{blob_path.rsplit('.', 1)[0]}_{name}.{extension}"
+
+
+@traced("gcs.upload_image_variants")
+def upload_image_variants(storage_client, bucket_name: str, blob_path: str, image_data: bytes) -> dict:
+    """
+    Create the IMAGE_VARIANTS of an image stored at blob_path and upload them next to it.
+
+    Returns:
+        {variant_name: public_url} for the variants that were worth keeping
+    """
     bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    blob.upload_from_string(image_data, content_type=content_type)
+    public_urls = {}
+    for name, (data, extension, content_type) in render_image_variants(image_data).items():
+        variant_path = image_variant_blob_path(blob_path, name, extension)
+        bucket.blob(variant_path).upload_from_string(data, content_type=content_type)
+        public_urls[name] = f"https://storage.googleapis.com/{bucket_name}/{variant_path}"
+    return public_urls
 
-    return f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
 
+@traced("gcs.create_image_variants")
+def create_image_variants(storage_client, bucket_name: str, blob_path: str, size: int) -> dict:
+    """
+    upload_image_variants for an image already in GCS (e.g. a direct upload), best effort.
+
+    Returns:
+        {variant_name: public_url}, empty if the image is too large or variants failed
+    """
+    if size > IMAGE_VARIANT_SOURCE_MAX_BYTES:
+        return {}
+    try:
+        image_data = storage_client.bucket(bucket_name).blob(blob_path).download_as_bytes()
+        return upload_image_variants(storage_client, bucket_name, blob_path, image_data)
+    except Exception as e:
+        print(f"Error creating image variants for {blob_path}: {e}")
+        return {}
+
+
+def parse_data_url_header(data_url: str, pattern: str):
+    """
+    Parse the header of a base64 data URL without scanning its payload.
+
+    Args:
+        data_url: base64 data URL string
+        pattern: regex the media type must fully match (e.g., r"video/[\w.+-]+")
+
+    Returns:
+        (content_type, payload_offset) where payload_offset is the index of the first base64 character
+    """
+    comma = data_url.find(",", 0, DATA_URL_HEADER_MAX_LENGTH)
+    match = re.fullmatch(rf"data:({pattern});base64", data_url[:comma]) if comma != -1 else None
+    if not match:
+        raise ValueError("Invalid data URL format")
+    return match.group(1), comma + 1
+
+
+class Base64PayloadReader:
+    """
+    Read-only, seekable file-like view of the decoded payload of a base64 data URL.
+    Decodes only the slice needed for each read, so peak memory is bounded by
+    the read size rather than the payload size.
+    """
+
+    def __init__(self, data_url: str, payload_offset: int):
+        self._data_url = data_url
+        self._payload_offset = payload_offset
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._decoded_length()
+        self._position = max(offset, 0)
+        return self._position
+
+    def _decoded_length(self):
+        encoded_length = len(self._data_url) - self._payload_offset
+        # Padding is at most "==", so only look at the tail instead of copying the payload
+        padding = self._data_url[-2:].count("=") if encoded_length >= 2 else 0
+        return encoded_length // 4 * 3 - padding
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._decoded_length() - self._position
+        if size <= 0:
+            return b""
+
+        # Every 4 base64 characters decode to 3 bytes, so start at the enclosing group
+        group, skip = divmod(self._position, 3)
+        start = self._payload_offset + group * 4
+        end = start + ((skip + size + 2) // 3) * 4
+        data = base64.b64decode(self._data_url[start:end])[skip:skip + size]
+        self._position += len(data)
+        return data
 
+    def close(self):
+        pass
+
+
+@traced("gcs.upload_video")
 def upload_base64_video(storage_client, bucket_name: str, blob_path: str, data_url: str) -> str:
     """
     Upload a base64 video data URL to GCS and return the public URL.
+    The payload is decoded in chunks and streamed to a resumable upload, so no
+    decoded copy of the whole video is ever held in memory.
 
     Args:
         storage_client: GCS client
@@ -53,20 +305,91 @@ def upload_base64_video(storage_client, bucket_name: str, blob_path: str, data_u
     Returns:
         Public URL string
     """
-    match = re.match(r"data:(video/[\w.+-]+);base64,(.+)", data_url, re.DOTALL)
-    if not match:
+    try:
+        content_type, payload_offset = parse_data_url_header(data_url, r"video/[\w.+-]+")
+    except ValueError:
         raise ValueError("Invalid video data URL format")
 
-    content_type = match.group(1)
-    video_data = base64.b64decode(match.group(2))
-
     bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    blob.upload_from_string(video_data, content_type=content_type)
+    blob = bucket.blob(blob_path, chunk_size=GCS_RESUMABLE_CHUNK_SIZE)
+    blob.upload_from_file(Base64PayloadReader(data_url, payload_offset), content_type=content_type)
 
     return f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
 
 
+class SigningUnavailable(Exception):
+    """Raised when the server's credentials cannot sign upload URLs."""
+
+
+@lru_cache(maxsize=1)
+def signing_credentials():
+    """
+    Credentials that can sign URLs: the default credentials when they hold a private
+    key, otherwise a google.auth IAM signer acting as GCS_SIGNING_SERVICE_ACCOUNT
+    (or the default service account of the runtime). The default credentials need
+    roles/iam.serviceAccountTokenCreator on that account.
+    """
+    import google.auth
+    import google.auth.exceptions
+    from google.auth import iam
+    from google.auth.credentials import Signing
+    from google.auth.transport.requests import Request as AuthRequest
+    from google.oauth2 import service_account
+
+    try:
+        credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+    except google.auth.exceptions.DefaultCredentialsError as e:
+        raise SigningUnavailable(str(e))
+    if isinstance(credentials, Signing):
+        return credentials
+
+    request = AuthRequest()
+    email = GCS_SIGNING_SERVICE_ACCOUNT or getattr(credentials, "service_account_email", None)
+    if email == "default":
+        # Compute credentials only learn their account's address on refresh
+        credentials.refresh(request)
+        email = credentials.service_account_email
+    if not email:
+        raise SigningUnavailable("Default credentials cannot sign URLs; set GCS_SIGNING_SERVICE_ACCOUNT")
+
+    signer = iam.Signer(request, credentials, email)
+    return service_account.Credentials(signer, email, token_uri="https://oauth2.googleapis.com/token")
+
+
+@traced("gcs.sign_upload_url")
+def generate_signed_upload_url(storage_client, bucket_name: str, blob_path: str, content_type: str) -> str:
+    """
+    Create a V4 signed URL that starts a resumable upload of blob_path.
+
+    The client POSTs to the URL with headers `x-goog-resumable: start` and the same
+    Content-Type, then PUTs the file to the session URI returned in the Location header.
+    Raises SigningUnavailable when no credentials can sign (see signing_credentials).
+
+    Returns:
+        Signed URL string
+    """
+    blob = storage_client.bucket(bucket_name).blob(blob_path)
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=SIGNED_UPLOAD_URL_EXPIRATION,
+        method="POST",
+        content_type=content_type,
+        headers={"x-goog-resumable": "start"},
+        credentials=signing_credentials(),
+    )
+
+
+@traced("gcs.get_metadata")
+def get_blob_metadata(storage_client, bucket_name: str, blob_path: str):
+    """
+    Return {"content_type", "size", "generation"} for an existing blob, or None if it does not exist.
+    """
+    blob = storage_client.bucket(bucket_name).get_blob(blob_path)
+    if blob is None:
+        return None
+    return {"content_type": blob.content_type, "size": blob.size, "generation": blob.generation}
+
+
 def get_video_extension(data_url: str) -> str:
     """Infer extension from a video data URL."""
     if data_url.startswith("data:video/webm"):
@@ -78,9 +401,94 @@ def get_video_extension(data_url: str) -> str:
     return "mp4"
 
 
-def upload_parent_videos(parent_nodes, canvas_id: str, gcs_client, bucket_name: str):
+def _upload_with_retries(upload_fn, storage_client, bucket_name: str, blob_path: str, data_url: str, retries: int) -> str:
+    for attempt in range(retries + 1):
+        try:
+            return upload_fn(storage_client, bucket_name, blob_path, data_url)
+        except ValueError:
+            # Malformed data URLs will not succeed on retry
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
+@traced("gcs.upload_batch")
+def upload_data_urls(storage_client, bucket_name: str, uploads: dict, max_workers: int = None, retries: int = None) -> dict:
+    """
+    Upload many base64 data URLs to GCS concurrently, retrying each blob independently.
+
+    Args:
+        storage_client: GCS client
+        bucket_name: GCS bucket name
+        uploads: dict mapping a caller-chosen key to (upload_fn, blob_path, data_url),
+            where upload_fn is upload_base64_image, upload_base64_image_with_variants
+            or upload_base64_video
+        max_workers: max concurrent uploads (defaults to GCS_UPLOAD_CONCURRENCY)
+        retries: retries per blob after the first attempt (defaults to GCS_UPLOAD_RETRIES)
+
+    Returns:
+        dict mapping each key to (result, None) on success or (None, exception) on failure,
+        where result is what upload_fn returned (the public URL, or for images with
+        variants a (public_url, variants) pair)
+    """
+    if not uploads:
+        return {}
+
+    max_workers = min(max_workers or GCS_UPLOAD_CONCURRENCY, len(uploads))
+    retries = GCS_UPLOAD_RETRIES if retries is None else retries
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            key: executor.submit(
+                _upload_with_retries, upload_fn, storage_client, bucket_name, blob_path, data_url, retries
+            )
+            for key, (upload_fn, blob_path, data_url) in uploads.items()
+        }
+        for key, future in futures.items():
+            try:
+                results[key] = (future.result(), None)
+            except Exception as e:
+                results[key] = (None, e)
+    return results
+
+
+def model_media_blob_path(data_url: str) -> str:
+    """Content-addressed blob path for a base64 video sent to a model."""
+    # Hashed a chunk at a time so a large video isn't copied whole; data URLs are
+    # ASCII, so this is the digest of data_url.encode()
+    digest = hashlib.sha256()
+    for start in range(0, len(data_url), HASH_CHUNK_SIZE):
+        digest.update(data_url[start:start + HASH_CHUNK_SIZE].encode("ascii"))
+    digest = digest.hexdigest()
+    return f"{MODEL_MEDIA_PREFIX}/{digest}.{get_video_extension(data_url)}"
+
+
+def upload_model_video(storage_client, bucket_name: str, blob_path: str, data_url: str) -> str:
+    """
+    Upload a base64 video to its content-addressed blob_path (see model_media_blob_path)
+    unless it is already there, and return the public URL.
+    """
+    cache_key = f"{bucket_name}/{blob_path}"
+    public_url = model_media_cache.get(cache_key)
+    if public_url is not None:
+        return public_url
+
+    if storage_client.bucket(bucket_name).blob(blob_path).exists():
+        public_url = f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
+    else:
+        public_url = upload_base64_video(storage_client, bucket_name, blob_path, data_url)
+    model_media_cache.set(cache_key, public_url)
+    return public_url
+
+
+@traced("gcs.upload_parent_videos")
+def upload_parent_videos(parent_nodes, gcs_client, bucket_name: str):
     """
     Upload any base64 parent video nodes and replace URLs in-place with public GCS URLs.
+    Videos are stored by content hash, so a video already sent once is not uploaded again.
     """
     video_nodes = [
         node for node in (parent_nodes or [])
@@ -88,29 +496,66 @@ def upload_parent_videos(parent_nodes, canvas_id: str, gcs_client, bucket_name:
         and is_base64_data_url(node.get("data", {}).get("videoDataUrl", ""))
     ]
 
-    for node in video_nodes:
+    uploads = {}
+    for index, node in enumerate(video_nodes):
         video_data_url = node.get("data", {}).get("videoDataUrl", "")
-        ext = get_video_extension(video_data_url)
-        blob_path = f"canvases/{canvas_id}/{node['id']}.{ext}"
-        try:
-            public_url = upload_base64_video(
-                gcs_client, bucket_name, blob_path, video_data_url
-            )
+        uploads[index] = (upload_model_video, model_media_blob_path(video_data_url), video_data_url)
+
+    results = upload_data_urls(gcs_client, bucket_name, uploads)
+    for index, (public_url, error) in results.items():
+        node = video_nodes[index]
+        if error is not None:
+            print(f"Error uploading parent video for node {node['id']}: {error}")
+        else:
             node["data"]["videoDataUrl"] = public_url
-        except Exception as e:
-            print(f"Error uploading parent video for node {node['id']}: {e}")
 
 
-def delete_blobs(storage_client, bucket_name: str, blob_paths: list[str]):
+@traced("gcs.delete_blobs")
+def delete_blobs(storage_client, bucket_name: str, blob_paths: list[str], defer: bool = False):
     """
-    Delete multiple blobs from GCS.
+    Delete multiple blobs from GCS using batch requests of up to GCS_BATCH_SIZE deletes.
+    Blobs that no longer exist are ignored.
 
     Args:
         storage_client: GCS client
         bucket_name: GCS bucket name
         blob_paths: list of paths within bucket to delete
+        defer: hand the deletion to the background cleanup worker and return immediately
     """
+    if not blob_paths:
+        return
+    if defer:
+        _start_cleanup_worker()
+        _cleanup_queue.put((storage_client, bucket_name, list(blob_paths)))
+        return
+
     bucket = storage_client.bucket(bucket_name)
-    for path in blob_paths:
-        blob = bucket.blob(path)
-        blob.delete()
+    for start in range(0, len(blob_paths), GCS_BATCH_SIZE):
+        # raise_exception=False so a 404 for an already-missing blob doesn't fail the batch
+        with storage_client.batch(raise_exception=False):
+            for path in blob_paths[start:start + GCS_BATCH_SIZE]:
+                bucket.blob(path).delete()
+
+
+_cleanup_queue = queue.Queue()
+_cleanup_worker = None
+_cleanup_worker_lock = threading.Lock()
+
+
+def _start_cleanup_worker():
+    global _cleanup_worker
+    with _cleanup_worker_lock:
+        if _cleanup_worker is None or not _cleanup_worker.is_alive():
+            _cleanup_worker = threading.Thread(target=_run_cleanup_worker, daemon=True)
+            _cleanup_worker.start()
+
+
+def _run_cleanup_worker():
+    while True:
+        storage_client, bucket_name, blob_paths = _cleanup_queue.get()
+        try:
+            delete_blobs(storage_client, bucket_name, blob_paths)
+        except Exception as e:
+            print(f"Error deleting blobs in background cleanup: {e}")
+        finally:
+            _cleanup_queue.task_done()
@@ -0,0 +1,295 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from src.cache import get_redis_client
+from src.rate_limit import ProviderOverloaded
+
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS") or "4")
+# Queued plus running jobs allowed per user before submissions are rejected
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER") or "3")
+# How long job records (and results) are kept, in seconds
+JOB_TTL = int(os.getenv("JOB_TTL") or "3600")
+JOB_POLL_INTERVAL = 0.2
+
+
+def job_room(job_id):
+    return f"job:{job_id}"
+
+
+class InMemoryJobStore:
+    """Job records and queue for a single process (local development and tests)."""
+
+    shared = False
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            # Forget finished jobs after JOB_TTL, like the Redis store
+            expired = [
+                job_id for job_id, record in self._jobs.items()
+                if record.get("finishedAt") and time.time() - record["finishedAt"] > JOB_TTL
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def enqueue(self, task):
+        self._queue.put(task)
+
+    def dequeue(self):
+        try:
+            return self._queue.get(timeout=JOB_POLL_INTERVAL)
+        except queue.Empty:
+            return None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def acquire_slot(self, user, limit):
+        with self._lock:
+            if self._active.get(user, 0) >= limit:
+                return False
+            self._active[user] = self._active.get(user, 0) + 1
+            return True
+
+    def release_slot(self, user):
+        with self._lock:
+            self._active[user] = max(self._active.get(user, 0) - 1, 0)
+            if not self._active[user]:
+                del self._active[user]
+
+
+class RedisJobStore:
+    """
+    Job records and queue shared by every instance through Redis.
+    Delivery is at most once: a task leaves the queue when a worker takes it, so a
+    job whose instance dies mid-run is lost. Its record stays "running" until it
+    expires and the user's slot comes back when the counter does (JOB_TTL).
+    """
+
+    shared = True
+
+    QUEUE_KEY = "polylogue:jobs:queue"
+
+    def __init__(self, client):
+        self.client = client
+
+    def save(self, job):
+        self.client.set(f"polylogue:job:{job['id']}", json.dumps(job), ex=JOB_TTL)
+
+    def get(self, job_id):
+        raw = self.client.get(f"polylogue:job:{job_id}")
+        return json.loads(raw) if raw else None
+
+    def enqueue(self, task):
+        self.client.lpush(self.QUEUE_KEY, json.dumps(task))
+
+    def dequeue(self):
+        # Polled rather than BRPOP, which would outlive the client's short socket timeout
+        raw = self.client.rpop(self.QUEUE_KEY)
+        if raw is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            return None
+        return json.loads(raw)
+
+    def queue_depth(self):
+        return self.client.llen(self.QUEUE_KEY)
+
+    def acquire_slot(self, user, limit):
+        key = f"polylogue:jobs:active:{user}"
+        active = self.client.incr(key)
+        # Expire the counter so slots leaked by a crashed instance come back
+        self.client.expire(key, JOB_TTL)
+        if active > limit:
+            self.client.decr(key)
+            return False
+        return True
+
+    def release_slot(self, user):
+        self.client.decr(f"polylogue:jobs:active:{user}")
+
+
+def create_job_store():
+    """Redis-backed store when REDIS_URL is set, otherwise in-process."""
+    client = get_redis_client()
+    return RedisJobStore(client) if client is not None else InMemoryJobStore()
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Runs slow operations (image generation, video analysis) outside of request
+    workers. submit() stores a job and returns its id immediately; a pool of
+    JOB_WORKERS background workers per instance executes queued jobs with the
+    handler registered for their kind, inside an app context.
+    When a job finishes, `job_done` is emitted with the job record to the
+    job's room (see job_room) and to the submitting socket, if one was given.
+    Workers start on the first submit, or at startup (start()) when the queue
+    is shared, so every instance helps drain it.
+    """
+
+    def __init__(self, app, socketio, store, workers=JOB_WORKERS, max_per_user=JOB_MAX_PER_USER):
+        self.app = app
+        self.socketio = socketio
+        self.store = store
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._metrics = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "running": 0,
+            "wait_seconds_total": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    def register(self, kind, handler):
+        """handler(payload) returns the job's JSON serializable result."""
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload, user, socket_id=None):
+        """
+        Queue a job and return its record.
+        Raises JobLimitExceeded when the user already has max_per_user jobs queued or running.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if not self.store.acquire_slot(user, self.max_per_user):
+            self._count("rejected")
+            raise JobLimitExceeded(f"At most {self.max_per_user} jobs may be queued or running at once")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "user": user,
+            "socketId": socket_id,
+            "nodeId": payload.get("nodeId"),
+            "createdAt": time.time(),
+            "startedAt": None,
+            "finishedAt": None,
+            "result": None,
+            "error": None,
+        }
+        try:
+            self.store.save(job)
+            self.store.enqueue({"id": job["id"], "kind": kind, "user": user, "payload": payload})
+        except Exception:
+            self.store.release_slot(user)
+            raise
+        self._count("submitted")
+        self.ensure_workers()
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def start(self):
+        """Start workers now if the store is shared; call once handlers are registered."""
+        if self.store.shared:
+            self.ensure_workers()
+
+    def ensure_workers(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _count(self, metric, amount=1):
+        with self._lock:
+            self._metrics[metric] += amount
+
+    def _run(self):
+        while True:
+            try:
+                task = self.store.dequeue()
+            except Exception as e:
+                print(f"Error reading job queue: {e}")
+                time.sleep(1)
+                continue
+            if task is None:
+                continue
+            try:
+                self._execute(task)
+            except Exception as e:
+                print(f"Error executing job {task.get('id')}: {e}")
+
+    def _execute(self, task):
+        job = self.store.get(task["id"])
+        if job is None:
+            # The record expired while queued; its slot is still held
+            if "user" in task:
+                self.store.release_slot(task["user"])
+            return
+
+        job["status"] = "running"
+        job["startedAt"] = time.time()
+        self.store.save(job)
+        self._count("running")
+        self._count("wait_seconds_total", job["startedAt"] - job["createdAt"])
+
+        try:
+            with self.app.app_context():
+                job["result"] = self.handlers[task["kind"]](task["payload"])
+            job["status"] = "done"
+        except ValueError as e:
+            job["status"], job["error"] = "failed", "Input Error"
+        except ProviderOverloaded as e:
+            job["status"], job["error"] = "failed", "Overloaded"
+        except Exception as e:
+            print(f"Error running {task['kind']} job {job['id']}: {e}")
+            job["status"], job["error"] = "failed", "Internal Server Error"
+        finally:
+            job["finishedAt"] = time.time()
+            self._count("running", -1)
+            self._count("completed" if job["status"] == "done" else "failed")
+            self._count("run_seconds_total", job["finishedAt"] - job["startedAt"])
+            self.store.release_slot(job["user"])
+
+        try:
+            self.store.save(job)
+            self.socketio.emit("job_done", public_job(job), to=job_room(job["id"]))
+            if job["socketId"]:
+                self.socketio.emit("job_done", public_job(job), to=job["socketId"])
+        except Exception as e:
+            print(f"Error publishing job {job['id']}: {e}")
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        try:
+            metrics["queue_depth"] = self.store.queue_depth()
+        except Exception as e:
+            print(f"Error reading job queue depth: {e}")
+            metrics["queue_depth"] = None
+        metrics["workers"] = self.workers if self._started else 0
+        return metrics
+
+
+def public_job(job):
+    """The job record as returned to clients."""
+    return {key: value for key, value in job.items() if key not in ("user", "socketId")}
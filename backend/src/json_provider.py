@@ -0,0 +1,86 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from src.telemetry import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Datetimes go through _default so they keep Flask's HTTP-date format;
+# non-str keys are stringified like the stdlib encoder does
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+STREAM_BATCH_SIZE = 200
+
+
+def _default(o):
+    """Encode values JSON has no type for, matching Flask's default provider."""
+    if isinstance(o, date):
+        # Also covers Firestore's DatetimeWithNanoseconds, a datetime subclass
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serialize obj to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, falling back to the stdlib
+    provider when orjson is unavailable. Keys are not sorted.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        with span("json.serialize"):
+            body = dumps_bytes(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def iter_json_document(envelope_key, document, items_key, batch_size=STREAM_BATCH_SIZE):
+    """
+    Encode {envelope_key: document} incrementally, yielding the list at
+    document[items_key] in batches so large payloads are never encoded in one piece.
+    The concatenated output is the same JSON as dumps_bytes({envelope_key: document}),
+    with items_key moved to the end of the document.
+    """
+    items = document[items_key]
+    head = {key: value for key, value in document.items() if key != items_key}
+    head[items_key] = []
+    encoded_head = dumps_bytes({envelope_key: head})
+    # encoded_head ends with `[]}}`: emit up to the `[`, then the items, then `]}}`
+    yield encoded_head[:-3]
+    for start in range(0, len(items), batch_size):
+        batch = b",".join(dumps_bytes(item) for item in items[start:start + batch_size])
+        yield batch if start == 0 else b"," + batch
+    yield encoded_head[-3:]
@@ -0,0 +1,24 @@
+import threading
+
+
+class LazyClient:
+    """
+    Stand-in for an SDK client that is only constructed on first use.
+    Attribute access is forwarded to the real client, so callers can use it as-is.
+    """
+
+    def __init__(self, create):
+        self._create = create
+        self._client = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Return the real client, creating it if needed."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
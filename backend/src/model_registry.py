@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import httpx
+
+
+# Built-in models. More can be added without code changes through
+# MODEL_CONFIG_PATH (a JSON file) or MODEL_CONFIG (inline JSON), both shaped like this dict.
+# Providers:
+#   together_chat:  chat model served through ChatTogether; resolved by get_model
+#   together_image: image model called through the shared Together client
+# context_budget is the token budget for parent/ancestor context (see src/context_builder.py)
+DEFAULT_MODEL_CONFIGS = {
+    "gemma3n_4b": {
+        "provider": "together_chat",
+        "model": "google/gemma-3n-E4B-it",
+        "temperature": 0.7,
+        "context_budget": 4000,
+    },
+    "qwen3_8b": {
+        "provider": "together_chat",
+        "model": "Qwen/Qwen3-VL-8B-Instruct",
+        "temperature": 0.7,
+        "context_budget": 6000,
+    },
+    "google/flash-image-2.5": {
+        "provider": "together_image",
+        "model": "google/flash-image-2.5",
+        "context_budget": 1000,
+    },
+    "openai/gpt-image-1.5": {
+        "provider": "together_image",
+        "model": "openai/gpt-image-1.5",
+        "context_budget": 1000,
+    },
+}
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "16"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+
+def load_model_configs():
+    """Merge the built-in model configs with any from MODEL_CONFIG_PATH / MODEL_CONFIG."""
+    configs = {name: dict(config) for name, config in DEFAULT_MODEL_CONFIGS.items()}
+    config_path = os.getenv("MODEL_CONFIG_PATH")
+    if config_path:
+        with open(config_path) as f:
+            configs.update(json.load(f))
+    if os.getenv("MODEL_CONFIG"):
+        configs.update(json.loads(os.environ["MODEL_CONFIG"]))
+    return configs
+
+
+def _create_together_chat(config, http_client):
+    from langchain_together import ChatTogether
+    return ChatTogether(
+        model=config["model"],
+        together_api_key=os.getenv("TOGETHER_API_KEY"),
+        temperature=config.get("temperature", 0.7),
+        http_client=http_client,
+    )
+
+
+MODEL_FACTORIES = {
+    "together_chat": _create_together_chat,
+}
+
+
+class ModelRegistry:
+    """
+    Lazily creates and reuses model and SDK clients; the SDKs themselves are
+    only imported when their first client is created.
+    Chat models share one size-limited keep-alive HTTP connection pool, and the
+    Together and Gemini clients are created once per process, so requests don't
+    pay connection and TLS setup.
+    """
+
+    def __init__(self, configs):
+        self.configs = configs
+        self._models = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, config):
+        """Add or replace a model config; the model is created on first use."""
+        with self._lock:
+            self.configs[name] = config
+            self._models.pop(name, None)
+
+    def names(self, provider=None):
+        return [name for name, config in self.configs.items() if provider is None or config["provider"] == provider]
+
+    def config(self, name):
+        if name not in self.configs:
+            raise ValueError(f"Unsupported model type: {name}")
+        return self.configs[name]
+
+    def get(self, name):
+        """Return the chat model for name, creating it on first use."""
+        config = self.config(name)
+        factory = MODEL_FACTORIES.get(config["provider"])
+        if factory is None:
+            raise ValueError(f"Unsupported model type: {name}")
+
+        model = self._models.get(name)
+        if model is None:
+            # Outside the lock: http_client() takes it too
+            http_client = self.http_client()
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = factory(config, http_client)
+                    self._models[name] = model
+        return model
+
+    def _client(self, key, create):
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = create()
+                    self._clients[key] = client
+        return client
+
+    def http_client(self):
+        """Shared httpx client with a bounded keep-alive connection pool."""
+        return self._client("http", lambda: httpx.Client(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(120, connect=10),
+        ))
+
+    def together_client(self):
+        from together import Together
+        return self._client("together", lambda: Together(api_key=os.getenv("TOGETHER_API_KEY")))
+
+    def gemini_client(self):
+        from google import genai
+        return self._client("gemini", lambda: genai.Client(
+            vertexai=True,
+            project=os.getenv("GCP_PROJECT"),
+            location=os.getenv("GEMINI_LOCATION", "us-central1"),
+        ))
+
+
+model_registry = ModelRegistry(load_model_configs())
@@ -0,0 +1,52 @@
+import threading
+from collections import deque
+
+
+class SuggestionPool:
+    """
+    A pool of pre-generated answers to a fixed, context-free prompt.
+    get() pops a ready answer in O(1); whenever the pool drops below
+    low_watermark a single background thread refills it to size.
+    """
+
+    def __init__(self, generate, size=8, low_watermark=3):
+        self._generate = generate
+        self.size = size
+        self.low_watermark = low_watermark
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def get(self):
+        """Return a pooled suggestion, or None if the pool is empty."""
+        with self._lock:
+            item = self._items.popleft() if self._items else None
+            needs_refill = len(self._items) < self.low_watermark
+        if needs_refill:
+            self.refill()
+        return item
+
+    def refill(self):
+        """Start a background refill unless one is already running."""
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            while len(self._items) < self.size:
+                suggestion = self._generate()
+                if not suggestion:
+                    break
+                with self._lock:
+                    self._items.append(suggestion)
+        except Exception as e:
+            print(f"Error refilling suggestion pool: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+from src.telemetry import rate_limit_events
+
+
+# Longest a request waits for its turn before failing fast with ProviderOverloaded
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT") or "2")
+# After a provider 429 the rate is halved, down to this fraction of the configured rate,
+# and recovers by RATE_RECOVERY_STEP of it per successful call
+RATE_MIN_FRACTION = 0.1
+RATE_RECOVERY_STEP = 0.05
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 30.0
+
+# Requests per second and burst size per provider, overridable with
+# RATE_LIMIT_<PROVIDER>_RPS / RATE_LIMIT_<PROVIDER>_BURST
+DEFAULT_PROVIDER_LIMITS = {
+    "together": (10, 20),
+    "gemini": (5, 10),
+}
+
+
+class ProviderOverloaded(Exception):
+    """Raised instead of calling a provider that is rate limiting us; retry_after is in seconds."""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} is overloaded, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket that queues callers for up to max_wait and adapts to the provider:
+    a 429 halves the rate and pauses calls for the provider's Retry-After (or an
+    exponential backoff); each success restores a step of the configured rate.
+    """
+
+    def __init__(self, provider, rate, burst, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.provider = provider
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = BACKOFF_INITIAL
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Wait for a token, or raise ProviderOverloaded if that would take longer than max_wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Tokens go negative to hold places for callers already waiting
+            wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+            if wait > self.max_wait:
+                rate_limit_events.inc(provider=self.provider, outcome="rejected")
+                raise ProviderOverloaded(self.provider, wait)
+            self.tokens -= 1
+        if wait > 0:
+            rate_limit_events.inc(provider=self.provider, outcome="delayed")
+            time.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP)
+            self.backoff = BACKOFF_INITIAL
+
+    def record_rate_limited(self, retry_after=None):
+        """Back off after the provider answered 429; returns the pause in seconds."""
+        rate_limit_events.inc(provider=self.provider, outcome="upstream_429")
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = retry_after if retry_after is not None else self.backoff
+            self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+            self.rate = max(self.max_rate * RATE_MIN_FRACTION, self.rate / 2)
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = min(self.tokens, 0)
+            return pause
+
+    def call(self, fn, *args, **kwargs):
+        self.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise ProviderOverloaded(self.provider, self.record_rate_limited(retry_after_seconds(e))) from e
+            raise
+        self.record_success()
+        return result
+
+    def call_stream(self, fn, *args, **kwargs):
+        """call() for methods returning an iterator; 429s raised while iterating are handled too."""
+        self.acquire()
+        try:
+            yield from fn(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise ProviderOverloaded(self.provider, self.record_rate_limited(retry_after_seconds(e))) from e
+            raise
+        self.record_success()
+
+
+def is_rate_limit_error(error):
+    """Whether an SDK exception (Together, LangChain, google-genai, api_core) is a 429."""
+    for attribute in ["status_code", "http_status", "code"]:
+        if getattr(error, attribute, None) == 429:
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def retry_after_seconds(error):
+    """The Retry-After of the 429 response behind error, if it sent one in seconds."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedClient:
+    """
+    Proxy that routes the named methods of target through a limiter; dotted names
+    reach into attributes (e.g. "images.generate"). Names in streams return iterators.
+    """
+
+    def __init__(self, target, limiter, methods, streams=()):
+        self._target = target
+        self._limiter = limiter
+        self._methods = set(methods)
+        self._streams = set(streams)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        prefix = name + "."
+        nested = {method[len(prefix):] for method in self._methods if method.startswith(prefix)}
+        if nested:
+            nested_streams = {method[len(prefix):] for method in self._streams if method.startswith(prefix)}
+            return RateLimitedClient(value, self._limiter, nested, nested_streams)
+        if name in self._streams:
+            return lambda *args, **kwargs: self._limiter.call_stream(value, *args, **kwargs)
+        if name in self._methods:
+            return lambda *args, **kwargs: self._limiter.call(value, *args, **kwargs)
+        return value
+
+
+def _create_limiters():
+    limiters = {}
+    for provider, (rate, burst) in DEFAULT_PROVIDER_LIMITS.items():
+        rate = float(os.getenv(f"RATE_LIMIT_{provider.upper()}_RPS") or rate)
+        burst = float(os.getenv(f"RATE_LIMIT_{provider.upper()}_BURST") or burst)
+        limiters[provider] = AdaptiveTokenBucket(provider, rate, burst)
+    return limiters
+
+
+provider_limiters = _create_limiters()
@@ -1,16 +1,37 @@
-from flask import Blueprint, jsonify, request, current_app
+import math
+import os
+from itertools import chain
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from flask_socketio import emit, join_room
 
 from src.ai_models import (
     generate_prompt_question,
     generate_response_with_context,
+    stream_response_with_context,
     IMAGE_MODELS,
+    COMPLETION_ERROR_MESSAGE,
+    IMAGE_ERROR_MESSAGE,
     generate_image_with_context,
 )
+from src.cache import cache_stats
+from src.context_builder import CONTEXT_ANCESTOR_DEPTH, context_stats
+from src.db.firestore import field_path, get_document_fields
 from src.db.storage import upload_parent_videos
+from src.jobs import JobLimitExceeded, job_room, public_job
+from src.rate_limit import ProviderOverloaded
+from src.singleflight import completion_flight, completion_key
+from src.telemetry import traced
 
 
 api_routes = Blueprint("api_routes", __name__)
 
+# Where the client address comes from for per-user job limits. Set TRUSTED_CLIENT_IP_HEADER
+# to a header the platform's front end sets and clients can't (X-Appengine-User-Ip on
+# App Engine), or TRUSTED_PROXY_COUNT to the number of proxies that append to
+# X-Forwarded-For; otherwise the connection's peer address is used.
+TRUSTED_CLIENT_IP_HEADER = os.getenv("TRUSTED_CLIENT_IP_HEADER")
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT") or "0")
+
 
 @api_routes.route("/v1/prompt", methods=["POST"])
 def generate_prompt():
@@ -18,16 +39,41 @@ def generate_prompt():
     data = request.json
 
     try:
-        prompt_question = generate_prompt_question(data.get("parentNodes", []), model=data.get("model"))
+        parent_nodes = data.get("parentNodes", [])
+        upload_completion_parent_videos(parent_nodes)
+        prompt_question = generate_prompt_question(
+            parent_nodes,
+            model=data.get("model"),
+            node_lookup=load_context_nodes(data.get("canvasId"), parent_nodes),
+        )
+    except ProviderOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": "Internal Server Error"}), 500
-    
+
     return jsonify({"prompt": prompt_question}), 200
 
 
+@api_routes.route("/v1/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Hit/miss counters for the in-process and Redis caches, and completion deduplication"""
+    return jsonify({"caches": cache_stats(), "completions": completion_flight.stats()}), 200
+
+
+@api_routes.route("/v1/context/stats", methods=["GET"])
+def get_context_stats():
+    """Context tokens sent per request and how parent context was fitted"""
+    return jsonify({"context": context_stats()}), 200
+
+
 @api_routes.route("/v1/completion", methods=["POST"])
 def generate():
-    """Generate prompt response, given a prompt"""
+    """
+    Generate prompt response, given a prompt
+    With `async: true` the completion runs as a background job: responds 202 with
+    {jobId}, and the result is pushed as a `job_done` Socket.IO event (to `socketId`
+    if given, and to watchers of the job) or can be polled at GET /v1/jobs/<jobId>.
+    """
 
     data = request.json or {}
     for key in ["model", "prompt", "nodeId"]:
@@ -35,33 +81,307 @@ def generate():
             return jsonify({"error": f"{key} is required"}), 400
     model, prompt = data["model"], data["prompt"]
 
+    if data.get("async"):
+        return submit_completion_job(data)
+
     try:
         parent_nodes = data.get("parentNodes", [])
-        canvas_id = data.get("canvasId", data.get("nodeId"))
-        if parent_nodes:
-            gcs_client = current_app.config.get("GCS")
-            bucket_name = current_app.config.get("GCS_BUCKET")
-            if gcs_client and bucket_name:
-                upload_parent_videos(parent_nodes, canvas_id, gcs_client, bucket_name)
+        upload_completion_parent_videos(parent_nodes)
+        completion = coalesced_completion(model, prompt, parent_nodes, data.get("canvasId"))
+        return jsonify({"response": completion}), 200
+
+    except ValueError as e:
+        return jsonify({"error": "Input Error"}), 400
+    except ProviderOverloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@api_routes.route("/v1/jobs/metrics", methods=["GET"])
+def get_job_metrics():
+    """Queue depth and job counters for this instance"""
+    return jsonify({"jobs": current_app.config['JOBS'].metrics()}), 200
+
+
+@api_routes.route("/v1/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Poll a completion job; `result` holds {response} once status is "done"."""
+    try:
+        job = current_app.config['JOBS'].get(job_id)
+    except Exception as e:
+        return jsonify({"error": "Internal Server Error"}), 500
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job": public_job(job)}), 200
+
+
+@api_routes.route("/v1/completion/stream", methods=["POST"])
+def generate_stream():
+    """
+    Stream a prompt response as server-sent events.
+    Emits `token` events as text arrives, then a single `done` event
+    carrying the full response (identical to /v1/completion).
+    """
+
+    data = request.json or {}
+    for key in ["model", "prompt", "nodeId"]:
+        if key not in data:
+            return jsonify({"error": f"{key} is required"}), 400
+
+    try:
+        parent_nodes = data.get("parentNodes", [])
+        upload_completion_parent_videos(parent_nodes)
+
+        events = completion_events(data["model"], data["prompt"], parent_nodes, data.get("canvasId"))
+        # Pull the first event eagerly so input errors still map to a 400
+        first_event = next(events)
+    except ValueError as e:
+        return jsonify({"error": "Input Error"}), 400
+    except ProviderOverloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": "Internal Server Error"}), 500
+
+    def sse():
+        for event, payload in chain([first_event], events):
+            yield f"event: {event}\ndata: {current_app.json.dumps(payload)}\n\n"
+
+    return Response(
+        stream_with_context(sse()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def register_completion_events(socketio):
+    """
+    Register Socket.IO handlers for streamed completions.
+    A client emits `completion` with the same body as POST /v1/completion and
+    receives `completion_token` events followed by `completion_done`
+    (or `completion_error`), each tagged with the request's nodeId.
+    """
+
+    @socketio.on("completion")
+    def stream_completion(data):
+        data = data or {}
+        node_id = data.get("nodeId")
+        for key in ["model", "prompt", "nodeId"]:
+            if key not in data:
+                emit("completion_error", {"nodeId": node_id, "error": f"{key} is required"})
+                return
+
+        try:
+            parent_nodes = data.get("parentNodes", [])
+            upload_completion_parent_videos(parent_nodes)
 
+            for event, payload in completion_events(data["model"], data["prompt"], parent_nodes, data.get("canvasId")):
+                emit(f"completion_{event}", {"nodeId": node_id, **payload})
+                socketio.sleep(0)
+        except ValueError as e:
+            emit("completion_error", {"nodeId": node_id, "error": "Input Error"})
+        except ProviderOverloaded as e:
+            emit("completion_error", {"nodeId": node_id, "error": "Overloaded", "retryAfter": math.ceil(e.retry_after)})
+        except Exception as e:
+            emit("completion_error", {"nodeId": node_id, "error": "Internal Server Error"})
+
+    @socketio.on("watch_job")
+    def watch_job(data):
+        """Subscribe to a job's `job_done` event; returns the job as it is now."""
+        job_id = (data or {}).get("jobId")
+        if not isinstance(job_id, str):
+            return {"error": "jobId is required"}
+        # Join before reading so a job finishing in between isn't missed
+        join_room(job_room(job_id))
+        job = current_app.config['JOBS'].get(job_id)
+        return {"job": public_job(job) if job else None}
+
+
+def register_completion_jobs(jobs):
+    """Register the background job handlers used by async completions."""
+    jobs.register("completion", run_completion_job)
+
+
+def submit_completion_job(data):
+    try:
+        job = current_app.config['JOBS'].submit(
+            "completion", data, user=request_user(), socket_id=data.get("socketId")
+        )
+    except JobLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        return jsonify({"error": "Internal Server Error"}), 500
+    return jsonify({"jobId": job["id"], "status": job["status"]}), 202
+
+
+def run_completion_job(payload):
+    parent_nodes = payload.get("parentNodes", [])
+    upload_completion_parent_videos(parent_nodes)
+    completion = coalesced_completion(payload["model"], payload["prompt"], parent_nodes, payload.get("canvasId"))
+    return {"response": completion}
+
+
+def overloaded_response(error):
+    """429 telling the client when the rate-limited provider has capacity again."""
+    retry_after = math.ceil(error.retry_after)
+    response = jsonify({"error": "Overloaded", "retryAfter": retry_after})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 429
+
+
+def request_user():
+    """
+    Who a job is counted against: the client address as reported by trusted
+    infrastructure. Values the client controls, like a userId in the body or
+    the leading X-Forwarded-For entries, would let anyone lift the limit.
+    """
+    if TRUSTED_CLIENT_IP_HEADER and request.headers.get(TRUSTED_CLIENT_IP_HEADER):
+        return request.headers[TRUSTED_CLIENT_IP_HEADER]
+    if TRUSTED_PROXY_COUNT:
+        # Each trusted proxy appends the address it received the request from
+        forwarded_for = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+        if len(forwarded_for) >= TRUSTED_PROXY_COUNT:
+            return forwarded_for[-TRUSTED_PROXY_COUNT]
+    return request.remote_addr or "anonymous"
+
+
+def completion_events(model, prompt, parent_nodes, canvas_id=None):
+    """
+    Yield (event, payload) pairs for a streamed completion: zero or more
+    ("token", {"token": str}) followed by exactly one ("done", {"response": str}).
+    Raises ValueError on the first iteration for unsupported models, and
+    ProviderOverloaded if the provider is rate limiting before any token was sent.
+    """
+    if model in IMAGE_MODELS:
+        # Images aren't streamed, so identical requests can share one generation
+        yield "done", {"response": coalesced_completion(model, prompt, parent_nodes, canvas_id)}
+        return
+
+    node_lookup = load_context_nodes(canvas_id, parent_nodes)
+
+    try:
+        stream = stream_response_with_context(
+            model=model, prompt=prompt, parent_nodes=parent_nodes, node_lookup=node_lookup
+        )
+    except (ValueError, ProviderOverloaded):
+        raise
+    except Exception as e:
+        print(f"Error streaming response: {e}")
+        yield "done", {"response": COMPLETION_ERROR_MESSAGE}
+        return
+
+    chunks = []
+    try:
+        for chunk in stream:
+            chunks.append(chunk)
+            yield "token", {"token": chunk}
+    except ProviderOverloaded:
+        if not chunks:
+            raise
+        print(f"Provider overloaded mid-stream after {len(chunks)} chunks")
+        yield "done", {"response": COMPLETION_ERROR_MESSAGE}
+        return
+    except Exception as e:
+        print(f"Error streaming response: {e}")
+        yield "done", {"response": COMPLETION_ERROR_MESSAGE}
+        return
+
+    yield "done", {"response": "".join(chunks)}
+
+
+def coalesced_completion(model, prompt, parent_nodes, canvas_id=None):
+    """
+    Generate a non-streamed completion, sharing one upstream call between identical
+    concurrent requests (same model, prompt and parent content); a successful result
+    is also reused for COMPLETION_REUSE_WINDOW seconds. Error responses are never reused.
+    """
+    key = completion_key(model, prompt, parent_nodes, canvas_id if CONTEXT_ANCESTOR_DEPTH > 0 else None)
+
+    def generate():
+        node_lookup = load_context_nodes(canvas_id, parent_nodes)
         if model in IMAGE_MODELS:
-            image_completion = generate_image_with_context(
+            return generate_image_with_context(
                 model=model,
                 prompt=prompt,
                 parent_nodes=parent_nodes,
+                gcs_client=current_app.config.get("GCS"),
+                node_lookup=node_lookup,
             )
+        return generate_response_with_context(
+            model=model,
+            prompt=prompt,
+            parent_nodes=parent_nodes,
+            node_lookup=node_lookup,
+        )
 
-            return jsonify({"response": image_completion}), 200
-        else:
-            prompt_completion = generate_response_with_context(
-                model=model,
-                prompt=prompt,
-                parent_nodes=parent_nodes,
-            )
+    return completion_flight.do(
+        key,
+        generate,
+        reusable=lambda completion: completion not in (COMPLETION_ERROR_MESSAGE, IMAGE_ERROR_MESSAGE),
+    )
 
-            return jsonify({"response": prompt_completion}), 200
 
-    except ValueError as e:
-        return jsonify({"error": "Input Error"}), 400
+@traced("upload_parent_videos")
+def upload_completion_parent_videos(parent_nodes):
+    """Upload base64 parent videos to GCS when storage is configured, so Gemini reads them by gs:// URI."""
+    if parent_nodes:
+        gcs_client = current_app.config.get("GCS")
+        bucket_name = current_app.config.get("GCS_BUCKET")
+        if gcs_client and bucket_name:
+            upload_parent_videos(parent_nodes, gcs_client, bucket_name)
+
+
+# The node fields ancestor context uses (see collect_ancestors and extract_parent_data)
+CONTEXT_NODE_FIELDS = [("id",), ("type",), ("data", "parent_ids"), ("data", "prompt_response")]
+# The saved fields of image parents that pick their model variant (see model_image_url)
+IMAGE_PARENT_FIELDS = [("data", "imageDataUrl"), ("data", "imageVariants")]
+
+
+@traced("load_context_nodes")
+def load_context_nodes(canvas_id, parent_nodes):
+    """
+    Load what the saved canvas adds to parent_nodes' context ({node_id: node}):
+    the stored variants of image parents, and their ancestors up to
+    CONTEXT_ANCESTOR_DEPTH. Returns None when there is nothing to add.
+    Reads one generation of ancestors at a time, and only the fields above,
+    instead of the canvas's whole node map.
+    """
+    if not canvas_id:
+        return None
+
+    parent_nodes = parent_nodes or []
+    image_field_paths = [
+        field_path("nodes", node["id"], *field)
+        for node in parent_nodes
+        if node.get("type") == "imageNode" and isinstance(node.get("id"), str)
+        for field in IMAGE_PARENT_FIELDS
+    ]
+    node_lookup = {}
+    frontier = parent_nodes
+    seen = {node.get("id") for node in parent_nodes}
+    try:
+        # The first read also picks up the image parents, even without ancestor context
+        for depth in range(max(CONTEXT_ANCESTOR_DEPTH, 1)):
+            parent_ids = set()
+            if depth < CONTEXT_ANCESTOR_DEPTH:
+                parent_ids = {
+                    parent_id
+                    for node in frontier
+                    for parent_id in node.get("data", {}).get("parent_ids") or []
+                    if isinstance(parent_id, str) and parent_id not in seen
+                }
+                seen |= parent_ids
+            field_paths = [field_path("nodes", node_id, *field) for node_id in parent_ids for field in CONTEXT_NODE_FIELDS]
+            if depth == 0:
+                field_paths += image_field_paths
+            if not field_paths:
+                break
+            canvas, _ = get_document_fields(current_app.config['FIRESTORE'], "canvases", canvas_id, field_paths)
+            saved_nodes = canvas.get("nodes") or {}
+            for node_id, node in saved_nodes.items():
+                node.setdefault("id", node_id)
+            node_lookup.update(saved_nodes)
+            frontier = [saved_nodes[node_id] for node_id in parent_ids if node_id in saved_nodes]
     except Exception as e:
-        return jsonify({"error": "Internal Server Error"}), 500
+        print(f"Error loading context for canvas {canvas_id}: {e}")
+    return node_lookup or None
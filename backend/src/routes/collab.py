@@ -0,0 +1,419 @@
+import os
+import threading
+import time
+from datetime import datetime
+from flask import current_app, request
+from flask_socketio import emit, join_room, leave_room, rooms
+
+from src.cache import get_redis_client
+from src.db.firestore import field_path, get_document_fields, update_document_fields
+from src.db.storage import is_base64_data_url
+from src.routes.datastore import (
+    NODE_ID_PATTERN,
+    NODE_SCHEMA,
+    canvas_cache,
+    delete_stale_blobs,
+    discard_uploaded_blobs,
+    sync_blob_manifest,
+    upload_node_images,
+)
+from src.routes.validation.validate import compile_validator
+
+
+# How often coalesced position updates are broadcast, and how often pending
+# operations are written to Firestore, in seconds
+COLLAB_BROADCAST_INTERVAL = float(os.getenv("COLLAB_BROADCAST_INTERVAL", "0.05"))
+COLLAB_PERSIST_INTERVAL = float(os.getenv("COLLAB_PERSIST_INTERVAL", "2"))
+COLLAB_SESSION_IDLE_SECONDS = 300
+
+OP_TYPES = {"add", "edit", "move", "delete"}
+# Media is only set by adding a whole node, so it is uploaded and recorded in the blob manifest
+MEDIA_FIELDS = {"imageDataUrl", "videoDataUrl", "imageVariants"}
+
+validate_node = compile_validator(NODE_SCHEMA, max_errors=1)
+
+
+def canvas_room(canvas_id):
+    return f"canvas:{canvas_id}"
+
+
+class CanvasSession:
+    """
+    Per-canvas state on this instance: coalesced moves waiting to be broadcast
+    and node changes waiting to be persisted in the next batched write.
+    """
+
+    def __init__(self, canvas_id):
+        self.canvas_id = canvas_id
+        self.lock = threading.Lock()
+        # node id -> (position, sid of the client that moved it last)
+        self.pending_moves = {}
+        # node id -> full node (for adds) or {field: value} of partial updates
+        self.pending_nodes = {}
+        self.pending_full_nodes = set()
+        self.pending_deletes = set()
+        # Deleted on this instance; later moves/edits for them are dropped so a
+        # partial field write can't resurrect a node without type or position
+        self.deleted_ids = set()
+        # Added on this instance or found in the saved canvas; edits and moves
+        # are only accepted for these
+        self.known_ids = set()
+        self.last_active_at = time.monotonic()
+
+    def is_known(self, node_id):
+        """True/False when this session knows whether node_id exists, None when it has to be looked up."""
+        with self.lock:
+            if node_id in self.deleted_ids:
+                return False
+            return True if node_id in self.known_ids else None
+
+    def mark_known(self, node_id):
+        with self.lock:
+            if node_id not in self.deleted_ids:
+                self.known_ids.add(node_id)
+
+    def apply(self, op, sid=None):
+        """
+        Record an operation for persistence; moves are also held back for coalescing,
+        along with the sid of the client that sent them.
+        """
+        node_id = op["nodeId"]
+        with self.lock:
+            self.last_active_at = time.monotonic()
+            if op["type"] == "add":
+                self.pending_deletes.discard(node_id)
+                self.deleted_ids.discard(node_id)
+                self.known_ids.add(node_id)
+                self.pending_nodes[node_id] = dict(op["node"])
+                self.pending_full_nodes.add(node_id)
+                self.pending_moves.pop(node_id, None)
+            elif op["type"] == "delete":
+                self.pending_nodes.pop(node_id, None)
+                self.pending_full_nodes.discard(node_id)
+                self.pending_moves.pop(node_id, None)
+                self.pending_deletes.add(node_id)
+                self.deleted_ids.add(node_id)
+                self.known_ids.discard(node_id)
+            elif node_id not in self.deleted_ids:
+                node = self.pending_nodes.setdefault(node_id, {})
+                if op["type"] == "move":
+                    node["position"] = op["position"]
+                    self.pending_moves[node_id] = (op["position"], sid)
+                elif node_id in self.pending_full_nodes:
+                    node.setdefault("data", {}).update(op["data"])
+                else:
+                    node.update({("data", key): value for key, value in op["data"].items()})
+
+    def take_moves(self):
+        with self.lock:
+            moves, self.pending_moves = self.pending_moves, {}
+        return moves
+
+    def take_writes(self):
+        """
+        Swap out pending node writes as (pending_nodes, full_node_ids, deleted_ids).
+        Pass them to restore() if writing them fails.
+        """
+        with self.lock:
+            pending_nodes, self.pending_nodes = self.pending_nodes, {}
+            full_nodes, self.pending_full_nodes = self.pending_full_nodes, set()
+            deletes, self.pending_deletes = self.pending_deletes, set()
+        return pending_nodes, full_nodes, deletes
+
+    def restore(self, pending_nodes, full_nodes, deletes):
+        """Requeue writes taken by take_writes() under any operations applied since."""
+        with self.lock:
+            for node_id, fields in pending_nodes.items():
+                if node_id in self.pending_deletes or node_id in self.pending_full_nodes:
+                    # Deleted or re-added since; that supersedes the taken write
+                    continue
+                newer = self.pending_nodes.get(node_id, {})
+                node = dict(fields)
+                if node_id in full_nodes:
+                    for key, value in newer.items():
+                        if isinstance(key, tuple):
+                            node.setdefault("data", {})[key[1]] = value
+                        else:
+                            node[key] = value
+                    self.pending_full_nodes.add(node_id)
+                else:
+                    node.update(newer)
+                self.pending_nodes[node_id] = node
+            for node_id in deletes:
+                if node_id not in self.pending_full_nodes:
+                    self.pending_deletes.add(node_id)
+
+    def has_pending_writes(self):
+        with self.lock:
+            return bool(self.pending_nodes or self.pending_deletes)
+
+
+class CollabHub:
+    """
+    Orders, coalesces and persists node operations for collaborative canvases.
+    Each operation gets a per-canvas sequence number (shared through Redis when
+    REDIS_URL is set, so ordering holds across instances). Adds, edits and deletes
+    are broadcast immediately; moves are coalesced per node and broadcast every
+    COLLAB_BROADCAST_INTERVAL. Changes are written to Firestore in one batched
+    update per canvas every COLLAB_PERSIST_INTERVAL, by a separate worker so a
+    slow write doesn't hold up broadcasts; failed writes are retried.
+    """
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.app = None
+        self._local_seq = {}
+        self._worker_started = False
+
+    def session(self, canvas_id):
+        with self.lock:
+            if canvas_id not in self.sessions:
+                self.sessions[canvas_id] = CanvasSession(canvas_id)
+            return self.sessions[canvas_id]
+
+    def next_seq(self, canvas_id):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                return client.incr(f"polylogue:canvas_seq:{canvas_id}")
+            except Exception as e:
+                print(f"Error incrementing canvas sequence in Redis: {e}")
+        with self.lock:
+            self._local_seq[canvas_id] = self._local_seq.get(canvas_id, 0) + 1
+            return self._local_seq[canvas_id]
+
+    def ensure_worker(self):
+        with self.lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+            self.app = current_app._get_current_object()
+        self.socketio.start_background_task(self._run)
+        self.socketio.start_background_task(self._run_persist)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(COLLAB_BROADCAST_INTERVAL)
+            with self.lock:
+                sessions = list(self.sessions.values())
+            for session in sessions:
+                try:
+                    self.flush(session)
+                except Exception as e:
+                    print(f"Error flushing collaborative session for canvas {session.canvas_id}: {e}")
+
+    def _run_persist(self):
+        while True:
+            self.socketio.sleep(COLLAB_PERSIST_INTERVAL)
+            now = time.monotonic()
+            with self.lock:
+                sessions = list(self.sessions.values())
+            for session in sessions:
+                if session.has_pending_writes():
+                    try:
+                        self.persist(session)
+                    except Exception as e:
+                        print(f"Error persisting collaborative session for canvas {session.canvas_id}: {e}")
+                elif now - session.last_active_at > COLLAB_SESSION_IDLE_SECONDS:
+                    with self.lock:
+                        self.sessions.pop(session.canvas_id, None)
+
+    def flush(self, session):
+        """Broadcast a session's coalesced moves, each batch to everyone but the client that made them."""
+        ops_by_sid = {}
+        for node_id, (position, sid) in session.take_moves().items():
+            ops_by_sid.setdefault(sid, []).append({"type": "move", "nodeId": node_id, "position": position})
+        for sid, ops in ops_by_sid.items():
+            self.socketio.emit(
+                "canvas_ops",
+                {"canvasId": session.canvas_id, "seq": self.next_seq(session.canvas_id), "ops": ops},
+                to=canvas_room(session.canvas_id),
+                skip_sid=sid,
+            )
+
+    def node_exists(self, session, node_id):
+        """Whether node_id is on the canvas: added in this session or saved in Firestore."""
+        known = session.is_known(node_id)
+        if known is not None:
+            return known
+        try:
+            canvas, _ = get_document_fields(
+                current_app.config['FIRESTORE'], "canvases", session.canvas_id, [field_path("nodes", node_id, "id")]
+            )
+        except ValueError:
+            return False
+        if node_id not in (canvas.get("nodes") or {}):
+            return False
+        session.mark_known(node_id)
+        return True
+
+    def persist(self, session):
+        """
+        Write a session's pending operations to Firestore in one batched update.
+        On failure they are requeued for the next round, unless the canvas no longer exists.
+        """
+        taken = session.take_writes()
+        pending_nodes, full_nodes, deleted_ids = taken
+        upserted = [pending_nodes[node_id] for node_id in full_nodes]
+        updates = {}
+        for node_id, fields in pending_nodes.items():
+            if node_id in full_nodes:
+                updates[field_path("nodes", node_id)] = fields
+                continue
+            for key, value in fields.items():
+                parts = key if isinstance(key, tuple) else (key,)
+                updates[field_path("nodes", node_id, *parts)] = value
+
+        canvas_id = session.canvas_id
+        with self.app.app_context():
+            db = self.app.config['FIRESTORE']
+            gcs_client = self.app.config['GCS']
+            bucket_name = self.app.config['GCS_BUCKET']
+            updates["updated_at"] = datetime.now()
+            try:
+                stale_blob_paths = sync_blob_manifest(
+                    db,
+                    canvas_id,
+                    bucket_name,
+                    lambda transaction: update_document_fields(
+                        db,
+                        "canvases",
+                        canvas_id,
+                        updates,
+                        deleted_fields=[field_path("nodes", node_id) for node_id in deleted_ids],
+                        increments={"version": 1},
+                        transaction=transaction,
+                    ),
+                    upserted=upserted,
+                    removed_ids=deleted_ids,
+                )
+            except ValueError as e:
+                print(f"Dropping collaborative changes for missing canvas {canvas_id}: {e}")
+                return
+            except Exception as e:
+                print(f"Error persisting collaborative changes for canvas {canvas_id}, will retry: {e}")
+                session.restore(*taken)
+                return
+            canvas_cache.delete(canvas_id)
+            delete_stale_blobs(gcs_client, bucket_name, stale_blob_paths)
+
+
+def validate_op(op):
+    """Return an error message for a malformed operation, or None."""
+    if not isinstance(op, dict) or op.get("type") not in OP_TYPES:
+        return f"op.type must be one of {sorted(OP_TYPES)}"
+    if not isinstance(op.get("nodeId"), str):
+        return "op.nodeId must be of type str"
+    if not NODE_ID_PATTERN.fullmatch(op["nodeId"]):
+        return "Invalid op.nodeId"
+    if op["type"] == "add":
+        errors = validate_node(op.get("node"), "op.node")
+        if errors:
+            return errors[0]
+        if op["node"]["id"] != op["nodeId"]:
+            return "op.node.id must match op.nodeId"
+    if op["type"] == "move":
+        position = op.get("position")
+        if not (isinstance(position, dict) and all(isinstance(position.get(axis), (int, float)) for axis in ["x", "y"])):
+            return "op.position must be an object with numeric x and y"
+    if op["type"] == "edit":
+        if not isinstance(op.get("data"), dict):
+            return "op.data must be an object"
+        if MEDIA_FIELDS.intersection(op["data"]) or any(is_base64_data_url(value) for value in op["data"].values()):
+            return "op.data can't change node media; add the node again instead"
+    return None
+
+
+def upload_op_media(op, canvas_id):
+    """
+    Upload the base64 media of an "add" op's node to GCS, replacing it with public
+    URLs as a canvas save does. Returns (uploaded, error message if any of it failed).
+    """
+    node = op["node"]
+    if not any(is_base64_data_url(value) for value in node["data"].values()):
+        return False, None
+    uploaded_blob_paths = upload_node_images([node], canvas_id, current_app.config['GCS'], current_app.config['GCS_BUCKET'])
+    if any(is_base64_data_url(value) for value in node["data"].values()):
+        discard_uploaded_blobs(current_app.config['FIRESTORE'], canvas_id, uploaded_blob_paths)
+        return False, "op.node media could not be uploaded"
+    return True, None
+
+
+def register_collab_events(socketio):
+    """
+    Register Socket.IO handlers for collaborative canvas editing.
+    Clients `join_canvas` / `leave_canvas` with {canvasId} and, once joined, send
+    `canvas_op` with {canvasId, op}; ops are one of:
+        {type: "add", nodeId, node}         base64 media in node is uploaded to GCS
+        {type: "edit", nodeId, data}        data fields are merged into node.data
+        {type: "move", nodeId, position}
+        {type: "delete", nodeId}
+    Edits and moves must target a node that exists. Other clients in the room
+    receive `canvas_ops` events with {canvasId, seq, ops}; an add whose media was
+    uploaded is acknowledged with the stored node.
+    """
+    hub = CollabHub(socketio)
+
+    @socketio.on("join_canvas")
+    def join_canvas(data):
+        canvas_id = (data or {}).get("canvasId")
+        if not isinstance(canvas_id, str):
+            return {"error": "canvasId is required"}
+        hub.ensure_worker()
+        hub.session(canvas_id)
+        join_room(canvas_room(canvas_id))
+        return {"canvasId": canvas_id}
+
+    @socketio.on("leave_canvas")
+    def leave_canvas(data):
+        canvas_id = (data or {}).get("canvasId")
+        if isinstance(canvas_id, str):
+            leave_room(canvas_room(canvas_id))
+
+    @socketio.on("canvas_op")
+    def canvas_op(data):
+        data = data or {}
+        canvas_id = data.get("canvasId")
+        if not isinstance(canvas_id, str):
+            return {"error": "canvasId is required"}
+        if canvas_room(canvas_id) not in rooms():
+            return {"error": "Join the canvas before sending operations"}
+        op = data.get("op")
+        error = validate_op(op)
+        if error:
+            return {"error": error}
+
+        hub.ensure_worker()
+        session = hub.session(canvas_id)
+        uploaded = False
+        try:
+            if op["type"] in ("edit", "move") and not hub.node_exists(session, op["nodeId"]):
+                return {"error": f"Node {op['nodeId']} does not exist"}
+            if op["type"] == "add":
+                uploaded, error = upload_op_media(op, canvas_id)
+                if error:
+                    return {"error": error}
+        except Exception as e:
+            print(f"Error applying collaborative operation for canvas {canvas_id}: {e}")
+            return {"error": "Internal Server Error"}
+
+        session.apply(op, sid=request.sid)
+        if op["type"] == "move":
+            # Broadcast later, coalesced with other moves of the same node
+            return {"queued": True}
+
+        seq = hub.next_seq(canvas_id)
+        emit(
+            "canvas_ops",
+            {"canvasId": canvas_id, "seq": seq, "ops": [op]},
+            to=canvas_room(canvas_id),
+            include_self=False,
+        )
+        if uploaded:
+            # The sender still holds the base64 media; hand it the stored URLs
+            return {"seq": seq, "node": op["node"]}
+        return {"seq": seq}
+
+    return hub
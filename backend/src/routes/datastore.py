@@ -1,23 +1,73 @@
+import os
+import re
 from datetime import datetime
 from flask import Blueprint, jsonify, request, current_app
 from src.db.firestore import (
     get_document_by_collection_and_id,
     save_document_in_collection,
-    update_document_in_collection,
+    get_document_fields,
+    update_document_fields,
+    transact_document,
+    field_path,
+    StaleDocumentError,
 )
 from src.routes.validation.validate import validate_json, OptionalField
+from src.json_provider import iter_json_document, dumps_bytes
+from src.cache import TieredCache, hash_key
 from src.db.storage import (
-    upload_base64_image,
+    upload_base64_image_with_variants,
     upload_base64_video,
+    create_image_variants,
     get_video_extension,
     is_base64_data_url,
+    upload_data_urls,
     delete_blobs,
+    generate_signed_upload_url,
+    get_blob_metadata,
+    SigningUnavailable,
+    MEDIA_EXTENSIONS,
 )
+from src.telemetry import traced
 
 
 ds_routes = Blueprint("ds_routes", __name__)
 
 
+MEDIA_UPLOAD_MAX_BYTES = int(os.getenv("MEDIA_UPLOAD_MAX_BYTES", str(500 * 1024 * 1024)))
+# Canvases with more nodes than this are encoded and sent in batches
+CANVAS_STREAM_THRESHOLD = int(os.getenv("CANVAS_STREAM_THRESHOLD", "500"))
+
+# Serialized GET responses keyed by canvas id. Writes on this instance invalidate
+# both tiers; the short local TTL bounds staleness from writes on other instances.
+canvas_cache = TieredCache(
+    "canvas",
+    maxsize=int(os.getenv("CANVAS_CACHE_SIZE", "64")),
+    ttl=int(os.getenv("CANVAS_CACHE_TTL", "3600")),
+    local_ttl=int(os.getenv("CANVAS_CACHE_LOCAL_TTL", "5")),
+)
+# Streamed bodies larger than this are sent but not cached
+CANVAS_CACHE_MAX_BYTES = int(os.getenv("CANVAS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+NODE_SCHEMA = {
+    'id': str,
+    'type': str,
+    'position': {
+        'x': (int, float),
+        'y': (int, float),
+    },
+    'data': dict,
+    'selected': bool,
+    'measured': {
+        'width': (int, float),
+        'height': (int, float),
+    },
+    'origin': [(int, float)],
+}
+# Node ids are nanoids; they become part of blob paths, so nothing else is accepted
+NODE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
 @ds_routes.route("/v1/canvases", methods=["POST"])
 def canvases_operations():
     """
@@ -29,21 +79,7 @@ def canvases_operations():
         'canvasId': str,
         'title': OptionalField(str),
         'description': OptionalField(str),
-        'nodes': [{
-            'id': str,
-            'type': str,
-            'position': {
-                'x': (int, float),
-                'y': (int, float),
-            },
-            'data': dict,
-            'selected': bool,
-            'measured': {
-                'width': (int, float),
-                'height': (int, float),
-            },
-            'origin': [(int, float)],
-        }],
+        'nodes': [NODE_SCHEMA],
         'createdBy': OptionalField(str),
     })
     def save_canvas():
@@ -75,9 +111,13 @@ def canvases_operations():
                     "created_by": data.get("createdBy"),
                     "created_at": datetime.now(),
                     "updated_at": datetime.now(),
+                    "version": 1,
                 },
                 doc_id=data["canvasId"]
             )
+            canvas_cache.delete(doc_id)
+            stale_blob_paths = sync_blob_manifest(db, doc_id, bucket_name, nodes=data["nodes"], legacy_nodes={})
+            delete_stale_blobs(gcs_client, bucket_name, stale_blob_paths)
         except Exception as e:
             print("Error saving canvas: ", e)
             return jsonify({"error": "Internal Server Error"}), 500
@@ -91,7 +131,7 @@ def canvases_operations():
         return jsonify({"error": "Internal Server Error"}), 500
 
 
-@ds_routes.route("/v1/canvases/<canvas_id>", methods=["GET", "PUT"])
+@ds_routes.route("/v1/canvases/<canvas_id>", methods=["GET", "PUT", "PATCH"])
 def canvas_operations(canvas_id):
     """
     Routes to read/write to single canvas in collection
@@ -99,36 +139,46 @@ def canvas_operations(canvas_id):
     db = current_app.config['FIRESTORE']
 
     def get_canvas(id):
-        """Get a canvas document from datastore"""
+        """
+        Get a canvas document from datastore
+        Serves from the canvas cache when possible and answers
+        If-None-Match requests for an unchanged canvas with 304.
+        """
+        cached = canvas_cache.get(id)
+        if cached is not None:
+            return canvas_response(cached["etag"], cached["body"])
+
+        # Taken before the read, so a write landing during it keeps this body out of the cache
+        cache_generation = canvas_cache.generation(id)
         try:
+            if request.if_none_match:
+                # Cheap version check before downloading the whole canvas
+                current, _ = get_document_fields(db, "canvases", id, ["version", "updated_at"])
+                etag = canvas_etag(id, current)
+                if request.if_none_match.contains(etag):
+                    return canvas_response(etag)
+
             canvas_doc = get_document_by_collection_and_id(db, "canvases", id)
             canvas_doc["nodes"] = transform_nodes_map_to_arr(canvas_doc["nodes"])
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": "Internal Server Error"}), 500
-        
-        return jsonify({"document": canvas_doc}), 200
-    
-    
+
+        etag = canvas_etag(id, canvas_doc)
+        if len(canvas_doc["nodes"]) > CANVAS_STREAM_THRESHOLD:
+            chunks = iter_json_document("document", canvas_doc, "nodes")
+            return canvas_response(etag, cache_streamed_canvas(id, etag, chunks, cache_generation))
+
+        body = dumps_bytes({"document": canvas_doc}).decode("utf-8")
+        canvas_cache.set(id, {"etag": etag, "body": body}, generation=cache_generation)
+        return canvas_response(etag, body)
+
+
     @validate_json({
         'title': OptionalField(str),
         'description': OptionalField(str),
-        'nodes': OptionalField([{
-            'id': str,
-            'type': str,
-            'position': {
-                'x': (int, float),
-                'y': (int, float),
-            },
-            'data': dict,
-            'selected': bool,
-            'measured': {
-                'width': (int, float),
-                'height': (int, float),
-            },
-            'origin': [(int, float)],
-        }]),
+        'nodes': OptionalField([NODE_SCHEMA]),
     })
     def update_canvas(id):
         """
@@ -141,116 +191,450 @@ def canvas_operations(canvas_id):
         }
         """
         data = request.json
+        uploaded_blob_paths = []
         try:
             data["updated_at"] = datetime.now()
             if "nodes" in data:
                 gcs_client = current_app.config['GCS']
                 bucket_name = current_app.config['GCS_BUCKET']
-                upload_node_images(data["nodes"], id, gcs_client, bucket_name)
-                delete_removed_node_images(data["nodes"], id, db, gcs_client, bucket_name)
-                data["nodes"] = transform_nodes_arr_to_map(data["nodes"])
-            doc_id = update_document_in_collection(db, "canvases", data, doc_id=id)
+                nodes = data["nodes"]
+                uploaded_blob_paths = upload_node_images(nodes, id, gcs_client, bucket_name)
+                data["nodes"] = transform_nodes_arr_to_map(nodes)
+                stale_blob_paths = sync_blob_manifest(
+                    db,
+                    id,
+                    bucket_name,
+                    lambda transaction: update_document_fields(
+                        db, "canvases", id, data, increments={"version": 1}, transaction=transaction
+                    ),
+                    nodes=nodes,
+                )
+                delete_stale_blobs(gcs_client, bucket_name, stale_blob_paths)
+            else:
+                update_document_fields(db, "canvases", id, data, increments={"version": 1})
+            canvas_cache.delete(id)
+            doc_id = id
         except ValueError as e:
+            discard_uploaded_blobs(db, id, uploaded_blob_paths)
             return jsonify({"error": str(e)}), 400
         except Exception as e:
+            discard_uploaded_blobs(db, id, uploaded_blob_paths)
             return jsonify({"error": "Internal Server Error"}), 500
         
         return jsonify({"document_id": doc_id}), 200
+
+
+    @validate_json({
+        'baseVersion': int,
+        'title': OptionalField(str),
+        'description': OptionalField(str),
+        'added': OptionalField([NODE_SCHEMA]),
+        'changed': OptionalField([NODE_SCHEMA]),
+        'removed': OptionalField([str]),
+    })
+    def patch_canvas(id):
+        """
+        Apply an incremental update to a canvas document in datastore.
+        Only the touched `nodes.<id>` fields are written, so the cost of a save
+        scales with the edit instead of the canvas size.
+        Expect request.json to be in format:
+        {
+            baseVersion: int,
+            title?: str,
+            description?: str,
+            added?: Node[],
+            changed?: Node[],
+            removed?: str[],
+        }
+        Responds 409 if baseVersion is not the canvas's current version.
+        """
+        data = request.json
+        upserted = data.get("added", []) + data.get("changed", [])
+        removed_ids = data.get("removed", [])
+        uploaded_blob_paths = []
+        try:
+            current, update_time = get_document_fields(db, "canvases", id, ["version"])
+            version = current.get("version", 0)
+            if version != data["baseVersion"]:
+                return jsonify({"error": "Stale base version", "version": version}), 409
+
+            gcs_client = current_app.config['GCS']
+            bucket_name = current_app.config['GCS_BUCKET']
+            uploaded_blob_paths = upload_node_images(upserted, id, gcs_client, bucket_name)
+
+            updates = {"updated_at": datetime.now()}
+            for key in ["title", "description"]:
+                if key in data:
+                    updates[key] = data[key]
+            for node in upserted:
+                updates[field_path("nodes", node["id"])] = node
+
+            stale_blob_paths = sync_blob_manifest(
+                db,
+                id,
+                bucket_name,
+                lambda transaction: update_document_fields(
+                    db,
+                    "canvases",
+                    id,
+                    updates,
+                    deleted_fields=[field_path("nodes", node_id) for node_id in removed_ids],
+                    increments={"version": 1},
+                    last_update_time=update_time,
+                    transaction=transaction,
+                ),
+                upserted=upserted,
+                removed_ids=removed_ids,
+            )
+            canvas_cache.delete(id)
+            delete_stale_blobs(gcs_client, bucket_name, stale_blob_paths)
+        except StaleDocumentError as e:
+            discard_uploaded_blobs(db, id, uploaded_blob_paths)
+            return jsonify({"error": "Stale base version"}), 409
+        except ValueError as e:
+            discard_uploaded_blobs(db, id, uploaded_blob_paths)
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            discard_uploaded_blobs(db, id, uploaded_blob_paths)
+            return jsonify({"error": "Internal Server Error"}), 500
+
+        return jsonify({"document_id": id, "version": version + 1}), 200
     
 
     if request.method == "GET":
         return get_canvas(canvas_id)
     elif request.method == "PUT":
         return update_canvas(canvas_id)
+    elif request.method == "PATCH":
+        return patch_canvas(canvas_id)
+    else:
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+
+@ds_routes.route("/v1/canvases/<canvas_id>/uploads", methods=["POST"])
+def canvas_upload_operations(canvas_id):
+    """
+    Routes for uploading node media directly from the browser to GCS
+    """
+    gcs_client = current_app.config['GCS']
+    bucket_name = current_app.config['GCS_BUCKET']
+
+    @validate_json({
+        'nodeId': str,
+        'contentType': str,
+    })
+    def create_upload(id):
+        """
+        Issue a signed resumable-upload URL for a node's media
+        Expect request.json to be in format:
+        {
+            nodeId: str,
+            contentType: str,
+        }
+        """
+        data = request.json
+        if not NODE_ID_PATTERN.fullmatch(data["nodeId"]):
+            return jsonify({"error": "Invalid nodeId"}), 400
+        ext = MEDIA_EXTENSIONS.get(data["contentType"])
+        if not ext:
+            return jsonify({"error": f"Unsupported content type: {data['contentType']}"}), 400
+
+        blob_path = f"canvases/{id}/{data['nodeId']}.{ext}"
+        try:
+            upload_url = generate_signed_upload_url(gcs_client, bucket_name, blob_path, data["contentType"])
+        except SigningUnavailable as e:
+            print(f"Error signing upload URL for node {data['nodeId']}: {e}")
+            return jsonify({"error": "Direct uploads are not available on this server"}), 503
+        except Exception as e:
+            print(f"Error signing upload URL for node {data['nodeId']}: {e}")
+            return jsonify({"error": "Internal Server Error"}), 500
+
+        return jsonify({
+            "uploadUrl": upload_url,
+            "headers": {"x-goog-resumable": "start", "Content-Type": data["contentType"]},
+            "blobPath": blob_path,
+            "publicUrl": f"https://storage.googleapis.com/{bucket_name}/{blob_path}",
+        }), 200
+
+
+    if request.method == "POST":
+        return create_upload(canvas_id)
     else:
         return jsonify({"error": "Internal Server Error"}), 500
 
 
+@ds_routes.route("/v1/canvases/<canvas_id>/uploads/finalize", methods=["POST"])
+def canvas_upload_finalize_operations(canvas_id):
+    """
+    Routes for confirming a direct media upload
+    """
+    db = current_app.config['FIRESTORE']
+    gcs_client = current_app.config['GCS']
+    bucket_name = current_app.config['GCS_BUCKET']
+
+    @validate_json({
+        'nodeId': str,
+        'blobPath': str,
+    })
+    def finalize_upload(id):
+        """
+        Verify an uploaded object and record it in the canvas's blob manifest.
+        The returned publicUrl goes into the node's imageDataUrl/videoDataUrl,
+        and for images imageVariants into its data.imageVariants.
+        Expect request.json to be in format:
+        {
+            nodeId: str,
+            blobPath: str,
+        }
+        """
+        data = request.json
+        node_id, blob_path = data["nodeId"], data["blobPath"]
+        if not NODE_ID_PATTERN.fullmatch(node_id):
+            return jsonify({"error": "Invalid nodeId"}), 400
+        expected_paths = {f"canvases/{id}/{node_id}.{ext}" for ext in MEDIA_EXTENSIONS.values()}
+        if blob_path not in expected_paths:
+            return jsonify({"error": "blobPath does not belong to this node"}), 400
+
+        try:
+            metadata = get_blob_metadata(gcs_client, bucket_name, blob_path)
+            if metadata is None:
+                return jsonify({"error": f"No upload found at {blob_path}"}), 404
+
+            content_type = metadata["content_type"]
+            if MEDIA_EXTENSIONS.get(content_type) != blob_path.rsplit(".", 1)[-1] or metadata["size"] > MEDIA_UPLOAD_MAX_BYTES:
+                delete_blobs(gcs_client, bucket_name, [blob_path])
+                return jsonify({"error": "Uploaded object has an invalid type or size"}), 400
 
+            public_url = f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
+            if content_type.startswith("image/"):
+                variants = create_image_variants(gcs_client, bucket_name, blob_path, metadata["size"])
+                node = {"id": node_id, "type": "imageNode", "data": {"imageDataUrl": public_url, "imageVariants": variants}}
+            else:
+                node = {"id": node_id, "type": "videoNode", "data": {"videoDataUrl": public_url}}
+            # The saved canvas may still point at the node's previous media, so only add
+            # the new blobs; the next save of the node drops the old ones
+            sync_blob_manifest(db, id, bucket_name, upserted=[node], keep_existing=True)
+        except Exception as e:
+            print(f"Error finalizing upload for node {node_id}: {e}")
+            return jsonify({"error": "Internal Server Error"}), 500
+
+        body = {"publicUrl": public_url, "size": metadata["size"], "contentType": content_type}
+        if "imageVariants" in node["data"]:
+            body["imageVariants"] = node["data"]["imageVariants"]
+        return jsonify(body), 200
+
+
+    if request.method == "POST":
+        return finalize_upload(canvas_id)
+    else:
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@traced("upload_node_images")
 def upload_node_images(nodes, canvas_id, gcs_client, bucket_name):
     """
     For each node with a base64 image, upload to GCS
     and replace with the public URL. Mutates nodes in place.
+    Images also get resized/re-encoded variants (see IMAGE_VARIANTS), recorded
+    as {variant_name: public_url} in the node's data.imageVariants.
+    Uploads run concurrently; a failed upload leaves its node unchanged.
+    Returns the blob paths written, so a save that fails afterwards can discard them.
     Handles:
     - imageNode: base64 in data.imageDataUrl
     - videoNode: base64 in data.videoDataUrl
     - llmText: base64 in data.prompt_response (generated images)
     """
-    for node in nodes:
+    uploads = {}
+    for index, node in enumerate(nodes):
+        node_data = node.get("data", {})
         if node.get("type") == "imageNode":
-            data_url = node.get("data", {}).get("imageDataUrl", "")
+            data_url = node_data.get("imageDataUrl", "")
             if is_base64_data_url(data_url):
                 ext = "png" if "png" in data_url[:30] else "jpg"
                 blob_path = f"canvases/{canvas_id}/{node['id']}.{ext}"
-                try:
-                    public_url = upload_base64_image(
-                        gcs_client, bucket_name, blob_path, data_url
-                    )
-                    node["data"]["imageDataUrl"] = public_url
-                except Exception as e:
-                    print(f"Error uploading image for node {node['id']}: {e}")
+                uploads[(index, "imageDataUrl", "image")] = (upload_base64_image_with_variants, blob_path, data_url)
         elif node.get("type") == "videoNode":
-            data_url = node.get("data", {}).get("videoDataUrl", "")
+            data_url = node_data.get("videoDataUrl", "")
             if is_base64_data_url(data_url):
                 ext = get_video_extension(data_url)
                 blob_path = f"canvases/{canvas_id}/{node['id']}.{ext}"
-                try:
-                    public_url = upload_base64_video(
-                        gcs_client, bucket_name, blob_path, data_url
-                    )
-                    node["data"]["videoDataUrl"] = public_url
-                except Exception as e:
-                    print(f"Error uploading video for node {node['id']}: {e}")
+                uploads[(index, "videoDataUrl", "video")] = (upload_base64_video, blob_path, data_url)
         elif node.get("type") == "llmText":
-            prompt_response = node.get("data", {}).get("prompt_response", "")
+            prompt_response = node_data.get("prompt_response", "")
             if is_base64_data_url(prompt_response):
                 ext = "png" if "png" in prompt_response[:30] else "jpg"
                 blob_path = f"canvases/{canvas_id}/{node['id']}_response.{ext}"
-                try:
-                    public_url = upload_base64_image(
-                        gcs_client, bucket_name, blob_path, prompt_response
-                    )
-                    node["data"]["prompt_response"] = public_url
-                except Exception as e:
-                    print(f"Error uploading generated image for node {node['id']}: {e}")
+                uploads[(index, "prompt_response", "generated image")] = (upload_base64_image_with_variants, blob_path, prompt_response)
+
+    results = upload_data_urls(gcs_client, bucket_name, uploads)
+    uploaded_blob_paths = []
+    for (index, field, label), (result, error) in results.items():
+        node = nodes[index]
+        if error is not None:
+            print(f"Error uploading {label} for node {node['id']}: {error}")
+            continue
+        if field == "videoDataUrl":
+            node["data"][field] = result
+        else:
+            node["data"][field], node["data"]["imageVariants"] = result
+        uploaded_blob_paths.extend(node_blob_paths(node, bucket_name))
+    return uploaded_blob_paths
+
 
+BLOB_MANIFEST_COLLECTION = "canvas_blobs"
 
-def delete_removed_node_images(incoming_nodes, canvas_id, db, gcs_client, bucket_name):
+
+class BlobManifestMissing(Exception):
+    pass
+
+
+@traced("sync_blob_manifest")
+def sync_blob_manifest(db, canvas_id, bucket_name, write_canvas=None, nodes=None, upserted=(), removed_ids=(), legacy_nodes=None, keep_existing=False):
     """
-    Compare incoming nodes with existing nodes in Firestore.
-    Delete GCS blobs for image nodes that were removed.
+    Update a canvas's blob manifest and return the blob paths no longer referenced.
+
+    The manifest lives in the canvas_blobs collection as {"blobs": {node_id: [blob_path]}},
+    so removed media can be found without downloading the canvas document.
+    With nodes, the manifest is rebuilt from the full node list (PUT/POST);
+    otherwise upserted nodes are merged in and removed_ids dropped (PATCH).
+    With keep_existing, upserted nodes' blobs are added to the ones already
+    recorded for them instead of replacing them.
+    write_canvas(transaction) stages the matching canvas write, so the manifest
+    and the canvas it describes are committed together.
+
+    Canvases saved before manifests existed are migrated on their first save
+    by reading the canvas document once.
     """
+    def apply(manifest, transaction):
+        if manifest is not None:
+            old_blobs = manifest.get("blobs", {})
+        elif legacy_nodes is not None:
+            old_blobs = {node_id: node_blob_paths(node, bucket_name) for node_id, node in legacy_nodes.items()}
+        else:
+            raise BlobManifestMissing()
+
+        if nodes is not None:
+            new_blobs = {node["id"]: node_blob_paths(node, bucket_name) for node in nodes}
+        else:
+            new_blobs = {node_id: paths for node_id, paths in old_blobs.items() if node_id not in removed_ids}
+            for node in upserted:
+                paths = node_blob_paths(node, bucket_name)
+                if keep_existing:
+                    paths = sorted(set(new_blobs.get(node["id"], [])) | set(paths))
+                new_blobs[node["id"]] = paths
+        new_blobs = {node_id: paths for node_id, paths in new_blobs.items() if paths}
+
+        if write_canvas is not None:
+            write_canvas(transaction)
+
+        referenced = {path for paths in new_blobs.values() for path in paths}
+        stale = {path for paths in old_blobs.values() for path in paths} - referenced
+        return {"blobs": new_blobs}, sorted(stale)
+
     try:
-        existing_doc = get_document_by_collection_and_id(db, "canvases", canvas_id)
-        existing_nodes = existing_doc.get("nodes", {})
-    except Exception:
-        return
+        return transact_document(db, BLOB_MANIFEST_COLLECTION, canvas_id, apply)
+    except BlobManifestMissing:
+        try:
+            existing_nodes = get_document_by_collection_and_id(db, "canvases", canvas_id).get("nodes", {})
+        except ValueError:
+            existing_nodes = {}
+        return sync_blob_manifest(
+            db, canvas_id, bucket_name, write_canvas, nodes, upserted, removed_ids,
+            legacy_nodes=existing_nodes, keep_existing=keep_existing,
+        )
 
-    incoming_ids = {node["id"] for node in incoming_nodes}
-    blob_paths = []
-    prefix = f"https://storage.googleapis.com/{bucket_name}/"
-    for node_id, node in existing_nodes.items():
-        if node_id not in incoming_ids:
-            if node.get("type") == "imageNode":
-                image_url = node.get("data", {}).get("imageDataUrl", "")
-                if image_url.startswith(prefix):
-                    blob_paths.append(image_url[len(prefix):])
-            elif node.get("type") == "videoNode":
-                video_url = node.get("data", {}).get("videoDataUrl", "")
-                if video_url.startswith(prefix):
-                    blob_paths.append(video_url[len(prefix):])
-            elif node.get("type") == "llmText":
-                prompt_response = node.get("data", {}).get("prompt_response", "")
-                if prompt_response.startswith(prefix):
-                    blob_paths.append(prompt_response[len(prefix):])
 
+@traced("delete_stale_blobs")
+def delete_stale_blobs(gcs_client, bucket_name, blob_paths):
+    """Delete blobs that no node references anymore, logging rather than failing the save."""
     if blob_paths:
         try:
-            delete_blobs(gcs_client, bucket_name, blob_paths)
+            delete_blobs(
+                gcs_client,
+                bucket_name,
+                blob_paths,
+                defer=current_app.config.get("GCS_DEFERRED_DELETES", False),
+            )
         except Exception as e:
             print(f"Error deleting removed node images: {e}")
 
 
+def discard_uploaded_blobs(db, canvas_id, blob_paths):
+    """
+    Delete blobs uploaded by a save that then failed (e.g. a 409), unless the canvas's
+    blob manifest references them: a re-uploaded node overwrites its saved blob in place.
+    Canvases without a manifest yet are left alone, since checking them means reading the canvas.
+    """
+    if not blob_paths:
+        return
+    try:
+        manifest = get_document_by_collection_and_id(db, BLOB_MANIFEST_COLLECTION, canvas_id)
+    except ValueError:
+        return
+    except Exception as e:
+        print(f"Error reading blob manifest for canvas {canvas_id}: {e}")
+        return
+
+    referenced = {path for paths in manifest.get("blobs", {}).values() for path in paths}
+    unreferenced = [path for path in blob_paths if path not in referenced]
+    delete_stale_blobs(current_app.config['GCS'], current_app.config['GCS_BUCKET'], unreferenced)
+
+
+def node_blob_paths(node, bucket_name):
+    """Return the paths of the GCS blobs in bucket_name that a node's media (and its image variants) points to."""
+    prefix = f"https://storage.googleapis.com/{bucket_name}/"
+    node_data = node.get("data", {})
+    if node.get("type") == "imageNode":
+        url = node_data.get("imageDataUrl", "")
+    elif node.get("type") == "videoNode":
+        url = node_data.get("videoDataUrl", "")
+    elif node.get("type") == "llmText":
+        url = node_data.get("prompt_response", "")
+    else:
+        return []
+
+    variants = node_data.get("imageVariants")
+    urls = [url] + (list(variants.values()) if isinstance(variants, dict) else [])
+    return [url[len(prefix):] for url in urls if isinstance(url, str) and url.startswith(prefix)]
+
+
+def canvas_etag(canvas_id, canvas_doc):
+    """ETag for a canvas version, derived from its version counter and updated_at."""
+    updated_at = canvas_doc.get("updated_at")
+    return hash_key(canvas_id, canvas_doc.get("version", 0), updated_at.isoformat() if updated_at else None)[:32]
+
+
+def cache_streamed_canvas(id, etag, chunks, generation):
+    """
+    Pass a streamed canvas body through, caching it like a small one once it has
+    been sent in full (bodies over CANVAS_CACHE_MAX_BYTES are only sent).
+    """
+    sent = []
+    size = 0
+    for chunk in chunks:
+        if sent is not None:
+            size += len(chunk)
+            if size <= CANVAS_CACHE_MAX_BYTES:
+                sent.append(chunk)
+            else:
+                sent = None
+        yield chunk
+    if sent is not None:
+        canvas_cache.set(id, {"etag": etag, "body": b"".join(sent).decode("utf-8")}, generation=generation)
+
+
+def canvas_response(etag, body=None):
+    """JSON response carrying the canvas ETag; without a body (or on a matching If-None-Match) a 304."""
+    if body is None or request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 def transform_nodes_arr_to_map(nodes_arr):
     nodes_map = {}
     for node in nodes_arr:
@@ -259,7 +643,4 @@ def transform_nodes_arr_to_map(nodes_arr):
 
 
 def transform_nodes_map_to_arr(nodes_map):
-    nodes = []
-    for node in nodes_map.values():
-        nodes.append(node)
-    return nodes
+    return list(nodes_map.values())
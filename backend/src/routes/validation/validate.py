@@ -1,6 +1,6 @@
 from flask import request, jsonify
 from functools import wraps
-from typing import Callable, Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional
 
 
 class OptionalField:
@@ -8,20 +8,28 @@ class OptionalField:
         self.field_type = field_type
 
 
-def validate_json(required_fields: Dict[str, Any]):
+class _ErrorLimitReached(Exception):
+    pass
+
+
+def validate_json(required_fields: Dict[str, Any], max_errors: Optional[int] = None):
     """
     Decorator to validate JSON request body against required fields and their types/schemas.
     Supports nested objects and arrays of structured objects.
+
+    The schema is compiled once, when the decorator is applied, into a check that
+    only answers valid/invalid. Error messages are only built for invalid bodies.
+    max_errors caps how many errors are reported (1 = fail fast).
     """
+    validate = compile_validator(required_fields, max_errors=max_errors)
+
     def decorator(f: Callable):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not request.is_json:
                 return jsonify({"error": "Request must be JSON"}), 400
 
-            data = request.get_json()
-            errors = _validate_schema(data, required_fields)
-
+            errors = validate(request.get_json())
             if errors:
                 return jsonify({"errors": errors}), 400
 
@@ -30,7 +38,64 @@ def validate_json(required_fields: Dict[str, Any]):
     return decorator
 
 
-def _validate_schema(data: Any, schema: Any, path: str = "") -> List[str]:
+def compile_validator(schema: Any, max_errors: Optional[int] = None) -> Callable[..., List[str]]:
+    """
+    Compile a schema (same forms as _validate_schema accepts) into
+    validate(data, path="") returning its error messages, empty when data is valid.
+    For validating payloads outside of a request body, e.g. socket events.
+    """
+    is_valid = _compile_schema(schema)
+
+    def validate(data: Any, path: str = "") -> List[str]:
+        if is_valid(data):
+            return []
+        return _validate_schema(data, schema, path, max_errors=max_errors)
+    return validate
+
+
+def _compile_schema(schema: Any) -> Callable[[Any], bool]:
+    """
+    Compile a schema (same forms as _validate_schema accepts) into a predicate.
+    The predicate allocates no paths or error messages; it returns True exactly
+    when _validate_schema would return no errors.
+    """
+    if isinstance(schema, dict):
+        fields = []
+        for field, field_type in schema.items():
+            is_optional = isinstance(field_type, OptionalField)
+            expected_type = field_type.field_type if is_optional else field_type
+            fields.append((field, is_optional, _compile_schema(expected_type)))
+        allowed_fields = frozenset(schema)
+
+        def check_dict(data):
+            if not isinstance(data, dict):
+                return False
+            for field, is_optional, check in fields:
+                if field in data:
+                    if not check(data[field]):
+                        return False
+                elif not is_optional:
+                    return False
+            return allowed_fields.issuperset(data)
+        return check_dict
+
+    if isinstance(schema, list):
+        if len(schema) != 1:
+            return lambda data: False
+        item_schema = schema[0]
+        if isinstance(item_schema, (type, tuple)):
+            # Avoid a function call per element for lists of scalars
+            return lambda data: isinstance(data, list) and all(isinstance(item, item_schema) for item in data)
+        check_item = _compile_schema(item_schema)
+        return lambda data: isinstance(data, list) and all(check_item(item) for item in data)
+
+    if isinstance(schema, (type, tuple)):
+        return lambda data: isinstance(data, schema)
+
+    return lambda data: False
+
+
+def _validate_schema(data: Any, schema: Any, path: str = "", errors: Optional[List[str]] = None, max_errors: Optional[int] = None) -> List[str]:
     """
     Recursively validate data against a schema.
     Schema can be:
@@ -38,12 +103,25 @@ def _validate_schema(data: Any, schema: Any, path: str = "") -> List[str]:
       - a tuple of types (e.g., (str, int))
       - a list with a single schema element (e.g., [dict])
       - a dict defining nested field requirements (e.g., {"name": str, "age": int})
+    Errors are collected into a single list; with max_errors, validation stops
+    once that many errors have been found.
     """
-    errors = []
+    if errors is None:
+        errors = []
+        try:
+            _validate_schema(data, schema, path, errors, max_errors)
+        except _ErrorLimitReached:
+            pass
+        return errors
+
+    def add_error(message):
+        errors.append(message)
+        if max_errors is not None and len(errors) >= max_errors:
+            raise _ErrorLimitReached()
 
     if isinstance(schema, dict):
         if not isinstance(data, dict):
-            errors.append(f"{path or 'root'} must be an object")
+            add_error(f"{path or 'root'} must be an object")
             return errors
 
         for field, field_type in schema.items():
@@ -53,39 +131,39 @@ def _validate_schema(data: Any, schema: Any, path: str = "") -> List[str]:
 
             if field not in data:
                 if not is_optional:
-                    errors.append(f"Missing required field: {field_path}")
+                    add_error(f"Missing required field: {field_path}")
                 continue
 
-            errors += _validate_schema(data[field], expected_type, field_path)
+            _validate_schema(data[field], expected_type, field_path, errors, max_errors)
 
         for field in data:
             if field not in schema:
                 field_path = f"{path}.{field}" if path else field
-                errors.append(f"Invalid field: {field_path}")
+                add_error(f"Invalid field: {field_path}")
 
     elif isinstance(schema, list):
         if not isinstance(data, list):
-            errors.append(f"{path} must be a list")
+            add_error(f"{path} must be a list")
             return errors
 
         if len(schema) != 1:
-            errors.append(f"{path} schema must define a single list element type")
+            add_error(f"{path} schema must define a single list element type")
             return errors
 
         for idx, item in enumerate(data):
             item_path = f"{path}[{idx}]"
-            errors += _validate_schema(item, schema[0], item_path)
+            _validate_schema(item, schema[0], item_path, errors, max_errors)
 
     elif isinstance(schema, tuple):
         if not isinstance(data, schema):
             type_names = " or ".join([t.__name__ for t in schema])
-            errors.append(f"{path} must be of type {type_names}. It is of type {type(data).__name__}.")
+            add_error(f"{path} must be of type {type_names}. It is of type {type(data).__name__}.")
 
     elif isinstance(schema, type):
         if not isinstance(data, schema):
-            errors.append(f"{path} must be of type {schema.__name__}. It is of type {type(data).__name__}.")
+            add_error(f"{path} must be of type {schema.__name__}. It is of type {type(data).__name__}.")
 
     else:
-        errors.append(f"{path} has an unsupported schema definition")
+        add_error(f"{path} has an unsupported schema definition")
 
     return errors
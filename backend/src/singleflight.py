@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+from src.cache import hash_key
+
+
+# Seconds a finished result stays available to identical requests; 0 disables reuse
+COMPLETION_REUSE_WINDOW = float(os.getenv("COMPLETION_REUSE_WINDOW") or "2")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller runs
+    the function and every caller that arrives while it is in flight waits for
+    and receives the same result (or exception).
+    A result for which reusable(result) is true is also handed to identical calls
+    arriving within reuse_window seconds after it finished.
+    Deduplication is per process; calls on other instances run independently.
+    """
+
+    def __init__(self, reuse_window=0.0):
+        self.reuse_window = reuse_window
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "shared": 0, "reused": 0}
+
+    def do(self, key, fn, reusable=lambda result: True):
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and time.monotonic() - call.finished_at > self.reuse_window:
+                del self._calls[key]
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._counters["reused" if call.done.is_set() else "shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                call.finished_at = time.monotonic()
+                keep = call.error is None and self.reuse_window > 0 and reusable(call.result)
+                if not keep and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+            self._prune()
+        return call.result
+
+    def _prune(self):
+        """Drop finished calls whose reuse window has passed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key for key, call in self._calls.items()
+                if call.done.is_set() and now - call.finished_at > self.reuse_window
+            ]
+            for key in expired:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, in_flight=sum(1 for call in self._calls.values() if not call.done.is_set()))
+
+
+completion_flight = SingleFlight(reuse_window=COMPLETION_REUSE_WINDOW)
+
+
+def completion_key(model, prompt, parent_nodes, canvas_id=None):
+    """
+    Canonical key for a completion request: model, prompt and the parents'
+    content (type, text response and media). canvas_id is included when
+    ancestor context is loaded from the canvas.
+    """
+    parent_content = [
+        [
+            node.get("type"),
+            node.get("data", {}).get("prompt_response", ""),
+            node.get("data", {}).get("imageDataUrl", ""),
+            node.get("data", {}).get("videoDataUrl", ""),
+        ]
+        for node in parent_nodes or []
+    ]
+    return hash_key(model, prompt, parent_content, canvas_id)
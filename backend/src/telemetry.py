@@ -0,0 +1,273 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+# With telemetry disabled, span() and traced() are no-ops and nothing is recorded
+TELEMETRY_ENABLED = (os.getenv("TELEMETRY_ENABLED") or "true").lower() == "true"
+
+# Seconds; covers cache hits through slow video and image generation
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_NULL_SPAN = nullcontext()
+# Spans are also exported through OpenTelemetry when the API is installed; without a
+# configured SDK its tracer is a no-op
+_tracer = otel_trace.get_tracer("polylogue") if (otel_trace and TELEMETRY_ENABLED) else None
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+stage_duration = Histogram(
+    "polylogue_stage_duration_seconds",
+    "Duration of request stages; stages named provider.* are upstream calls.",
+    ("stage", "model"),
+)
+stage_errors = Counter(
+    "polylogue_stage_errors_total",
+    "Stages that raised; for provider.* stages these are upstream errors.",
+    ("stage", "model"),
+)
+request_duration = Histogram(
+    "polylogue_http_request_duration_seconds",
+    "HTTP request duration by route.",
+    ("route", "method", "status"),
+)
+payload_bytes = Counter(
+    "polylogue_http_payload_bytes_total",
+    "HTTP request and response body bytes by route.",
+    ("route", "direction"),
+)
+model_tokens = Counter(
+    "polylogue_model_tokens_total",
+    "Model tokens by model; reported usage where available, otherwise estimated.",
+    ("model", "direction"),
+)
+rate_limit_events = Counter(
+    "polylogue_rate_limit_events_total",
+    "Provider rate limiter outcomes: delayed, rejected (overloaded) and upstream_429.",
+    ("provider", "outcome"),
+)
+
+METRICS = [stage_duration, stage_errors, request_duration, payload_bytes, model_tokens, rate_limit_events]
+
+
+def span(name, **attributes):
+    """
+    Time a stage of a request. Records its duration (labelled with attributes["model"]
+    if given) and counts it as an error if it raises; also emits an OpenTelemetry span.
+    """
+    if not TELEMETRY_ENABLED:
+        return _NULL_SPAN
+    return _span(name, attributes)
+
+
+@contextmanager
+def _span(name, attributes):
+    model = attributes.get("model", "")
+    otel_span = _tracer.start_as_current_span(name, attributes=attributes) if _tracer else _NULL_SPAN
+    start = time.perf_counter()
+    try:
+        with otel_span:
+            yield
+    except Exception:
+        stage_errors.inc(stage=name, model=model)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage=name, model=model)
+
+
+def traced(name):
+    """Decorator form of span() for functions whose whole body is one stage."""
+    def decorator(fn):
+        if not TELEMETRY_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_iter(iterable, name, **attributes):
+    """
+    Yield from iterable, timing the whole iteration as one stage (e.g. a token stream).
+    The OpenTelemetry span is not made current, since the generator is resumed
+    from the consumer's context.
+    """
+    if not TELEMETRY_ENABLED:
+        yield from iterable
+        return
+
+    model = attributes.get("model", "")
+    otel_span = _tracer.start_span(name, attributes=attributes) if _tracer else None
+    start = time.perf_counter()
+    try:
+        yield from iterable
+    except Exception:
+        stage_errors.inc(stage=name, model=model)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage=name, model=model)
+        if otel_span is not None:
+            otel_span.end()
+
+
+def record_tokens(model, input_tokens=0, output_tokens=0):
+    if TELEMETRY_ENABLED:
+        model_tokens.inc(input_tokens, model=model, direction="input")
+        model_tokens.inc(output_tokens, model=model, direction="output")
+
+
+def init_app(app):
+    """Record per-route request duration and payload bytes, and serve GET /metrics."""
+    from flask import Response, g, request
+
+    if TELEMETRY_ENABLED:
+        @app.before_request
+        def start_request_timer():
+            g.telemetry_started_at = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            started_at = g.pop("telemetry_started_at", None)
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            if started_at is not None:
+                request_duration.observe(
+                    time.perf_counter() - started_at,
+                    route=route,
+                    method=request.method,
+                    status=response.status_code,
+                )
+            payload_bytes.inc(request.content_length or 0, route=route, direction="request")
+            if not response.is_streamed:
+                payload_bytes.inc(response.calculate_content_length() or 0, route=route, direction="response")
+            return response
+
+    @app.route("/metrics")
+    def metrics():
+        """Prometheus text exposition of request, stage, cache and queue metrics"""
+        return Response(metrics_text(app), mimetype="text/plain; version=0.0.4")
+
+
+def metrics_text(app):
+    from src.cache import cache_stats
+    from src.context_builder import context_stats
+    from src.singleflight import completion_flight
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.exposition())
+
+    lines.append("# HELP polylogue_cache_lookups_total Cache lookups by outcome.")
+    lines.append("# TYPE polylogue_cache_lookups_total counter")
+    for namespace, stats in sorted(cache_stats().items()):
+        for outcome in ["local_hits", "redis_hits", "misses"]:
+            lines.append(f'polylogue_cache_lookups_total{{cache="{namespace}",outcome="{outcome}"}} {stats[outcome]}')
+
+    context = context_stats()
+    lines.append("# HELP polylogue_context_tokens_total Estimated context tokens sent to models.")
+    lines.append("# TYPE polylogue_context_tokens_total counter")
+    lines.append(f"polylogue_context_tokens_total {context['context_tokens_total']}")
+    lines.append("# HELP polylogue_context_entries_total Parent/ancestor context entries by how they were fitted.")
+    lines.append("# TYPE polylogue_context_entries_total counter")
+    for outcome in ["kept", "summarized", "trimmed", "dropped"]:
+        lines.append(f'polylogue_context_entries_total{{outcome="{outcome}"}} {context[f"entries_{outcome}"]}')
+
+    completions = completion_flight.stats()
+    lines.append("# HELP polylogue_completion_requests_total Non-streamed completions by how they were served.")
+    lines.append("# TYPE polylogue_completion_requests_total counter")
+    for outcome in ["shared", "reused"]:
+        lines.append(f'polylogue_completion_requests_total{{outcome="{outcome}"}} {completions[outcome]}')
+    lines.append(f'polylogue_completion_requests_total{{outcome="upstream"}} {completions["calls"] - completions["shared"] - completions["reused"]}')
+
+    jobs = app.config.get("JOBS")
+    if jobs is not None:
+        job_metrics = jobs.metrics()
+        lines.append("# HELP polylogue_jobs_queue_depth Jobs waiting in the queue.")
+        lines.append("# TYPE polylogue_jobs_queue_depth gauge")
+        lines.append(f"polylogue_jobs_queue_depth {job_metrics['queue_depth'] or 0}")
+        lines.append("# HELP polylogue_jobs_running Jobs running on this instance.")
+        lines.append("# TYPE polylogue_jobs_running gauge")
+        lines.append(f"polylogue_jobs_running {job_metrics['running']}")
+        lines.append("# HELP polylogue_jobs_total Jobs completed, failed or rejected on this instance.")
+        lines.append("# TYPE polylogue_jobs_total counter")
+        for status in ["completed", "failed", "rejected"]:
+            lines.append(f'polylogue_jobs_total{{status="{status}"}} {job_metrics[status]}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,5 @@
+import os
+
+# Tests run in plain OS threads without eventlet's monkey-patching, so offloaded
+# calls run directly instead of through eventlet's thread pool
+os.environ.setdefault("SOCKETIO_ASYNC_MODE", "threading")
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import ai_models
+
+GCS = "https://storage.googleapis.com/bucket/canvases/c/"
+VIDEO_URL = GCS + "v.mp4"
+
+
+class FakeGemini:
+    """Gemini client whose cached contents have expired and whose first cache create fails."""
+
+    def __init__(self, cache_failures=0, cache_error=RuntimeError("transient error")):
+        self.cache_failures = cache_failures
+        self.cache_error = cache_error
+        self.cache_creates = 0
+        self.stream_configs = []
+        self.models = SimpleNamespace(generate_content_stream=self.generate_content_stream)
+        self.caches = SimpleNamespace(create=self.create_cache)
+
+    def create_cache(self, **kwargs):
+        self.cache_creates += 1
+        if self.cache_creates <= self.cache_failures:
+            raise self.cache_error
+        return SimpleNamespace(name=f"cachedContents/{self.cache_creates}")
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.stream_configs.append(config)
+
+        def chunks():
+            if config is not None and config.cached_content:
+                raise RuntimeError("cached content not found")
+            yield SimpleNamespace(text="Hello")
+            yield SimpleNamespace(text=" there")
+
+        return chunks()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    gemini = FakeGemini(cache_failures=1)
+    monkeypatch.setattr(ai_models, "GEMINI_CONTEXT_CACHING", True)
+    monkeypatch.setattr(ai_models, "_get_gemini_client", lambda: gemini)
+    ai_models.gemini_context_cache.delete(ai_models._video_context_key([VIDEO_URL]))
+    ai_models.gemini_context_refusals.delete(ai_models._video_context_key([VIDEO_URL]))
+    return gemini
+
+
+def test_failed_cache_creates_are_not_cached(gemini):
+    assert ai_models._cached_video_context(gemini, [VIDEO_URL]) is None
+    assert ai_models._cached_video_context(gemini, [VIDEO_URL]) == "cachedContents/2"
+    assert ai_models._cached_video_context(gemini, [VIDEO_URL]) == "cachedContents/2"
+    assert gemini.cache_creates == 2
+
+
+def test_refused_videos_are_not_sent_to_caches_create_again(gemini):
+    from google.genai import errors
+
+    gemini.cache_failures = 1
+    gemini.cache_error = errors.ClientError(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT", "message": "Cached content is too small"}})
+
+    assert ai_models._cached_video_context(gemini, [VIDEO_URL]) is None
+    assert ai_models._cached_video_context(gemini, [VIDEO_URL]) is None
+    assert gemini.cache_creates == 1
+
+
+def test_stream_falls_back_inline_when_cached_content_fails(gemini):
+    ai_models._cached_video_context(gemini, [VIDEO_URL])
+    ai_models._cached_video_context(gemini, [VIDEO_URL])
+
+    chunks = ai_models._generate_with_video(["question"], [VIDEO_URL], [], stream=True)
+
+    assert [chunk.text for chunk in chunks] == ["Hello", " there"]
+    assert gemini.stream_configs[0].cached_content == "cachedContents/2"
+    assert gemini.stream_configs[1] is None
+    # The dead cached content is forgotten
+    assert ai_models.gemini_context_cache.get(ai_models._video_context_key([VIDEO_URL])) is None
+
+
+def image_node(data_url, variants=None):
+    data = {"imageDataUrl": data_url}
+    if variants is not None:
+        data["imageVariants"] = variants
+    return {"id": "p", "type": "imageNode", "data": data}
+
+
+def test_model_image_url_prefers_the_stored_model_variant():
+    variants = {"model": GCS + "p_model.jpg", "thumb": GCS + "p_thumb.webp"}
+    assert ai_models.model_image_url(image_node(GCS + "p.png", variants)) == GCS + "p_model.jpg"
+    assert ai_models.model_image_url(image_node(GCS + "p.png", {"thumb": GCS + "p_thumb.webp"})) == GCS + "p.png"
+
+
+def test_model_image_url_ignores_variants_of_another_image():
+    stale = {"model": GCS + "p_model.jpg"}
+    assert ai_models.model_image_url(image_node("data:image/png;base64,AAAA", stale)) == "data:image/png;base64,AAAA"
+    assert ai_models.model_image_url(image_node(GCS + "q.png", stale)) == GCS + "q.png"
+    assert ai_models.model_image_url(image_node(GCS + "p.png", {"model": "https://example.com/p.jpg"})) == GCS + "p.png"
+
+
+def test_model_image_url_falls_back_to_the_saved_node_for_the_same_image():
+    saved = {"p": image_node(GCS + "p.png", {"model": GCS + "p_model.jpg"})}
+    assert ai_models.model_image_url(image_node(GCS + "p.png"), saved) == GCS + "p_model.jpg"
+
+    replaced = {"p": image_node(GCS + "old.png", {"model": GCS + "old_model.jpg"})}
+    assert ai_models.model_image_url(image_node(GCS + "p.png"), replaced) == GCS + "p.png"
@@ -0,0 +1,70 @@
+import pytest
+from flask import Flask
+
+from bench.fakes import FakeFirestore
+from src.routes import api
+
+GCS = "https://storage.googleapis.com/bucket/canvases/c/"
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["FIRESTORE"] = FakeFirestore()
+    with app.app_context():
+        yield app
+
+
+def save_canvas(app, nodes):
+    app.config["FIRESTORE"].collection("canvases").document("c").set({"nodes": {node["id"]: node for node in nodes}})
+
+
+def text_node(node_id, parent_ids=(), response=""):
+    return {"id": node_id, "type": "llmText", "data": {"parent_ids": list(parent_ids), "prompt_response": response, "prompt": "unused"}}
+
+
+def test_load_context_nodes_reads_only_the_ancestor_chain(app, monkeypatch):
+    monkeypatch.setattr(api, "CONTEXT_ANCESTOR_DEPTH", 2)
+    save_canvas(app, [
+        text_node("a", response="A"),
+        text_node("b", ["a"], "B"),
+        text_node("c", ["b"], "C"),
+        text_node("unrelated", response="U"),
+    ])
+
+    lookup = api.load_context_nodes("c", [text_node("d", ["c"])])
+
+    assert sorted(lookup) == ["b", "c"]
+    assert lookup["b"] == {"id": "b", "type": "llmText", "data": {"parent_ids": ["a"], "prompt_response": "B"}}
+
+
+def test_load_context_nodes_returns_none_for_a_missing_canvas(app, monkeypatch):
+    monkeypatch.setattr(api, "CONTEXT_ANCESTOR_DEPTH", 2)
+    assert api.load_context_nodes("missing", [text_node("d", ["c"])]) is None
+
+
+def test_load_context_nodes_reads_image_parents_without_ancestor_context(app, monkeypatch):
+    monkeypatch.setattr(api, "CONTEXT_ANCESTOR_DEPTH", 0)
+    variants = {"model": GCS + "p_model.jpg"}
+    save_canvas(app, [{"id": "p", "type": "imageNode", "data": {"imageDataUrl": GCS + "p.png", "imageVariants": variants}}])
+
+    lookup = api.load_context_nodes("c", [{"id": "p", "type": "imageNode", "data": {"imageDataUrl": GCS + "p.png"}}])
+
+    assert lookup["p"]["data"] == {"imageDataUrl": GCS + "p.png", "imageVariants": variants}
+    assert api.load_context_nodes("c", [text_node("d", ["p"])]) is None
+    assert api.load_context_nodes(None, [text_node("d", ["p"])]) is None
+
+
+def test_request_user_ignores_client_supplied_forwarding(app, monkeypatch):
+    headers = {"X-Forwarded-For": "1.1.1.1, 2.2.2.2", "X-Appengine-User-Ip": "3.3.3.3"}
+    environ = {"REMOTE_ADDR": "9.9.9.9"}
+
+    with app.test_request_context(headers=headers, environ_base=environ):
+        assert api.request_user() == "9.9.9.9"
+
+    monkeypatch.setattr(api, "TRUSTED_PROXY_COUNT", 1)
+    with app.test_request_context(headers=headers, environ_base=environ):
+        assert api.request_user() == "2.2.2.2"
+
+    monkeypatch.setattr(api, "TRUSTED_CLIENT_IP_HEADER", "X-Appengine-User-Ip")
+    with app.test_request_context(headers=headers, environ_base=environ):
+        assert api.request_user() == "3.3.3.3"
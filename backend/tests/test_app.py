@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from src.lazy import LazyClient
+
+BACKEND = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["langchain_core", "langchain_together", "together", "google.genai", "google.cloud.firestore", "google.cloud.storage"]
+
+
+def run_python(code):
+    """Run code in a fresh interpreter importing src.app, so module state from other tests doesn't leak in."""
+    env = {
+        **os.environ,
+        "CORS_ORIGIN": "http://localhost:3000",
+        "GCP_PROJECT": "test",
+        "FLASK_ENV": "test",
+        "SOCKETIO_ASYNC_MODE": "threading",
+    }
+    env.pop("REDIS_URL", None)
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_lazy_client_is_created_once_on_first_use():
+    created = []
+
+    def create():
+        time.sleep(0.01)
+        created.append(1)
+        return {"name": "client"}
+
+    client = LazyClient(create)
+    assert created == []
+
+    threads = [threading.Thread(target=lambda: client.get("name")) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert created == [1]
+    assert client.get("name") == "client" and client.resolve() == {"name": "client"}
+
+
+def test_importing_the_app_defers_sdk_imports():
+    loaded = run_python(f"""
+import json, sys
+import src.app
+print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+""")
+    assert loaded == []
+
+
+def test_warmup_creates_clients_and_imports_request_modules():
+    result = run_python("""
+import json, sys
+from bench.fakes import ModelTiming, install_fakes
+from src import ai_models
+from src.app import app
+from src.lazy import LazyClient
+
+install_fakes(app, ModelTiming(latency_ms=0, token_rate=0, response_tokens=1))
+created = []
+for key in ("FIRESTORE", "GCS"):
+    app.config[key] = LazyClient(lambda key=key, client=app.config[key]: created.append(key) or client)
+pools = []
+ai_models.warm_suggestion_pools = lambda: pools.append(True)
+
+status = app.test_client().get("/_ah/warmup").status_code
+modules = [name for name in ("langchain_core.messages", "google.genai.types") if name in sys.modules]
+print(json.dumps({"status": status, "created": created, "pools": len(pools), "modules": modules}))
+""")
+    assert result == {
+        "status": 200,
+        "created": ["FIRESTORE", "GCS"],
+        "pools": 1,
+        "modules": ["langchain_core.messages", "google.genai.types"],
+    }
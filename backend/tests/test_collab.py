@@ -0,0 +1,122 @@
+import base64
+import io
+
+import pytest
+from flask import Flask
+from flask_socketio import SocketIO
+from google.cloud import firestore
+from PIL import Image
+
+from bench.fakes import FakeFirestore, FakeStorageClient, fake_transactional
+from src.routes.collab import register_collab_events
+
+BUCKET = "bucket"
+
+
+def make_node(node_id, **data):
+    return {
+        "id": node_id,
+        "type": data.pop("node_type", "textNode"),
+        "position": {"x": 0, "y": 0},
+        "data": data,
+        "selected": False,
+        "measured": {"width": 100, "height": 50},
+        "origin": [0, 0],
+    }
+
+
+def png_data_url():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    app = Flask(__name__)
+    app.config.update(FIRESTORE=FakeFirestore(), GCS=FakeStorageClient(), GCS_BUCKET=BUCKET, GCS_DEFERRED_DELETES=False)
+    app.config["FIRESTORE"].collection("canvases").document("c").set({"nodes": {"saved": make_node("saved")}, "version": 1})
+    socketio = SocketIO(app, async_mode="threading")
+    hub = register_collab_events(socketio)
+    # Tests flush and persist sessions themselves
+    hub.ensure_worker = lambda: None
+    hub.app = app
+    app.extensions["test_collab"] = (socketio, hub)
+    return app
+
+
+def connect(app, join=True):
+    socketio, _ = app.extensions["test_collab"]
+    client = socketio.test_client(app)
+    if join:
+        assert client.emit("join_canvas", {"canvasId": "c"}, callback=True) == {"canvasId": "c"}
+    return client
+
+
+def send(client, op):
+    return client.emit("canvas_op", {"canvasId": "c", "op": op}, callback=True)
+
+
+def test_ops_require_joining_the_canvas(app):
+    client = connect(app, join=False)
+    assert send(client, {"type": "delete", "nodeId": "saved"}) == {"error": "Join the canvas before sending operations"}
+
+
+@pytest.mark.parametrize("op, error", [
+    ({"type": "add", "nodeId": "n1", "node": {"id": "n1"}}, "Missing required field: op.node.type"),
+    ({"type": "add", "nodeId": "n1", "node": make_node("n2")}, "op.node.id must match op.nodeId"),
+    ({"type": "add", "nodeId": "../n1", "node": make_node("../n1")}, "Invalid op.nodeId"),
+    ({"type": "edit", "nodeId": "saved", "data": {"imageDataUrl": "https://example.com/a.png"}}, "op.data can't change node media; add the node again instead"),
+    ({"type": "edit", "nodeId": "saved", "data": {"prompt_response": "data:image/png;base64,AAAA"}}, "op.data can't change node media; add the node again instead"),
+    ({"type": "edit", "nodeId": "missing", "data": {"text": "hi"}}, "Node missing does not exist"),
+    ({"type": "move", "nodeId": "missing", "position": {"x": 1, "y": 2}}, "Node missing does not exist"),
+])
+def test_invalid_ops_are_rejected(app, op, error):
+    assert send(connect(app), op) == {"error": error}
+
+
+def test_edits_and_moves_apply_to_saved_and_added_nodes(app):
+    _, hub = app.extensions["test_collab"]
+    client = connect(app)
+    assert "seq" in send(client, {"type": "edit", "nodeId": "saved", "data": {"text": "hi"}})
+    assert "seq" in send(client, {"type": "add", "nodeId": "new", "node": make_node("new")})
+    assert send(client, {"type": "move", "nodeId": "new", "position": {"x": 5, "y": 5}}) == {"queued": True}
+    assert "seq" in send(client, {"type": "delete", "nodeId": "new"})
+    assert send(client, {"type": "edit", "nodeId": "new", "data": {"text": "gone"}}) == {"error": "Node new does not exist"}
+
+    hub.persist(hub.session("c"))
+    nodes = app.config["FIRESTORE"].collection("canvases").document("c").get().to_dict()["nodes"]
+    assert nodes == {"saved": make_node("saved", text="hi")}
+
+
+def test_added_media_is_uploaded_and_recorded(app):
+    _, hub = app.extensions["test_collab"]
+    client, other = connect(app), connect(app)
+    other.get_received()
+
+    ack = send(client, {"type": "add", "nodeId": "img", "node": make_node("img", node_type="imageNode", imageDataUrl=png_data_url())})
+
+    public_url = f"https://storage.googleapis.com/{BUCKET}/canvases/c/img.png"
+    assert ack["node"]["data"]["imageDataUrl"] == public_url
+    [event] = other.get_received()
+    assert event["args"][0]["ops"][0]["node"]["data"]["imageDataUrl"] == public_url
+
+    hub.persist(hub.session("c"))
+    manifest = app.config["FIRESTORE"].collection("canvas_blobs").document("c").get().to_dict()
+    assert "canvases/c/img.png" in manifest["blobs"]["img"]
+
+
+def test_coalesced_moves_skip_the_client_that_made_them(app):
+    _, hub = app.extensions["test_collab"]
+    mover, watcher = connect(app), connect(app)
+    mover.get_received()
+    watcher.get_received()
+
+    send(mover, {"type": "move", "nodeId": "saved", "position": {"x": 1, "y": 1}})
+    send(mover, {"type": "move", "nodeId": "saved", "position": {"x": 2, "y": 2}})
+    hub.flush(hub.session("c"))
+
+    assert mover.get_received() == []
+    [event] = watcher.get_received()
+    assert event["args"][0]["ops"] == [{"type": "move", "nodeId": "saved", "position": {"x": 2, "y": 2}}]
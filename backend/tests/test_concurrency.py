@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def run_python(code, async_mode):
+    """Run code in a fresh interpreter, since ASYNC_MODE and monkey-patching are process-wide."""
+    env = {**os.environ, "SOCKETIO_ASYNC_MODE": async_mode}
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_offload_calls_directly_in_threading_mode():
+    result = run_python("""
+import json
+from src import concurrency
+
+def fn(value):
+    return value
+
+print(json.dumps({"mode": concurrency.ASYNC_MODE, "same": concurrency.offload(fn) is fn}))
+""", "threading")
+    assert result == {"mode": "threading", "same": True}
+
+
+def test_offload_runs_in_os_threads_under_eventlet():
+    result = run_python("""
+import json
+from src import concurrency
+concurrency.monkey_patch()
+
+import eventlet
+from eventlet import patcher
+
+real_threading = patcher.original("threading")
+real_time = patcher.original("time")
+
+
+@concurrency.offload
+def blocking(seconds):
+    # Blocks its OS thread without yielding, like a grpc call
+    real_time.sleep(seconds)
+    return real_threading.get_ident()
+
+
+@concurrency.offload
+def nested():
+    return real_threading.get_ident(), blocking(0)
+
+
+@concurrency.offload
+def failing():
+    raise ValueError("bad")
+
+
+ticks = []
+def tick():
+    for _ in range(5):
+        ticks.append(1)
+        eventlet.sleep(0.01)
+
+ticker = eventlet.spawn(tick)
+pool_thread = blocking(0.2)
+ticks_while_blocked = len(ticks)
+ticker.wait()
+outer, inner = nested()
+try:
+    failing()
+    error = None
+except ValueError as e:
+    error = str(e)
+
+print(json.dumps({
+    "offloaded": pool_thread != real_threading.get_ident(),
+    "ticks_while_blocked": ticks_while_blocked,
+    "nested_in_same_thread": outer == inner,
+    "error": error,
+    "name": blocking.__name__,
+}))
+""", "eventlet")
+    assert result == {
+        "offloaded": True,
+        "ticks_while_blocked": 5,
+        "nested_in_same_thread": True,
+        "error": "bad",
+        "name": "blocking",
+    }
+
+
+def test_unknown_async_modes_are_rejected():
+    with pytest.raises(AssertionError, match="Unsupported SOCKETIO_ASYNC_MODE: gevent"):
+        run_python("import src.concurrency", "gevent")
@@ -0,0 +1,78 @@
+from src.context_builder import ContextEntry, collect_ancestors, estimate_tokens, fit_context
+
+
+def node(node_id, parent_ids=(), response=""):
+    return {"id": node_id, "data": {"parent_ids": list(parent_ids), "prompt_response": response}}
+
+
+def test_collect_ancestors_walks_nearest_first_up_to_max_depth():
+    lookup = {
+        "a": node("a"),
+        "b": node("b", ["a"]),
+        "c": node("c", ["b"]),
+        "x": node("x"),
+    }
+    parent = node("d", ["c", "x"])
+
+    ancestors = collect_ancestors([parent], lookup, max_depth=2)
+    assert [(depth, ancestor["id"]) for depth, ancestor in ancestors] == [(1, "c"), (1, "x"), (2, "b")]
+    assert collect_ancestors([parent], lookup, max_depth=0) == []
+    assert collect_ancestors([parent], None, max_depth=2) == []
+
+
+def test_collect_ancestors_skips_parents_repeats_and_missing_nodes():
+    lookup = {"a": node("a", ["b"]), "b": node("b", ["a"]), "shared": node("shared", ["gone"])}
+    parents = [node("p1", ["a", "shared"]), node("p2", ["shared", "p1"])]
+
+    ancestors = collect_ancestors(parents, lookup, max_depth=5)
+    assert [(depth, ancestor["id"]) for depth, ancestor in ancestors] == [(1, "a"), (1, "shared"), (2, "b")]
+
+
+def test_fit_context_keeps_entries_that_fit_in_order():
+    entries = [ContextEntry("Earlier response 1", "old", "n1", 1), ContextEntry("Response 1", "new", "n2", 0)]
+    assert fit_context(entries, budget=100) == ["Earlier response 1: old", "Response 1: new"]
+
+
+def test_fit_context_summarizes_then_trims_then_drops_lowest_priority_first():
+    long_text = "word " * 400
+    summaries = []
+
+    def summarize(text, max_words):
+        # Only the first entry summarized gets a summary
+        summaries.append(text)
+        return "short summary" if len(summaries) == 1 else None
+
+    entries = [
+        ContextEntry("Earlier response 1", long_text, "fit-oldest", 2),
+        ContextEntry("Earlier response 2", long_text, "fit-older", 1),
+        ContextEntry("Response 1", "direct parent", "fit-parent", 0),
+    ]
+    fitted = fit_context(entries, budget=60, summarize=summarize)
+
+    # The direct parent is kept whole, the nearer ancestor summarized and the
+    # oldest trimmed into what is left
+    assert fitted[-1] == "Response 1: direct parent"
+    assert fitted[1] == "Earlier response 2: short summary"
+    assert fitted[0].startswith("Earlier response 1: word") and fitted[0].endswith("…")
+    assert sum(estimate_tokens(line) for line in fitted) <= 60 + len(fitted)
+
+    fitted = fit_context(entries, budget=10, summarize=lambda text, max_words: None)
+    assert fitted == ["Response 1: direct parent"]
+
+
+def test_fit_context_reuses_cached_summaries_and_survives_summarizer_errors():
+    long_text = "token " * 400
+    entry = ContextEntry("Earlier response 1", long_text, "cached-summary-node", 1)
+    fit_context([entry], budget=40, summarize=lambda text, max_words: "cached summary")
+
+    def fail(text, max_words):
+        raise AssertionError("summary should come from the cache")
+
+    assert fit_context([entry], budget=40, summarize=fail) == ["Earlier response 1: cached summary"]
+
+    def broken(text, max_words):
+        raise RuntimeError("model unavailable")
+
+    other = ContextEntry("Earlier response 1", long_text, "uncached-summary-node", 1)
+    [line] = fit_context([other], budget=40, summarize=broken)
+    assert line.endswith("…")
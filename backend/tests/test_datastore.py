@@ -0,0 +1,374 @@
+import base64
+import io
+import json
+
+import pytest
+from flask import Flask
+from google.cloud import firestore
+from PIL import Image
+
+from bench.fakes import FakeFirestore, FakeStorageClient, fake_transactional
+from src.db import storage
+from src.routes import datastore
+from src.routes.datastore import BLOB_MANIFEST_COLLECTION, canvas_cache, ds_routes, node_blob_paths
+
+BUCKET = "bucket"
+GCS = f"https://storage.googleapis.com/{BUCKET}/"
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    app = Flask(__name__)
+    app.config.update(FIRESTORE=FakeFirestore(), GCS=FakeStorageClient(), GCS_BUCKET=BUCKET, GCS_DEFERRED_DELETES=False)
+    app.register_blueprint(ds_routes, url_prefix="/ds")
+    canvas_cache.delete("c")
+    yield app
+    canvas_cache.delete("c")
+
+
+def text_node(node_id, text=""):
+    return {
+        "id": node_id,
+        "type": "textNode",
+        "position": {"x": 0, "y": 0},
+        "data": {"text": text},
+        "selected": False,
+        "measured": {"width": 100, "height": 50},
+        "origin": [0, 0],
+    }
+
+
+def image_node(node_id, url):
+    return {**text_node(node_id), "type": "imageNode", "data": {"imageDataUrl": url}}
+
+
+def png_data_url():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def save_canvas(app, nodes, **fields):
+    """Store canvas c with its blob manifest, and its nodes' blobs in the bucket."""
+    db, bucket = app.config["FIRESTORE"], app.config["GCS"].bucket(BUCKET)
+    document = {"nodes": {node["id"]: node for node in nodes}, "version": 1, **fields}
+    db.collection("canvases").document("c").set(document)
+    blobs = {node["id"]: node_blob_paths(node, BUCKET) for node in nodes}
+    db.collection(BLOB_MANIFEST_COLLECTION).document("c").set({"blobs": {node_id: paths for node_id, paths in blobs.items() if paths}})
+    for paths in blobs.values():
+        for path in paths:
+            bucket.blob(path).upload_from_string(b"saved")
+
+
+def stored(app, collection="canvases"):
+    return app.config["FIRESTORE"].collection(collection).document("c").get().to_dict()
+
+
+def blob_names(app):
+    return sorted(app.config["GCS"].bucket(BUCKET).objects)
+
+
+def test_media_nodes_map_to_their_blob_paths():
+    assert node_blob_paths({"type": "imageNode", "data": {"imageDataUrl": GCS + "canvases/c/a.png"}}, BUCKET) == ["canvases/c/a.png"]
+    assert node_blob_paths({"type": "videoNode", "data": {"videoDataUrl": GCS + "canvases/c/b.mp4"}}, BUCKET) == ["canvases/c/b.mp4"]
+    assert node_blob_paths({"type": "llmText", "data": {"prompt_response": GCS + "canvases/c/d_response.png"}}, BUCKET) == ["canvases/c/d_response.png"]
+
+
+def test_inline_and_foreign_urls_have_no_blob_paths():
+    assert node_blob_paths({"type": "imageNode", "data": {"imageDataUrl": "data:image/png;base64,AAAA"}}, BUCKET) == []
+    assert node_blob_paths({"type": "imageNode", "data": {"imageDataUrl": "https://storage.googleapis.com/other/a.png"}}, BUCKET) == []
+    assert node_blob_paths({"type": "llmText", "data": {"prompt_response": "Just text"}}, BUCKET) == []
+
+
+def test_other_node_types_have_no_blob_paths():
+    assert node_blob_paths({"type": "textNode", "data": {"imageDataUrl": GCS + "canvases/c/a.png"}}, BUCKET) == []
+    assert node_blob_paths({"data": {}}, BUCKET) == []
+
+
+def test_image_variants_are_included():
+    node = {
+        "type": "imageNode",
+        "data": {
+            "imageDataUrl": GCS + "canvases/c/a.png",
+            "imageVariants": {"thumb": GCS + "canvases/c/a_thumb.webp", "model": GCS + "canvases/c/a_model.jpg"},
+        },
+    }
+    assert node_blob_paths(node, BUCKET) == ["canvases/c/a.png", "canvases/c/a_thumb.webp", "canvases/c/a_model.jpg"]
+
+
+def test_streamed_canvases_are_cached_once_sent(app, monkeypatch):
+    monkeypatch.setattr(datastore, "CANVAS_STREAM_THRESHOLD", 1)
+    save_canvas(app, [text_node("a"), text_node("b"), text_node("c")])
+    client = app.test_client()
+
+    response = client.get("/ds/v1/canvases/c")
+    body = response.get_data()
+    assert [node["id"] for node in json.loads(body)["document"]["nodes"]] == ["a", "b", "c"]
+    assert canvas_cache.get("c") == {"etag": response.get_etag()[0], "body": body.decode("utf-8")}
+
+    cached = client.get("/ds/v1/canvases/c")
+    assert cached.get_data() == body
+
+
+def test_streamed_canvases_over_the_size_cap_are_not_cached(app, monkeypatch):
+    monkeypatch.setattr(datastore, "CANVAS_STREAM_THRESHOLD", 1)
+    monkeypatch.setattr(datastore, "CANVAS_CACHE_MAX_BYTES", 100)
+    save_canvas(app, [text_node("a", "x" * 100), text_node("b")])
+
+    response = app.test_client().get("/ds/v1/canvases/c")
+    assert json.loads(response.get_data())["document"]["nodes"][0]["data"]["text"] == "x" * 100
+    assert canvas_cache.get("c") is None
+
+
+def test_streamed_canvases_written_while_sending_are_not_cached():
+    chunks = datastore.cache_streamed_canvas("c", "etag", iter([b'{"document":', b'{}}']), canvas_cache.generation("c"))
+    next(chunks)
+    # A write lands while the body is still being sent
+    canvas_cache.delete("c")
+    assert b"".join(chunks) == b'{}}'
+    assert canvas_cache.get("c") is None
+
+
+def test_patch_writes_only_the_touched_nodes(app):
+    save_canvas(app, [text_node("a", "old"), text_node("b"), text_node("gone")], title="t")
+    canvas_cache.set("c", {"etag": "e", "body": "{}"})
+
+    response = app.test_client().patch("/ds/v1/canvases/c", json={
+        "baseVersion": 1,
+        "title": "new",
+        "added": [text_node("d")],
+        "changed": [text_node("a", "new")],
+        "removed": ["gone"],
+    })
+
+    assert response.status_code == 200 and response.get_json() == {"document_id": "c", "version": 2}
+    document = stored(app)
+    assert document["title"] == "new" and document["version"] == 2
+    assert sorted(document["nodes"]) == ["a", "b", "d"]
+    assert document["nodes"]["a"]["data"]["text"] == "new"
+    assert canvas_cache.get("c") is None
+
+
+def test_patch_against_an_old_version_is_rejected(app):
+    save_canvas(app, [text_node("a")], version=3)
+
+    response = app.test_client().patch("/ds/v1/canvases/c", json={"baseVersion": 2, "removed": ["a"]})
+
+    assert response.status_code == 409 and response.get_json() == {"error": "Stale base version", "version": 3}
+    assert sorted(stored(app)["nodes"]) == ["a"]
+
+
+def test_patch_racing_another_write_is_rejected_and_discards_its_uploads(app, monkeypatch):
+    save_canvas(app, [text_node("a")])
+    upload_node_images = datastore.upload_node_images
+
+    def upload_then_race(*args):
+        uploaded = upload_node_images(*args)
+        assert uploaded
+        # Another save lands between the version check and this write
+        app.config["FIRESTORE"].collection("canvases").document("c").update({"title": "theirs"})
+        return uploaded
+
+    monkeypatch.setattr(datastore, "upload_node_images", upload_then_race)
+    response = app.test_client().patch("/ds/v1/canvases/c", json={"baseVersion": 1, "added": [image_node("img", png_data_url())]})
+
+    assert response.status_code == 409 and response.get_json() == {"error": "Stale base version"}
+    assert sorted(stored(app)["nodes"]) == ["a"] and stored(app)["title"] == "theirs"
+    assert blob_names(app) == []
+    assert stored(app, BLOB_MANIFEST_COLLECTION) == {"blobs": {}}
+
+
+def test_patch_updates_the_manifest_and_deletes_unreferenced_blobs(app):
+    save_canvas(app, [
+        image_node("kept", GCS + "canvases/c/kept.png"),
+        image_node("replaced", GCS + "canvases/c/replaced.png"),
+        image_node("removed", GCS + "canvases/c/removed.png"),
+    ])
+
+    response = app.test_client().patch("/ds/v1/canvases/c", json={
+        "baseVersion": 1,
+        "changed": [image_node("replaced", GCS + "canvases/c/other.png")],
+        "removed": ["removed"],
+    })
+
+    assert response.status_code == 200
+    assert stored(app, BLOB_MANIFEST_COLLECTION) == {"blobs": {
+        "kept": ["canvases/c/kept.png"],
+        "replaced": ["canvases/c/other.png"],
+    }}
+    assert blob_names(app) == ["canvases/c/kept.png"]
+
+
+@pytest.mark.parametrize("method", ["PUT", "PATCH"])
+def test_failed_saves_discard_only_unreferenced_uploads(app, monkeypatch, method):
+    save_canvas(app, [image_node("saved", GCS + "canvases/c/saved.png")])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(datastore, "update_document_fields", fail)
+    # Re-uploading a saved node overwrites its blob in place, so that one is kept
+    nodes = [image_node("saved", png_data_url()), image_node("new", png_data_url())]
+    if method == "PUT":
+        body = {"nodes": nodes}
+    else:
+        body = {"baseVersion": 1, "changed": nodes}
+    response = app.test_client().open("/ds/v1/canvases/c", method=method, json=body)
+
+    assert response.status_code == 500
+    assert blob_names(app) == ["canvases/c/saved.png"]
+    assert stored(app, BLOB_MANIFEST_COLLECTION) == {"blobs": {"saved": ["canvases/c/saved.png"]}}
+
+
+def manifest_blobs(app):
+    return stored(app, BLOB_MANIFEST_COLLECTION)["blobs"]
+
+
+def test_full_saves_rebuild_the_manifest_and_return_stale_blobs(app):
+    save_canvas(app, [image_node("a", GCS + "canvases/c/a.png"), image_node("b", GCS + "canvases/c/b.png")])
+    variants = {"thumb": GCS + "canvases/c/d_thumb.webp"}
+    nodes = [image_node("a", GCS + "canvases/c/a.png"), {**image_node("d", GCS + "canvases/c/d.png"), "data": {"imageDataUrl": GCS + "canvases/c/d.png", "imageVariants": variants}}]
+
+    stale = datastore.sync_blob_manifest(app.config["FIRESTORE"], "c", BUCKET, nodes=nodes)
+
+    assert stale == ["canvases/c/b.png"]
+    assert manifest_blobs(app) == {"a": ["canvases/c/a.png"], "d": ["canvases/c/d.png", "canvases/c/d_thumb.webp"]}
+
+
+def test_incremental_saves_merge_into_the_manifest(app):
+    save_canvas(app, [image_node("a", GCS + "canvases/c/a.png"), image_node("b", GCS + "canvases/c/b.png"), text_node("t")])
+    db = app.config["FIRESTORE"]
+
+    stale = datastore.sync_blob_manifest(db, "c", BUCKET, upserted=[text_node("a")], removed_ids=["t"])
+    assert stale == ["canvases/c/a.png"]
+    assert manifest_blobs(app) == {"b": ["canvases/c/b.png"]}
+
+    # keep_existing adds to a node's recorded blobs instead of replacing them
+    stale = datastore.sync_blob_manifest(db, "c", BUCKET, upserted=[image_node("b", GCS + "canvases/c/b2.png")], keep_existing=True)
+    assert stale == []
+    assert manifest_blobs(app) == {"b": ["canvases/c/b.png", "canvases/c/b2.png"]}
+
+
+def test_canvases_without_a_manifest_are_migrated_from_the_canvas(app):
+    save_canvas(app, [image_node("a", GCS + "canvases/c/a.png"), image_node("b", GCS + "canvases/c/b.png")])
+    db = app.config["FIRESTORE"]
+    del db.documents[(BLOB_MANIFEST_COLLECTION, "c")]
+
+    stale = datastore.sync_blob_manifest(db, "c", BUCKET, removed_ids=["b"])
+
+    assert stale == ["canvases/c/b.png"]
+    assert manifest_blobs(app) == {"a": ["canvases/c/a.png"]}
+
+
+def test_manifest_and_canvas_are_written_together(app):
+    save_canvas(app, [image_node("a", GCS + "canvases/c/a.png")])
+    db = app.config["FIRESTORE"]
+
+    def write_canvas(transaction):
+        datastore.update_document_fields(db, "canvases", "missing", {"title": "t"}, transaction=transaction)
+
+    with pytest.raises(ValueError):
+        datastore.sync_blob_manifest(db, "c", BUCKET, write_canvas, removed_ids=["a"])
+    assert manifest_blobs(app) == {"a": ["canvases/c/a.png"]}
+
+
+def video_node(node_id, url):
+    return {**text_node(node_id), "type": "videoNode", "data": {"videoDataUrl": url}}
+
+
+def store_blob(app, path, content_type, data=b"uploaded"):
+    app.config["GCS"].bucket(BUCKET).blob(path).upload_from_string(data, content_type=content_type)
+
+
+def test_uploads_are_signed_for_the_nodes_path(app, monkeypatch):
+    monkeypatch.setattr(storage, "signing_credentials", lambda: None)
+
+    response = app.test_client().post("/ds/v1/canvases/c/uploads", json={"nodeId": "n-1", "contentType": "video/mp4"})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body["blobPath"] == "canvases/c/n-1.mp4" and body["publicUrl"] == GCS + "canvases/c/n-1.mp4"
+    assert body["uploadUrl"].startswith(GCS + "canvases/c/n-1.mp4?")
+    assert body["headers"] == {"x-goog-resumable": "start", "Content-Type": "video/mp4"}
+
+
+def test_uploads_need_signing_credentials(app, monkeypatch):
+    def unavailable():
+        raise storage.SigningUnavailable("no key")
+
+    monkeypatch.setattr(storage, "signing_credentials", unavailable)
+    response = app.test_client().post("/ds/v1/canvases/c/uploads", json={"nodeId": "n", "contentType": "image/png"})
+    assert response.status_code == 503
+
+
+@pytest.mark.parametrize("node_id", ["", "../other", "a/b", "a.b", "x" * 65])
+def test_uploads_reject_invalid_node_ids(app, monkeypatch, node_id):
+    monkeypatch.setattr(storage, "signing_credentials", lambda: None)
+    client = app.test_client()
+
+    response = client.post("/ds/v1/canvases/c/uploads", json={"nodeId": node_id, "contentType": "image/png"})
+    assert response.status_code == 400 and response.get_json() == {"error": "Invalid nodeId"}
+    response = client.post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": node_id, "blobPath": f"canvases/c/{node_id}.png"})
+    assert response.status_code == 400 and response.get_json() == {"error": "Invalid nodeId"}
+
+
+def test_uploads_reject_unsupported_content_types(app):
+    response = app.test_client().post("/ds/v1/canvases/c/uploads", json={"nodeId": "n", "contentType": "text/html"})
+    assert response.status_code == 400 and response.get_json() == {"error": "Unsupported content type: text/html"}
+
+
+@pytest.mark.parametrize("blob_path", ["canvases/c/other.mp4", "canvases/other/n.mp4", "canvases/c/n.exe", "canvases/c/n_thumb.webp"])
+def test_finalize_rejects_paths_outside_the_node(app, blob_path):
+    store_blob(app, blob_path, "video/mp4")
+
+    response = app.test_client().post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": "n", "blobPath": blob_path})
+
+    assert response.status_code == 400 and response.get_json() == {"error": "blobPath does not belong to this node"}
+    assert blob_names(app) == [blob_path]
+
+
+def test_finalize_needs_the_upload(app):
+    response = app.test_client().post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": "n", "blobPath": "canvases/c/n.mp4"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("content_type, size", [("image/png", 10), ("video/mp4", 101)])
+def test_finalize_deletes_uploads_of_the_wrong_type_or_size(app, monkeypatch, content_type, size):
+    monkeypatch.setattr(datastore, "MEDIA_UPLOAD_MAX_BYTES", 100)
+    store_blob(app, "canvases/c/n.mp4", content_type, b"x" * size)
+
+    response = app.test_client().post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": "n", "blobPath": "canvases/c/n.mp4"})
+
+    assert response.status_code == 400
+    assert blob_names(app) == []
+
+
+def test_finalized_uploads_replace_the_nodes_media_once_saved(app):
+    save_canvas(app, [video_node("n", GCS + "canvases/c/n.webm")])
+    store_blob(app, "canvases/c/n.mp4", "video/mp4")
+    client = app.test_client()
+
+    response = client.post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": "n", "blobPath": "canvases/c/n.mp4"})
+
+    assert response.get_json() == {"publicUrl": GCS + "canvases/c/n.mp4", "size": 8, "contentType": "video/mp4"}
+    # The saved canvas still points at the old video until the node is saved
+    assert manifest_blobs(app) == {"n": ["canvases/c/n.mp4", "canvases/c/n.webm"]}
+    assert blob_names(app) == ["canvases/c/n.mp4", "canvases/c/n.webm"]
+
+    response = client.patch("/ds/v1/canvases/c", json={"baseVersion": 1, "changed": [video_node("n", GCS + "canvases/c/n.mp4")]})
+    assert response.status_code == 200
+    assert manifest_blobs(app) == {"n": ["canvases/c/n.mp4"]}
+    assert blob_names(app) == ["canvases/c/n.mp4"]
+
+
+def test_finalized_images_get_variants(app, monkeypatch):
+    save_canvas(app, [])
+    store_blob(app, "canvases/c/n.png", "image/png")
+    variants = {"thumb": GCS + "canvases/c/n_thumb.webp"}
+    monkeypatch.setattr(datastore, "create_image_variants", lambda *args: variants)
+
+    response = app.test_client().post("/ds/v1/canvases/c/uploads/finalize", json={"nodeId": "n", "blobPath": "canvases/c/n.png"})
+
+    assert response.get_json()["imageVariants"] == variants
+    assert manifest_blobs(app) == {"n": ["canvases/c/n.png", "canvases/c/n_thumb.webp"]}
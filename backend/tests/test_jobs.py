@@ -0,0 +1,96 @@
+import fakeredis
+import pytest
+from flask import Flask
+
+from src.jobs import InMemoryJobStore, JobLimitExceeded, JobQueue, RedisJobStore
+from src.rate_limit import ProviderOverloaded
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    queue = JobQueue(Flask(__name__), RecordingSocketIO(), InMemoryJobStore(), max_per_user=2)
+    # Tests run queued tasks themselves
+    monkeypatch.setattr(queue, "ensure_workers", lambda: None)
+    return queue
+
+
+def run_next(jobs):
+    jobs._execute(jobs.store.dequeue())
+
+
+def test_job_runs_and_publishes_its_result(jobs):
+    jobs.register("echo", lambda payload: {"echo": payload["value"]})
+    job = jobs.submit("echo", {"value": 1}, "user", socket_id="sid")
+    run_next(jobs)
+
+    saved = jobs.get(job["id"])
+    assert saved["status"] == "done" and saved["result"] == {"echo": 1}
+    assert [to for _, _, to in jobs.socketio.emitted] == [f"job:{job['id']}", "sid"]
+    assert "user" not in jobs.socketio.emitted[0][1]
+
+
+def test_failures_are_recorded_without_details(jobs):
+    def bad_input(payload):
+        raise ValueError("bad")
+
+    def overloaded(payload):
+        raise ProviderOverloaded("together", 1)
+
+    jobs.register("bad_input", bad_input)
+    jobs.register("overloaded", overloaded)
+    first = jobs.submit("bad_input", {}, "user")
+    second = jobs.submit("overloaded", {}, "user")
+    run_next(jobs)
+    run_next(jobs)
+
+    assert jobs.get(first["id"])["error"] == "Input Error"
+    assert jobs.get(second["id"])["error"] == "Overloaded"
+
+
+def test_user_slots_are_limited_and_released(jobs):
+    jobs.register("echo", lambda payload: payload)
+    jobs.submit("echo", {}, "user")
+    jobs.submit("echo", {}, "user")
+    with pytest.raises(JobLimitExceeded):
+        jobs.submit("echo", {}, "user")
+    jobs.submit("echo", {}, "someone else")
+
+    run_next(jobs)
+    jobs.submit("echo", {}, "user")
+
+
+def test_slot_is_released_when_the_job_record_expired(jobs):
+    jobs.register("echo", lambda payload: payload)
+    jobs.submit("echo", {}, "user")
+    jobs.submit("echo", {}, "user")
+    jobs.store._jobs.clear()
+
+    run_next(jobs)
+    run_next(jobs)
+    assert jobs.store._active == {}
+
+
+def test_workers_start_at_startup_only_for_a_shared_store(monkeypatch):
+    started = []
+    for store in (InMemoryJobStore(), RedisJobStore(fakeredis.FakeRedis())):
+        queue = JobQueue(Flask(__name__), RecordingSocketIO(), store)
+        monkeypatch.setattr(queue, "ensure_workers", lambda store=store: started.append(store))
+        queue.start()
+    assert [type(store) for store in started] == [RedisJobStore]
+
+
+def test_redis_queue_delivers_at_most_once():
+    store = RedisJobStore(fakeredis.FakeRedis())
+    store.enqueue({"job_id": "j", "kind": "echo"})
+
+    # The task left the queue with the first worker; if that worker dies it is not retried
+    assert store.dequeue() == {"job_id": "j", "kind": "echo"}
+    assert store.queue_depth() == 0
@@ -0,0 +1,74 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from src import json_provider
+from src.json_provider import FastJSONProvider, dumps_bytes, iter_json_document
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+UPDATED_AT = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def canvas(node_count):
+    return {
+        "nodes": [
+            {"id": f"n{index}", "position": Point(index, -index), "data": {1: "int key", 2: "é\n\"quoted\""}}
+            for index in range(node_count)
+        ],
+        "title": "canvas",
+        "updated_at": UPDATED_AT,
+        "version": decimal.Decimal("3"),
+        "owner": uuid.UUID(int=1),
+        "meta": {2: None, 3.5: True},
+    }
+
+
+def items_last(document):
+    """The document as iter_json_document orders it: the items key moved to the end."""
+    return {**{key: value for key, value in document.items() if key != "nodes"}, "nodes": document["nodes"]}
+
+
+@pytest.mark.parametrize("node_count", [0, 1, 2, 5])
+@pytest.mark.parametrize("batch_size", [1, 2, 200])
+def test_streamed_document_matches_orjson(node_count, batch_size):
+    document = canvas(node_count)
+
+    streamed = b"".join(iter_json_document("document", document, "nodes", batch_size=batch_size))
+
+    expected = orjson.dumps(
+        {"document": items_last(document)}, default=json_provider._default, option=json_provider.ORJSON_OPTIONS
+    )
+    assert streamed == expected == dumps_bytes({"document": items_last(document)})
+
+
+def test_streamed_document_matches_the_stdlib_fallback(monkeypatch):
+    document = canvas(3)
+    monkeypatch.setattr(json_provider, "orjson", None)
+
+    streamed = b"".join(iter_json_document("document", document, "nodes", batch_size=2))
+
+    assert streamed == dumps_bytes({"document": items_last(document)})
+
+
+def test_encoding_matches_flasks_default_provider():
+    app = Flask(__name__)
+    document = {"document": canvas(2)}
+
+    expected = json.loads(DefaultJSONProvider(app).dumps(document))
+    assert json.loads(FastJSONProvider(app).dumps(document)) == expected
+    assert json.loads(b"".join(iter_json_document("document", document["document"], "nodes"))) == expected
+    assert expected["document"]["updated_at"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+    assert expected["document"]["meta"] == {"2": None, "3.5": True}
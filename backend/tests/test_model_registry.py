@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from src import model_registry as registry_module
+from src.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    created = []
+
+    def create_fake(config, http_client):
+        created.append(config)
+        return {"config": config, "http_client": http_client}
+
+    monkeypatch.setitem(registry_module.MODEL_FACTORIES, "fake", create_fake)
+    registry = ModelRegistry({"fake-model": {"provider": "fake", "model": "fake/model"}})
+    registry.created = created
+    return registry
+
+
+def test_first_get_creates_the_model_without_deadlocking(registry):
+    # The first get() also creates the shared HTTP client, which takes the registry lock
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(model=registry.get("fake-model")), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive(), "ModelRegistry.get deadlocked"
+    assert result["model"]["http_client"] is registry.http_client()
+
+
+def test_models_are_created_once_and_reused(registry):
+    assert registry.get("fake-model") is registry.get("fake-model")
+    assert len(registry.created) == 1
+
+
+def test_register_replaces_the_cached_model(registry):
+    first = registry.get("fake-model")
+    registry.register("fake-model", {"provider": "fake", "model": "fake/other"})
+    second = registry.get("fake-model")
+    assert second is not first
+    assert second["config"]["model"] == "fake/other"
+
+
+def test_unknown_models_and_providers_are_rejected(registry):
+    with pytest.raises(ValueError):
+        registry.get("missing")
+    registry.register("odd", {"provider": "unknown"})
+    with pytest.raises(ValueError):
+        registry.get("odd")
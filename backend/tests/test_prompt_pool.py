@@ -0,0 +1,73 @@
+import threading
+import time
+
+from src.prompt_pool import SuggestionPool
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.01)
+
+
+def counting_generator():
+    count = iter(range(1000))
+    return lambda: f"suggestion {next(count)}"
+
+
+def test_get_on_empty_pool_returns_none_and_starts_refill():
+    pool = SuggestionPool(counting_generator(), size=4, low_watermark=2)
+    assert pool.get() is None
+    wait_for(lambda: len(pool) == 4)
+
+
+def test_get_pops_in_order_and_refills_below_low_watermark():
+    pool = SuggestionPool(counting_generator(), size=4, low_watermark=2)
+    pool.refill()
+    wait_for(lambda: len(pool) == 4)
+
+    assert pool.get() == "suggestion 0"
+    assert pool.get() == "suggestion 1"
+    assert pool.get() == "suggestion 2"
+    wait_for(lambda: len(pool) == 4)
+    assert pool.get() == "suggestion 3"
+
+
+def test_only_one_refill_runs_at_a_time():
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(threading.current_thread().name)
+        release.wait()
+        return "suggestion"
+
+    pool = SuggestionPool(generate, size=2, low_watermark=1)
+    pool.refill()
+    pool.refill()
+    pool.get()
+    wait_for(lambda: calls)
+    release.set()
+    wait_for(lambda: len(pool) == 2)
+    assert len(set(calls)) == 1
+
+
+def test_refill_stops_on_empty_suggestion_or_error():
+    pool = SuggestionPool(lambda: "", size=4)
+    pool.refill()
+    wait_for(lambda: not pool._refilling)
+    assert len(pool) == 0
+
+    def fail():
+        raise RuntimeError("provider down")
+
+    pool = SuggestionPool(fail, size=4)
+    pool.refill()
+    wait_for(lambda: not pool._refilling)
+    assert len(pool) == 0
+    # A failed refill doesn't block the next one
+    pool._generate = counting_generator()
+    pool.refill()
+    wait_for(lambda: len(pool) == 4)
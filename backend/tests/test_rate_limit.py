@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import rate_limit
+from src.rate_limit import (
+    AdaptiveTokenBucket,
+    ProviderOverloaded,
+    RateLimitedClient,
+    is_rate_limit_error,
+    retry_after_seconds,
+)
+
+
+class FakeClock:
+    """Time stands still while callers sleep, as if they were all waiting concurrently."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    return clock
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+def test_burst_is_free_then_callers_queue_until_max_wait(clock):
+    bucket = AdaptiveTokenBucket("test", rate=2, burst=2, max_wait=1)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+
+    # Waiting callers hold their place in line
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 1.0]
+    with pytest.raises(ProviderOverloaded) as overloaded:
+        bucket.acquire()
+    assert overloaded.value.retry_after == pytest.approx(1.5)
+
+    # Once the waiters have had their turn, the next call goes straight through
+    clock.now += 1.5
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_rate_limit_halves_rate_pauses_and_recovers(clock):
+    bucket = AdaptiveTokenBucket("test", rate=10, burst=10, max_wait=60)
+    assert bucket.record_rate_limited(retry_after=3) == 3
+    assert bucket.rate == 5
+    assert bucket.blocked_until == clock.now + 3
+
+    # Without Retry-After the pause backs off exponentially over consecutive 429s
+    assert bucket.record_rate_limited() == rate_limit.BACKOFF_INITIAL * 2
+    assert bucket.record_rate_limited() == rate_limit.BACKOFF_INITIAL * 4
+    assert bucket.rate == pytest.approx(1.25)
+    for _ in range(10):
+        bucket.record_rate_limited()
+    assert bucket.rate == 10 * rate_limit.RATE_MIN_FRACTION
+    assert bucket.backoff == rate_limit.BACKOFF_MAX
+
+    for _ in range(100):
+        bucket.record_success()
+    assert bucket.rate == 10
+    assert bucket.backoff == rate_limit.BACKOFF_INITIAL
+
+
+def test_call_turns_provider_429s_into_overloaded(clock):
+    bucket = AdaptiveTokenBucket("test", rate=10, burst=10, max_wait=0.5)
+
+    def limited():
+        raise RateLimited(retry_after="2")
+
+    with pytest.raises(ProviderOverloaded) as overloaded:
+        bucket.call(limited)
+    assert overloaded.value.retry_after == 2
+    # Further calls fail fast until the pause is over
+    with pytest.raises(ProviderOverloaded):
+        bucket.call(lambda: "never called")
+    clock.now += 2
+    assert bucket.call(lambda: "ok") == "ok"
+
+    with pytest.raises(KeyError):
+        bucket.call(lambda: {}["missing"])
+
+
+def test_call_stream_handles_429s_raised_while_iterating(clock):
+    bucket = AdaptiveTokenBucket("test", rate=10, burst=10)
+
+    def stream():
+        yield "chunk"
+        raise RateLimited()
+
+    chunks = bucket.call_stream(stream)
+    assert next(chunks) == "chunk"
+    with pytest.raises(ProviderOverloaded):
+        next(chunks)
+
+
+def test_rate_limit_errors_are_recognised_across_sdks():
+    assert is_rate_limit_error(RateLimited())
+    assert is_rate_limit_error(SimpleNamespace(code=429))
+    assert is_rate_limit_error(type("ResourceExhausted", (Exception,), {})())
+    assert not is_rate_limit_error(SimpleNamespace(status_code=500))
+    assert retry_after_seconds(RateLimited(retry_after="1.5")) == 1.5
+    assert retry_after_seconds(RateLimited(retry_after="Wed, 21 Oct 2015 07:28:00 GMT")) is None
+    assert retry_after_seconds(RuntimeError()) is None
+
+
+def test_rate_limited_client_routes_only_listed_methods(clock):
+    calls = []
+    target = SimpleNamespace(
+        images=SimpleNamespace(generate=lambda **kwargs: calls.append(("generate", kwargs)) or "image"),
+        stream=lambda: iter(["a", "b"]),
+        untouched=lambda: "direct",
+    )
+    bucket = AdaptiveTokenBucket("test", rate=10, burst=1, max_wait=0)
+    client = RateLimitedClient(target, bucket, ["images.generate", "stream"], streams=["stream"])
+
+    assert client.untouched() == "direct"
+    assert client.images.generate(prompt="p") == "image"
+    assert calls == [("generate", {"prompt": "p"})]
+    # The burst of one is spent, so the stream is rejected when it starts
+    with pytest.raises(ProviderOverloaded):
+        list(client.stream())
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from src.singleflight import SingleFlight, completion_key
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, target())) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "result"
+
+    threads, results = run_concurrently(5, lambda: flight.do("key", slow))
+    started.wait()
+    while flight.stats()["shared"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 5, "shared": 4, "reused": 0, "in_flight": 0}
+
+
+def test_errors_are_shared_and_not_kept():
+    flight = SingleFlight(reuse_window=60)
+
+    def fail():
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_results_are_reused_within_the_window_only_when_reusable():
+    flight = SingleFlight(reuse_window=60)
+    assert flight.do("key", lambda: "first") == "first"
+    assert flight.do("key", lambda: "second") == "first"
+    assert flight.stats()["reused"] == 1
+
+    assert flight.do("error", lambda: "Error", reusable=lambda result: result != "Error") == "Error"
+    assert flight.do("error", lambda: "ok", reusable=lambda result: result != "Error") == "ok"
+
+
+def test_results_are_not_reused_without_a_window():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: "first") == "first"
+    assert flight.do("key", lambda: "second") == "second"
+
+
+def test_completion_key_depends_on_parent_content_only():
+    parent = {"id": "a", "type": "llmText", "position": {"x": 0, "y": 0}, "data": {"prompt_response": "Hi"}}
+    moved = dict(parent, id="b", position={"x": 5, "y": 5})
+    edited = dict(parent, data={"prompt_response": "Hello"})
+
+    assert completion_key("model", "prompt", [parent]) == completion_key("model", "prompt", [moved])
+    assert completion_key("model", "prompt", [parent]) != completion_key("model", "prompt", [edited])
+    assert completion_key("model", "prompt", [parent]) != completion_key("other", "prompt", [parent])
+    assert completion_key("model", "prompt", [parent], "c1") != completion_key("model", "prompt", [parent], "c2")
@@ -0,0 +1,165 @@
+import base64
+import contextlib
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+
+from src.db import storage
+
+
+class BatchingStorageClient:
+    """
+    Storage client whose deletes inside batch() are sent together on exit. Deletes
+    of missing or `forbidden` blobs fail one by one, like GCS batch sub-requests.
+    """
+
+    def __init__(self, names, forbidden=()):
+        self.objects = set(names)
+        self.forbidden = set(forbidden)
+        self.batches = []
+        self.pending = None
+
+    def bucket(self, name):
+        return SimpleNamespace(blob=lambda path: SimpleNamespace(delete=lambda: self.pending.append(path)))
+
+    @contextlib.contextmanager
+    def batch(self, raise_exception=True):
+        self.pending = []
+        yield
+        requests, self.pending = self.pending, None
+        self.batches.append(requests)
+        failed = [path for path in requests if path in self.forbidden or path not in self.objects]
+        self.objects.difference_update(path for path in requests if path not in failed)
+        if failed and raise_exception:
+            raise RuntimeError(f"Failed deletes: {failed}")
+
+
+def png(width, height, mode="RGB"):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert(mode).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_variants_are_downscaled_and_smaller_than_the_original():
+    source = png(1600, 1200)
+    variants = storage.render_image_variants(source)
+
+    assert {"thumb", "model", "webp"} <= set(variants)
+    for name, max_side in [("thumb", storage.IMAGE_THUMB_MAX_SIDE), ("model", storage.IMAGE_MODEL_MAX_SIDE)]:
+        data = variants[name][0]
+        assert len(data) < len(source)
+        with Image.open(io.BytesIO(data)) as image:
+            assert max(image.size) == max_side
+    assert variants["model"][1:] == ("jpg", "image/jpeg")
+
+
+def test_large_sources_skip_full_size_variants(monkeypatch):
+    monkeypatch.setattr(storage, "IMAGE_VARIANT_FULL_SIZE_MAX_PIXELS", 1000 * 1000)
+    assert set(storage.render_image_variants(png(1200, 1000))) == {"thumb", "model"}
+
+
+def test_sources_over_the_pixel_limit_get_no_variants(monkeypatch):
+    monkeypatch.setattr(storage, "IMAGE_VARIANT_SOURCE_MAX_PIXELS", 1000 * 1000)
+    source = png(1200, 1000)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the source should not be decoded")
+
+    monkeypatch.setattr(Image.Image, "convert", fail)
+    assert storage.render_image_variants(source) == {}
+
+
+@pytest.mark.parametrize("name, extension, expected", [
+    ("thumb", "webp", "canvases/c/n_thumb.webp"),
+    ("model", "jpg", "canvases/c/n_model.jpg"),
+])
+def test_image_variant_blob_path(name, extension, expected):
+    assert storage.image_variant_blob_path("canvases/c/n.png", name, extension) == expected
+
+
+def test_model_media_blob_path_hashes_the_whole_data_url(monkeypatch):
+    monkeypatch.setattr(storage, "HASH_CHUNK_SIZE", 7)
+    data_url = "data:video/mp4;base64," + "QUJD" * 100
+    digest = hashlib.sha256(data_url.encode()).hexdigest()
+    assert storage.model_media_blob_path(data_url) == f"{storage.MODEL_MEDIA_PREFIX}/{digest}.mp4"
+
+
+def payload_reader(payload):
+    data_url = "data:video/mp4;base64," + base64.b64encode(payload).decode("ascii")
+    return storage.Base64PayloadReader(data_url, data_url.index(",") + 1)
+
+
+@pytest.mark.parametrize("length", range(0, 9))
+def test_payload_reader_length_matches_the_decoded_payload(length):
+    # Lengths 0-8 cover payloads padded with no, one and two "="
+    payload = bytes(range(length))
+    reader = payload_reader(payload)
+
+    assert reader.seek(0, io.SEEK_END) == len(payload)
+    reader.seek(0)
+    assert reader.read() == payload and reader.read() == b""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 7, 64])
+def test_payload_reader_reads_across_group_boundaries(chunk_size):
+    payload = bytes(index % 251 for index in range(100))
+    reader = payload_reader(payload)
+
+    chunks = []
+    while chunk := reader.read(chunk_size):
+        assert len(chunk) <= chunk_size
+        chunks.append(chunk)
+    assert b"".join(chunks) == payload and reader.tell() == len(payload)
+
+
+def test_payload_reader_seeks_back_for_retries():
+    payload = bytes(range(50))
+    reader = payload_reader(payload)
+
+    assert reader.read(17) == payload[:17]
+    # A retried resumable upload rewinds the stream
+    assert reader.seek(0) == 0 and reader.read() == payload
+    reader.seek(10)
+    reader.seek(5, io.SEEK_CUR)
+    assert reader.read(4) == payload[15:19]
+    reader.seek(-3, io.SEEK_END)
+    assert reader.read() == payload[-3:]
+
+
+def test_deletes_are_sent_in_batches(monkeypatch):
+    monkeypatch.setattr(storage, "GCS_BATCH_SIZE", 2)
+    client = BatchingStorageClient(["a", "b", "c", "d", "e"])
+
+    storage.delete_blobs(client, "bucket", ["a", "b", "c", "d", "e"])
+
+    assert client.batches == [["a", "b"], ["c", "d"], ["e"]]
+    assert client.objects == set()
+
+
+def test_failed_deletes_in_a_batch_do_not_stop_the_others(monkeypatch):
+    monkeypatch.setattr(storage, "GCS_BATCH_SIZE", 2)
+    client = BatchingStorageClient(["a", "c", "d"], forbidden=["c"])
+
+    # "b" is already gone and "c" can't be deleted
+    storage.delete_blobs(client, "bucket", ["a", "b", "c", "d"])
+
+    assert client.batches == [["a", "b"], ["c", "d"]]
+    assert client.objects == {"c"}
+
+
+def test_deferred_deletes_survive_a_failing_batch():
+    class FailingClient(BatchingStorageClient):
+        def batch(self, raise_exception=True):
+            raise ConnectionError("batch request failed")
+
+    client = BatchingStorageClient(["a"])
+    storage.delete_blobs(FailingClient(["x"]), "bucket", ["x"], defer=True)
+    storage.delete_blobs(client, "bucket", ["a"], defer=True)
+
+    # The worker logs the failed batch and carries on with the next one
+    storage._cleanup_queue.join()
+    assert client.objects == set()
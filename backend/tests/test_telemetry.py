@@ -0,0 +1,104 @@
+import pytest
+from flask import Flask
+
+from src import telemetry
+from src.telemetry import Counter, Histogram, span, stage_duration, stage_errors, traced, traced_iter
+
+pytestmark = pytest.mark.skipif(not telemetry.TELEMETRY_ENABLED, reason="telemetry is disabled")
+
+
+def series(metric):
+    """{line without value: value} for a metric's samples."""
+    samples = {}
+    for line in metric.exposition():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counter_exposition_escapes_label_values():
+    counter = Counter("test_events_total", "Events.", ("kind",))
+    counter.inc(kind='say "hi"\n')
+    counter.inc(2, kind="plain")
+
+    assert counter.exposition() == [
+        "# HELP test_events_total Events.",
+        "# TYPE test_events_total counter",
+        'test_events_total{kind="plain"} 2',
+        'test_events_total{kind="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_histogram_exposition_is_cumulative():
+    histogram = Histogram("test_seconds", "Durations.", ("stage",), buckets=(0.1, 1))
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.observe(value, stage="s")
+
+    assert histogram.exposition()[2:] == [
+        'test_seconds_bucket{stage="s",le="0.1"} 1',
+        'test_seconds_bucket{stage="s",le="1"} 3',
+        'test_seconds_bucket{stage="s",le="+Inf"} 4',
+        'test_seconds_sum{stage="s"} 6.05',
+        'test_seconds_count{stage="s"} 4',
+    ]
+
+
+def test_span_and_traced_record_duration_and_errors():
+    with span("test.span_ok", model="m"):
+        pass
+    with pytest.raises(RuntimeError):
+        with span("test.span_error", model="m"):
+            raise RuntimeError("failed")
+
+    @traced("test.traced")
+    def work():
+        return "done"
+
+    assert work() == "done"
+    durations = series(stage_duration)
+    errors = series(stage_errors)
+    assert durations['polylogue_stage_duration_seconds_count{stage="test.span_ok",model="m"}'] == 1
+    assert durations['polylogue_stage_duration_seconds_count{stage="test.span_error",model="m"}'] == 1
+    assert durations['polylogue_stage_duration_seconds_count{stage="test.traced",model=""}'] == 1
+    assert errors['polylogue_stage_errors_total{stage="test.span_error",model="m"}'] == 1
+    assert 'polylogue_stage_errors_total{stage="test.span_ok",model="m"}' not in errors
+
+
+def test_traced_iter_counts_upstream_errors_but_not_early_close():
+    def failing():
+        yield "chunk"
+        raise RuntimeError("stream broke")
+
+    with pytest.raises(RuntimeError):
+        list(traced_iter(failing(), "test.stream_error", model="m"))
+
+    stream = traced_iter(iter(["a", "b", "c"]), "test.stream_closed", model="m")
+    assert next(stream) == "a"
+    stream.close()
+
+    durations = series(stage_duration)
+    errors = series(stage_errors)
+    assert errors['polylogue_stage_errors_total{stage="test.stream_error",model="m"}'] == 1
+    assert 'polylogue_stage_errors_total{stage="test.stream_closed",model="m"}' not in errors
+    assert durations['polylogue_stage_duration_seconds_count{stage="test.stream_closed",model="m"}'] == 1
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    app = Flask(__name__)
+    telemetry.init_app(app)
+
+    @app.route("/ping")
+    def ping():
+        return "pong"
+
+    client = app.test_client()
+    client.get("/ping")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert 'polylogue_http_request_duration_seconds_count{route="/ping",method="GET",status="200"} 1' in body
+    assert 'polylogue_http_payload_bytes_total{route="/ping",direction="response"} 4' in body
+    assert "# TYPE polylogue_completion_requests_total counter" in body
@@ -124,6 +124,7 @@ export type ExtendedNodeData = {
     prompt_response?: string,
     parent_ids?: Array<string>,
     imageDataUrl?: string,
+    imageVariants?: Record<string, string>,
     videoDataUrl?: string,
     fileName?: string,
     setNode: (nodeId: string, newData: ExtendedNodeData, selected: boolean) => void,
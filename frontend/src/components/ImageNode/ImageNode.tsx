@@ -12,13 +12,14 @@ type ImageNodeProps = {
     selected: boolean
     data: {
         imageDataUrl: string
+        imageVariants?: Record<string, string>
         fileName: string
         canvasId: string
     }
 }
 
 export default function ImageNode({ selected, data }: ImageNodeProps) {
-    const { imageDataUrl, fileName } = data
+    const { imageDataUrl, imageVariants, fileName } = data
     const [isHovered, setIsHovered] = useState(false)
 
     return (
@@ -62,7 +63,7 @@ export default function ImageNode({ selected, data }: ImageNodeProps) {
                 </div>
 
                 <img
-                    src={imageDataUrl}
+                    src={imageVariants?.thumb ?? imageDataUrl}
                     alt={fileName}
                     className="w-full object-contain nodrag cursor-default"
                     style={{ height: imageNodeSize.height - 36 }}